@@ -0,0 +1,327 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the REF615 DOCX processor
+
+Generates synthetic REF615-style reports from a real one, scaled along the
+axes that stress process_docx.py:
+1. Many signature tables (COMPANY tables with images and shading)
+2. Many sections (sectPr blocks that each get a footer and margins)
+3. Long runs of empty paragraphs before the signature table
+4. Large media parts
+
+For every scenario and scale it measures per-stage time, peak traced memory
+and files/sec (single file and batch), reports how time grows with document
+size, and compares the run against a stored baseline. With --reference,
+the process_docx.py of another tree (such as the original script, from
+git show <rev>:REF615/process_docx.py) is timed on the same reports, so a
+change can be measured against that tree rather than the last commit.
+"""
+
+import argparse
+import contextlib
+import importlib.util
+import json
+import math
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+import zipfile
+from pathlib import Path
+
+import process_docx
+from process_docx import (DOCUMENT_PART, DOCUMENT_RELS_PART, NULL_TRACER, Tracer, index_document,
+                          process_docx as run_process, run_batch)
+
+
+DEFAULT_SOURCE = Path(__file__).resolve().parent / 'Final_Reports_Backup' / 'H01.docx'
+# Timings only compare on the machine that recorded them, so the baseline is git-ignored
+DEFAULT_BASELINE = Path(__file__).resolve().parent / 'bench_baseline.json'
+
+# Extra content added per unit of scale, large enough to dominate the fixed per-file cost
+SCENARIOS = {
+    'signature_tables': {'signature_tables': 20},
+    'sections': {'sections': 200},
+    'empty_paragraphs': {'empty_paragraphs': 4000},
+    'media': {'media_bytes': 8 * 1024 * 1024},
+}
+
+# Time growing faster than size ** MAX_GROWTH_EXPONENT is reported as superlinear
+MAX_GROWTH_EXPONENT = 1.5
+
+EMPTY_PARAGRAPH = '<w:p><w:pPr><w:rPr><w:sz w:val="20"/></w:rPr></w:pPr></w:p>'
+
+
+def scale_document(document_xml: str, signature_tables: int = 0, sections: int = 0,
+                   empty_paragraphs: int = 0) -> str:
+    """Insert extra signature tables, sections and empty paragraphs before the last table."""
+    index = index_document(document_xml)
+    tables = index.outermost('tbl')
+    signature = next(index.markup(table) for table in tables if 'COMPANY' in index.markup(table))
+    # The first paragraph carrying a section break (w:pPr/w:sectPr)
+    section = next(index.markup(index.ancestor(sectpr, 'p')) for sectpr in index.select('sectPr')
+                   if sectpr.parent.is_w('pPr'))
+    text = '<w:p><w:r><w:t>Synthetic section</w:t></w:r></w:p>'
+
+    extra = []
+    extra.extend(signature + EMPTY_PARAGRAPH for _ in range(signature_tables))
+    extra.extend(text + section for _ in range(sections))
+    extra.append(EMPTY_PARAGRAPH * empty_paragraphs)
+
+    insert_at = tables[-1].start
+    return document_xml[:insert_at] + ''.join(extra) + document_xml[insert_at:]
+
+
+def generate_report(source: str, output: str, media_bytes: int = 0, **scale) -> int:
+    """
+    Write a scaled copy of source to output.
+
+    Returns:
+        Size of the generated document.xml in characters
+    """
+    rng = random.Random(615)
+    with zipfile.ZipFile(source) as src, zipfile.ZipFile(output, 'w', zipfile.ZIP_DEFLATED) as dst:
+        document_xml = scale_document(src.read(DOCUMENT_PART).decode('utf-8'), **scale)
+        for info in src.infolist():
+            if info.filename == DOCUMENT_PART:
+                dst.writestr(info, document_xml.encode('utf-8'))
+            elif info.filename == DOCUMENT_RELS_PART and media_bytes:
+                rels = src.read(info).decode('utf-8').replace('</Relationships>', (
+                    '<Relationship Id="rIdBench1" Type="http://schemas.openxmlformats.org/officeDocument'
+                    '/2006/relationships/image" Target="media/bench1.png"/></Relationships>'))
+                dst.writestr(info, rels.encode('utf-8'))
+            else:
+                dst.writestr(info, src.read(info))
+        if media_bytes:
+            # Random bytes compress like real image data does: not at all
+            dst.writestr('word/media/bench1.png', rng.randbytes(media_bytes))
+    return len(document_xml)
+
+
+def time_single(path: str, work: str, repeat: int, passes: tuple[str, ...]) -> dict:
+    """
+    Process one file repeat times (from a fresh copy each time).
+
+    Returns the fastest run's per-stage times, plus the peak traced memory
+    of one extra run under tracemalloc.
+    """
+    best = None
+    for _ in range(repeat):
+        shutil.copyfile(path, work)
+        stats = {}
+        tracer = Tracer()
+        start = time.perf_counter()
+        if not run_process(work, stats=stats, passes=passes, tracer=tracer):
+            raise RuntimeError(f"{path}: {stats.get('error')}")
+        total = time.perf_counter() - start
+        if best is None or total < best['total']:
+            stages = {e['name']: e['wall_ns'] / 1e9 for e in tracer.as_dict()['events']}
+            best = {'total': total, 'stages': stages}
+
+    shutil.copyfile(path, work)
+    tracemalloc.start()
+    try:
+        run_process(work, passes=passes, tracer=NULL_TRACER)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    best['peak_bytes'] = peak
+    best['files_per_sec'] = 1 / best['total']
+    return best
+
+
+def load_reference(path: str):
+    """Import the process_docx.py of another tree as a separate module."""
+    spec = importlib.util.spec_from_file_location('reference_process_docx', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def time_reference(module, path: str, work: str, repeat: int) -> float:
+    """
+    Fastest of repeat runs of a reference tree's process_docx(input_path) on
+    a fresh copy, with its output silenced. Every tree has the footer pass;
+    other passes are only run by this tree.
+    """
+    best = None
+    for _ in range(repeat):
+        shutil.copyfile(path, work)
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            start = time.perf_counter()
+            processed = module.process_docx(work)
+            total = time.perf_counter() - start
+        if not processed:
+            raise RuntimeError(f"{path}: the reference process_docx failed")
+        best = total if best is None else min(best, total)
+    return best
+
+
+def time_batch(path: str, workdir: str, files: int, jobs: int, passes: tuple[str, ...]) -> dict:
+    """Process files copies of path as one batch; returns wall time and files/sec."""
+    batch_dir = os.path.join(workdir, f'batch_{jobs}')
+    os.makedirs(batch_dir, exist_ok=True)
+    copies = []
+    for i in range(files):
+        copy = os.path.join(batch_dir, f'H{i:04d}.docx')
+        shutil.copyfile(path, copy)
+        copies.append(copy)
+
+    with open(os.devnull, 'w') as devnull:
+        stdout, sys.stdout = sys.stdout, devnull
+        try:
+            start = time.perf_counter()
+            results = run_batch(copies, jobs=jobs, passes=passes)
+            elapsed = time.perf_counter() - start
+        finally:
+            sys.stdout = stdout
+
+    failed = [r['file'] for r in results if r['status'] != 'ok']
+    if failed:
+        raise RuntimeError(f"batch failed for {', '.join(failed)}")
+    return {'total': elapsed, 'files_per_sec': files / elapsed, 'files': files, 'jobs': jobs}
+
+
+def growth_exponent(points: list[tuple[int, float]], origin: tuple[int, float]) -> float:
+    """
+    Exponent k in added_time ~ added_size**k between the smallest and largest point.
+
+    Both are measured from origin (the unscaled report) so the fixed per-file
+    cost does not hide how the added content scales.
+    """
+    (size_a, time_a), (size_b, time_b) = min(points), max(points)
+    added_a, added_b = size_a - origin[0], size_b - origin[0]
+    cost_a, cost_b = time_a - origin[1], time_b - origin[1]
+    if added_a <= 0 or added_b <= added_a or cost_a <= 0 or cost_b <= 0:
+        return 0.0
+    return math.log(cost_b / cost_a) / math.log(added_b / added_a)
+
+
+def compare_baseline(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    """Describe every measurement that regressed beyond tolerance against baseline."""
+    regressions = []
+    for key, current in results['runs'].items():
+        previous = baseline.get('runs', {}).get(key)
+        if previous and current['total'] > previous['total'] * tolerance:
+            regressions.append(f"{key}: {current['total']:.4f}s vs baseline {previous['total']:.4f}s")
+    for key, current in results['batch'].items():
+        previous = baseline.get('batch', {}).get(key)
+        if previous and current['files_per_sec'] < previous['files_per_sec'] / tolerance:
+            regressions.append(f"batch {key}: {current['files_per_sec']:.1f} files/s "
+                               f"vs baseline {previous['files_per_sec']:.1f}")
+    return regressions
+
+
+def run_benchmarks(source: str, workdir: str, scales: list[int], repeat: int,
+                   batch_files: int, jobs: int, passes: tuple[str, ...], reference=None) -> dict:
+    """Generate every scenario/scale, time it (and the reference module, if given), and time batch mode."""
+    results = {'source': str(source), 'passes': list(passes), 'runs': {}, 'batch': {}, 'growth': {}}
+    work = os.path.join(workdir, 'work.docx')
+
+    plain = os.path.join(workdir, 'plain.docx')
+    shutil.copyfile(source, plain)
+    results['runs']['plain'] = time_single(plain, work, repeat, passes)
+    if reference is not None:
+        results['runs']['plain']['reference'] = time_reference(reference, plain, work, repeat)
+    with zipfile.ZipFile(plain) as zf:
+        plain_chars = len(zf.read(DOCUMENT_PART).decode('utf-8'))
+    plain_total = results['runs']['plain']['total']
+
+    for scenario, unit in SCENARIOS.items():
+        points = []
+        for scale in scales:
+            path = os.path.join(workdir, f'{scenario}_{scale}.docx')
+            size = generate_report(source, path, **{key: value * scale for key, value in unit.items()})
+            run = time_single(path, work, repeat, passes)
+            if reference is not None:
+                run['reference'] = time_reference(reference, path, work, repeat)
+            run['document_chars'] = size
+            run['archive_bytes'] = os.path.getsize(path)
+            results['runs'][f'{scenario}@{scale}'] = run
+            points.append((size if scenario != 'media' else run['archive_bytes'], run['total']))
+        origin = (plain_chars if scenario != 'media' else os.path.getsize(plain), plain_total)
+        results['growth'][scenario] = growth_exponent(points, origin)
+
+    for batch_jobs in sorted({1, jobs}):
+        results['batch'][f'jobs={batch_jobs}'] = time_batch(source, workdir, batch_files, batch_jobs, passes)
+    return results
+
+
+def print_results(results: dict) -> None:
+    print(f"{'run':<24}{'total s':>10}{'files/s':>10}{'peak MiB':>10}  stages")
+    for key, run in results['runs'].items():
+        stages = ', '.join(f'{name}={seconds * 1000:.1f}ms' for name, seconds in run['stages'].items()
+                           if '.' not in name)
+        print(f"{key:<24}{run['total']:>10.4f}{run['files_per_sec']:>10.1f}"
+              f"{run['peak_bytes'] / 1024 / 1024:>10.1f}  {stages}")
+
+    print()
+    for key, batch in results['batch'].items():
+        print(f"batch {key:<18}{batch['total']:>10.4f}{batch['files_per_sec']:>10.1f}  ({batch['files']} files)")
+
+    references = {key: run['reference'] for key, run in results['runs'].items() if 'reference' in run}
+    if references:
+        print(f"\n{'reference':<24}{'total s':>10}{'ratio':>10}  (this tree / reference)")
+    for key, reference in references.items():
+        print(f"{key:<24}{reference:>10.4f}{results['runs'][key]['total'] / reference:>10.2f}")
+
+    print()
+    for scenario, exponent in results['growth'].items():
+        flag = '  SUPERLINEAR' if exponent > MAX_GROWTH_EXPONENT else ''
+        print(f"growth {scenario:<18} time ~ size^{exponent:.2f}{flag}")
+
+
+def main(argv: list[str] = None) -> int:
+    parser = argparse.ArgumentParser(description='Benchmark process_docx.py on synthetic scaled reports.')
+    parser.add_argument('--source', default=str(DEFAULT_SOURCE),
+                        help='Unprocessed report to scale (default: Final_Reports_Backup/H01.docx)')
+    parser.add_argument('--scales', default='1,2,4,8', help='Comma-separated scale factors')
+    parser.add_argument('--repeat', type=int, default=5, help='Timed runs per file (fastest is kept)')
+    parser.add_argument('--batch-files', type=int, default=16, help='Files in the batch-mode run')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count() or 1,
+                        help='Workers for the batch-mode run')
+    parser.add_argument('--passes', default=','.join(process_docx.DEFAULT_PASSES),
+                        help='Comma-separated passes to benchmark')
+    parser.add_argument('--baseline', default=str(DEFAULT_BASELINE), help='Baseline results file')
+    parser.add_argument('--save-baseline', action='store_true', help='Store this run as the baseline')
+    parser.add_argument('--tolerance', type=float, default=1.5,
+                        help='Slowdown factor versus baseline reported as a regression')
+    parser.add_argument('--output', default=None, help='Also write the results as JSON here')
+    parser.add_argument('--reference', default=None,
+                        help="Another tree's process_docx.py to time on the same reports")
+    args = parser.parse_args(argv)
+
+    scales = [int(scale) for scale in args.scales.split(',')]
+    passes = tuple(name.strip() for name in args.passes.split(',') if name.strip())
+
+    with tempfile.TemporaryDirectory(prefix='bench_docx_') as workdir:
+        reference = load_reference(args.reference) if args.reference else None
+        results = run_benchmarks(args.source, workdir, scales, args.repeat, args.batch_files,
+                                 args.jobs, passes, reference)
+    print_results(results)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+
+    failed = any(exponent > MAX_GROWTH_EXPONENT for exponent in results['growth'].values())
+    if args.save_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nBaseline saved to {args.baseline}")
+    elif os.path.exists(args.baseline):
+        with open(args.baseline, encoding='utf-8') as f:
+            regressions = compare_baseline(results, json.load(f), args.tolerance)
+        print(f"\nCompared with baseline {args.baseline}: {len(regressions)} regression(s)")
+        for regression in regressions:
+            print(f"  REGRESSION {regression}")
+        failed = failed or bool(regressions)
+
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,449 @@
+#!/usr/bin/env python3
+"""
+Collect REF615 test results into a SQLite store
+
+Reads the test tables of every report and keeps their values as typed
+rows, one table per test category across all reports:
+- settings:     pickup / drop-off tests of the protection stages
+- timing:       operating times of the protection stages
+- measurement:  current and voltage measurement checks
+- auto_reclose: auto-recloser dead and reclaim times
+plus one row per report in `reports` (the general data: panel,
+designation, serial number, ...).
+
+document.xml is streamed from the archive (see iter_body_children), so a
+report is never held in memory whole; a table is recognized by its header
+row and takes its protection function, ratio or settings from the
+paragraphs above it. Reports are extracted in parallel and the store is
+updated incrementally: a report whose size and mtime are unchanged is not
+opened, and one whose document.xml has the same CRC-32 is not read. A
+changed report has its rows replaced and a report that disappeared has
+them removed, all in one transaction.
+
+Usage:
+    python3 collect_docx.py [INPUT ...] [-d DATABASE] [-j JOBS] [--rebuild]
+    sqlite3 DATABASE "SELECT panel, function, phase, pickup FROM settings JOIN reports USING (report)"
+"""
+
+import argparse
+import html
+import os
+import re
+import sqlite3
+import sys
+import time
+import zipfile
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+from process_docx import DOCUMENT_PART, REPORTS_DIR, W_NS, find_reports, iter_body_children
+
+
+# Bump when the extracted rows change; a store written by another version is rebuilt
+EXTRACTOR_VERSION = 1
+
+DATABASE_FILENAME = 'ref615_results.sqlite'
+
+# Columns of the per-category tables, after (report, row)
+CATEGORIES = {
+    'settings': (('function', 'TEXT'), ('stage', 'TEXT'), ('phase', 'TEXT'), ('set_current', 'REAL'),
+                 ('pickup', 'REAL'), ('drop_off', 'REAL'), ('remarks', 'TEXT')),
+    'timing': (('function', 'TEXT'), ('stage', 'TEXT'), ('curve', 'TEXT'), ('multiple', 'REAL'),
+               ('phase', 'TEXT'), ('calculated', 'REAL'), ('calculated_unit', 'TEXT'),
+               ('measured', 'REAL'), ('measured_unit', 'TEXT')),
+    'measurement': (('quantity', 'TEXT'), ('ratio', 'TEXT'), ('phase', 'TEXT'), ('injected', 'REAL'),
+                    ('injected_unit', 'TEXT'), ('measured', 'REAL'), ('remarks', 'TEXT')),
+    'auto_reclose': (('shots', 'INTEGER'), ('dead_time_setting', 'REAL'), ('reclaim_time_setting', 'REAL'),
+                     ('shot', 'INTEGER'), ('dead_time', 'REAL'), ('reclaim_time', 'REAL'), ('remarks', 'TEXT')),
+}
+
+# General data labels (first table of a report) and their column in `reports`
+GENERAL_FIELDS = {
+    'Location': 'location',
+    'Panel No': 'panel',
+    'Designation': 'designation',
+    'Application': 'application',
+    'Model': 'model',
+    'Serial No.': 'serial_no',
+    'CT Ratio': 'ct_ratio',
+    'Rated Current': 'rated_current',
+}
+
+REPORT_COLUMNS = ('report', 'size', 'mtime_ns', 'document_crc') + tuple(GENERAL_FIELDS.values())
+
+FUNCTION_RE = re.compile(r'\(([A-Z][A-Z0-9]*\d:\d+)\)')
+STAGE_RE = re.compile(r'\b(Low|High|Instantaneous) Stage\b')
+RATIO_RE = re.compile(r'[CV]T Ratio\s*=\s*(.+?)\s*$')
+SHOTS_RE = re.compile(r'No\. of Shots\s*:\s*(\d+)')
+RECLAIM_RE = re.compile(r'Reclaim time\s*:\s*([\d.]+)', re.IGNORECASE)
+DEAD_TIME_RE = re.compile(r'Dead Time\s*:\s*([\d.]+)', re.IGNORECASE)
+MULTIPLE_RE = re.compile(r'@\s*([\d.]+)\s*x')
+UNIT_RE = re.compile(r'\(([^()]*)\)\s*$')
+# The only tags block_text needs: tables, rows, cells, text and tabs or breaks
+TEXT_TAG_RE = re.compile(
+    r'<(?P<close>/)?(?:(?P<prefix>[^\s:/>!?]+):)?(?P<local>tbl|tr|tc|t|tab|br)(?=[\s/>])'
+    r'(?:[^>"\']|"[^"]*"|\'[^\']*\')*?(?P<empty>/)?>')
+NUMBER_RE = re.compile(r'[-+]?(?:\d+\.?\d*|\.\d+)')
+
+UNITS = {'sec': 's', 'secs': 's', 'msec': 'ms', 'msecs': 'ms', 'a': 'A', 'kv': 'kV', 'v': 'V'}
+
+
+def _number(text: str) -> float | None:
+    """The leading number of a cell ('7. 00' -> 7.0, '15.4 ms' -> 15.4), or None."""
+    m = NUMBER_RE.match(text.replace(' ', ''))
+    return float(m.group()) if m else None
+
+
+def _unit(label: str) -> str | None:
+    """The unit in parentheses at the end of a header cell, normalized."""
+    m = UNIT_RE.search(label)
+    if m is None:
+        return None
+    return UNITS.get(m.group(1).strip().lower(), m.group(1).strip())
+
+
+def _search(regex: re.Pattern, lines: list[str]) -> str | None:
+    """The first group of regex in the last line it matches."""
+    for line in reversed(lines):
+        m = regex.search(line)
+        if m:
+            return m.group(1)
+    return None
+
+
+def block_text(markup: str, ns: dict[str, str]) -> list[list[list[str]]] | str:
+    """
+    The text of a body child: a paragraph's text, or a table as rows of cell texts.
+
+    Only the rows and cells of the table itself are split; a nested table
+    is part of the text of its cell. w:tab and w:br count as a space.
+    """
+    w_prefixes = {prefix for prefix, uri in ns.items() if uri == W_NS}
+    rows = []
+    chars = []
+    depth = 0           # open w:tbl elements
+    in_text = False
+    pos = 0
+    for m in TEXT_TAG_RE.finditer(markup):
+        if in_text:
+            chars.append(markup[pos:m.start()])
+        pos = m.end()
+        prefix, local = m.group('prefix', 'local')
+        if (prefix or '') not in w_prefixes:
+            continue
+        if m.group('close'):
+            if local == 't':
+                in_text = False
+            elif local == 'tbl':
+                depth -= 1
+            elif local == 'tc' and depth == 1:
+                rows[-1].append(html.unescape(''.join(chars)).strip())
+            continue
+        if local == 't' and not m.group('empty'):
+            in_text = True
+        elif local in ('tab', 'br'):
+            chars.append(' ')
+        elif local == 'tbl':
+            depth += 1
+        elif depth == 1 and local == 'tr':
+            rows.append([])
+        elif depth == 1 and local == 'tc':
+            chars = []
+    if depth or rows:
+        return rows
+    return html.unescape(''.join(chars)).strip()
+
+
+class _Extractor:
+    """Typed records from the tables of one report, read in document order."""
+
+    def __init__(self):
+        self.report = {}
+        self.records = {category: [] for category in CATEGORIES}
+        self.lines = []             # paragraph text since the last table
+        self.function = None        # protection function of the last stage heading
+        self.stage = None
+
+    def paragraph(self, text: str) -> None:
+        if text:
+            self.lines.append(text)
+
+    def table(self, rows: list[list[str]]) -> None:
+        lines, self.lines = self.lines, []
+        rows = [row for row in rows if any(row)]
+        if not rows:
+            return
+        function = _search(FUNCTION_RE, lines)
+        if function is not None:
+            # A table without a heading of its own continues the last stage
+            self.function, self.stage = function, _search(STAGE_RE, lines)
+        header = rows[0]
+        if header[0] in GENERAL_FIELDS:
+            self._general(rows)
+        elif any(cell.startswith('Pickup') for cell in header):
+            self._settings(header, rows[1:])
+        elif header[0] == 'Curve Description':
+            self._timing(header, rows[1:])
+        elif any(cell.startswith('Injected') for cell in header):
+            self._measurement(header, rows[1:], lines)
+        elif any('Dead Time' in cell for cell in header):
+            self._auto_reclose(rows[1:], lines)
+
+    def _general(self, rows: list[list[str]]) -> None:
+        for row in rows:
+            for label, value in zip(row[::2], row[1::2]):
+                column = GENERAL_FIELDS.get(label.rstrip(':').strip())
+                if column is not None:
+                    self.report[column] = value.lstrip(':').strip() or None
+
+    def _settings(self, header: list[str], rows: list[list[str]]) -> None:
+        phased = header[0] == 'Phase'
+        set_current = None
+        for row in rows:
+            cells = row if phased else ['N'] + row
+            if len(cells) < 5:
+                continue
+            set_current = _number(cells[1]) if cells[1] else set_current
+            self.records['settings'].append((self.function, self.stage, cells[0], set_current,
+                                             _number(cells[2]), _number(cells[3]), cells[4] or None))
+
+    def _timing(self, header: list[str], rows: list[list[str]]) -> None:
+        multiple = calculated_unit = None
+        curve = calculated = None
+        measured_unit = _unit(header[-1])
+        for row in rows:
+            if len(row) < 4:
+                continue
+            if not row[0] and row[1].startswith('@'):
+                # '@ 2 x Is (Sec)': the test point and the unit of the calculated time
+                m = MULTIPLE_RE.search(row[1])
+                multiple = float(m.group(1)) if m else None
+                calculated_unit = _unit(row[1])
+                continue
+            curve = row[0] or curve
+            calculated = _number(row[1]) if row[1] else calculated
+            self.records['timing'].append((self.function, self.stage, curve, multiple, row[2] or None,
+                                           calculated, calculated_unit, _number(row[3]), measured_unit))
+
+    def _measurement(self, header: list[str], rows: list[list[str]], lines: list[str]) -> None:
+        injected = next(cell for cell in header if cell.startswith('Injected'))
+        quantity = injected.split()[1].lower() if len(injected.split()) > 1 else None
+        ratio = _search(RATIO_RE, lines)
+        for row in rows:
+            if len(row) < 4:
+                continue
+            self.records['measurement'].append((quantity, ratio, row[0], _number(row[1]), _unit(injected),
+                                                _number(row[2]), row[3] or None))
+
+    def _auto_reclose(self, rows: list[list[str]], lines: list[str]) -> None:
+        shots = _search(SHOTS_RE, lines)
+        dead_time, reclaim_time = _search(DEAD_TIME_RE, lines), _search(RECLAIM_RE, lines)
+        for row in rows:
+            if len(row) < 4:
+                continue
+            shot = _number(row[0])
+            self.records['auto_reclose'].append((
+                int(shots) if shots else None, _number(dead_time or ''), _number(reclaim_time or ''),
+                int(shot) if shot is not None else None, _number(row[1]), _number(row[2]), row[3] or None))
+
+
+def extract_report(input_path: str) -> dict:
+    """
+    Extract the test results of one report.
+
+    Returns a plain-data result (safe to return from a worker process) with
+    'status' extracted/failed, the report's stat and document.xml CRC-32,
+    its general data under 'report' and the rows per category under
+    'records'.
+    """
+    result = {'file': input_path, 'status': 'failed', 'error': None}
+    start = time.perf_counter()
+    try:
+        st = os.stat(input_path)
+        with zipfile.ZipFile(input_path) as source:
+            crc = source.getinfo(DOCUMENT_PART).CRC
+            extractor = _Extractor()
+            with source.open(DOCUMENT_PART) as stream:
+                for local, markup, ns in iter_body_children(stream):
+                    if local == 'tbl':
+                        extractor.table(block_text(markup, ns))
+                    elif local == 'p':
+                        extractor.paragraph(block_text(markup, ns))
+        result.update(status='extracted', size=st.st_size, mtime_ns=st.st_mtime_ns, document_crc=crc,
+                      report=extractor.report, records=extractor.records)
+    except Exception as e:
+        result['error'] = f'{type(e).__name__}: {e}'
+    result['time'] = round(time.perf_counter() - start, 6)
+    return result
+
+
+class ResultStore:
+    """
+    The SQLite store: `reports` plus one table per category, keyed by report path.
+
+    A store written by another EXTRACTOR_VERSION is emptied on open, so
+    every report is extracted again.
+    """
+
+    def __init__(self, path: str, rebuild: bool = False):
+        self.path = path
+        self.db = sqlite3.connect(path)
+        self.db.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)')
+        row = self.db.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+        if rebuild or row is None or row[0] != str(EXTRACTOR_VERSION):
+            for table in ('reports', *CATEGORIES):
+                self.db.execute(f'DROP TABLE IF EXISTS {table}')
+            self.db.execute("INSERT OR REPLACE INTO meta VALUES ('version', ?)", (str(EXTRACTOR_VERSION),))
+        columns = ', '.join(f'{name} {"INTEGER" if name in ("size", "mtime_ns", "document_crc") else "TEXT"}'
+                            for name in REPORT_COLUMNS[1:])
+        self.db.execute(f'CREATE TABLE IF NOT EXISTS reports (report TEXT PRIMARY KEY, {columns})')
+        for category, fields in CATEGORIES.items():
+            columns = ', '.join(f'{name} {kind}' for name, kind in fields)
+            self.db.execute(f'CREATE TABLE IF NOT EXISTS {category} '
+                            f'(report TEXT NOT NULL, row INTEGER NOT NULL, {columns}, PRIMARY KEY (report, row))')
+        self.db.commit()
+
+    def close(self) -> None:
+        self.db.close()
+
+    def known(self) -> dict[str, tuple[int, int, int]]:
+        """{report path: (size, mtime_ns, document CRC-32)} of every stored report."""
+        return {report: (size, mtime_ns, crc) for report, size, mtime_ns, crc
+                in self.db.execute('SELECT report, size, mtime_ns, document_crc FROM reports')}
+
+    def touch(self, report: str, size: int, mtime_ns: int) -> None:
+        """Record a new stat for a report whose content is unchanged."""
+        self.db.execute('UPDATE reports SET size = ?, mtime_ns = ? WHERE report = ?', (size, mtime_ns, report))
+
+    def remove(self, report: str) -> None:
+        for table in ('reports', *CATEGORIES):
+            self.db.execute(f'DELETE FROM {table} WHERE report = ?', (report,))
+
+    def replace(self, report: str, result: dict) -> None:
+        """Replace every row of a report with an extract_report result."""
+        self.remove(report)
+        values = {'report': report, 'size': result['size'], 'mtime_ns': result['mtime_ns'],
+                  'document_crc': result['document_crc'], **result['report']}
+        self.db.execute(f"INSERT INTO reports VALUES ({', '.join('?' * len(REPORT_COLUMNS))})",
+                        [values.get(column) for column in REPORT_COLUMNS])
+        for category, rows in result['records'].items():
+            placeholders = ', '.join('?' * (len(CATEGORIES[category]) + 2))
+            self.db.executemany(f'INSERT INTO {category} VALUES ({placeholders})',
+                                [(report, i, *row) for i, row in enumerate(rows, 1)])
+
+    def commit(self) -> None:
+        self.db.commit()
+
+
+def _document_crc(path: str) -> int | None:
+    try:
+        with zipfile.ZipFile(path) as source:
+            return source.getinfo(DOCUMENT_PART).CRC
+    except (OSError, KeyError, zipfile.BadZipFile):
+        return None
+
+
+def update_store(store: ResultStore, files: list[str], jobs: int = None) -> list[dict]:
+    """
+    Bring the store up to date with files, extracting only what changed.
+
+    Reports in the store that no longer exist on disk are removed.
+
+    Returns:
+        One result per file and per removed report, with 'status'
+        extracted/unchanged/removed/failed; extracted results carry the
+        row counts per category in 'rows'
+    """
+    known = store.known()
+    results = {}
+    changed = []
+    for path in files:
+        report = os.path.abspath(path)
+        stored = known.get(report)
+        try:
+            st = os.stat(path)
+        except FileNotFoundError as e:
+            # Gone since it was listed: a stored report is removed, a new one fails
+            if stored is not None:
+                store.remove(report)
+                results[report] = {'file': path, 'status': 'removed', 'error': None}
+            else:
+                results[report] = {'file': path, 'status': 'failed', 'error': f'{type(e).__name__}: {e}'}
+            continue
+        if stored is not None and stored[:2] == (st.st_size, st.st_mtime_ns):
+            results[report] = {'file': path, 'status': 'unchanged', 'error': None}
+        elif stored is not None and _document_crc(path) == stored[2]:
+            store.touch(report, st.st_size, st.st_mtime_ns)
+            results[report] = {'file': path, 'status': 'unchanged', 'error': None}
+        else:
+            changed.append(path)
+
+    jobs = jobs or os.cpu_count() or 1
+    if jobs == 1 or len(changed) <= 1:
+        extracted = map(extract_report, changed)
+    else:
+        pool = ProcessPoolExecutor(max_workers=min(jobs, len(changed)))
+        extracted = pool.map(extract_report, changed)
+    try:
+        for result in extracted:
+            report = os.path.abspath(result['file'])
+            if result['status'] == 'extracted':
+                store.replace(report, result)
+                result['rows'] = {category: len(rows) for category, rows in result.pop('records').items()}
+            results[report] = result
+    finally:
+        if jobs != 1 and len(changed) > 1:
+            pool.shutdown()
+
+    removed = [{'file': report, 'status': 'removed', 'error': None}
+               for report in known if report not in results and not os.path.exists(report)]
+    for result in removed:
+        store.remove(result['file'])
+    store.commit()
+    return [results[os.path.abspath(path)] for path in files] + removed
+
+
+def main(argv: list[str] = None) -> int:
+    parser = argparse.ArgumentParser(description='Collect REF615 test results into a SQLite store.')
+    parser.add_argument('inputs', nargs='*', default=[str(REPORTS_DIR)],
+                        help='Reports, directories of H*.docx reports or glob patterns')
+    parser.add_argument('-d', '--database', default=None,
+                        help=f'SQLite store (default: {DATABASE_FILENAME} in the first input directory)')
+    parser.add_argument('-j', '--jobs', type=int, default=None, help='Worker processes (default: CPU count)')
+    parser.add_argument('--rebuild', action='store_true', help='Extract every report again')
+    args = parser.parse_args(argv)
+
+    try:
+        files = find_reports(args.inputs)
+    except FileNotFoundError as e:
+        print(f"Error: {e}")
+        return 1
+    database = args.database
+    if database is None:
+        first = args.inputs[0]
+        database = os.path.join(first if os.path.isdir(first) else os.path.dirname(files[0]) if files else '.',
+                                DATABASE_FILENAME)
+
+    start = time.perf_counter()
+    store = ResultStore(database, args.rebuild)
+    try:
+        results = update_store(store, files, args.jobs)
+    finally:
+        store.close()
+    elapsed = time.perf_counter() - start
+
+    for r in results:
+        if r['status'] == 'extracted':
+            print(f"  [EXTRACTED] {os.path.basename(r['file'])}: "
+                  + ', '.join(f'{n} {category}' for category, n in r['rows'].items()))
+        elif r['status'] != 'unchanged':
+            print(f"  [{r['status'].upper()}] {r['file']}" + (f": {r['error']}" if r['error'] else ''))
+    counts = Counter(r['status'] for r in results)
+    print(f"\n{len(results)} reports in {elapsed:.3f}s: "
+          + ', '.join(f'{counts[status]} {status}' for status in ('extracted', 'unchanged', 'removed', 'failed')))
+    print(f"Store: {database}")
+    return 1 if counts['failed'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+"""
+Structural diff of processed REF615 reports against their backups
+
+Pairs every H*.docx in the processed directory with the file of the same
+name in the backup directory (or with a *.docx<suffix> backup such as
+H01.docx.settings_bak) and compares them part by part:
+1. Parts whose CRC-32 and size match in both central directories are
+   identical and are never decompressed
+2. Differing XML parts are compared block by block: the children of
+   w:body in document.xml, of the root element in every other part
+   (header paragraphs and tables, relationships, styles, ...). Blocks are
+   aligned in order, so blocks that were added, removed, changed in place
+   or moved are reported, each with a preview of its text; rsid and
+   paragraph-id attributes are ignored
+3. Other differing parts (media) are reported by size
+
+Parts are read with the streaming reader of process_docx (see
+iter_body_children). Files are compared in parallel and summarized in
+one table.
+
+Usage:
+    python3 diff_docx.py [REPORTS_DIR] [BACKUP_DIR] [--suffix .settings_bak] [-j JOBS] [--details] [--json FILE]
+"""
+
+import argparse
+import difflib
+import html
+import io
+import json
+import os
+import re
+import sys
+import time
+import zipfile
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+from process_docx import DOCUMENT_PART, HEADER_NOISE_RE, REPORTS_DIR, iter_body_children, iter_root_children
+
+
+# Changes listed per part with --details
+DETAIL_LIMIT = 10
+
+# Characters of a block's text shown for a change
+PREVIEW_LENGTH = 60
+
+# w:t runs of text, whatever the prefix
+TEXT_RE = re.compile(r'<(?:[\w.\-]+:)?t(?:\s[^>]*)?>([^<]*)</(?:[\w.\-]+:)?t>')
+
+
+def _blocks(name: str, data: bytes) -> list[tuple[str, str]]:
+    """(local name, markup without revision noise) of every block of an XML part."""
+    children = iter_body_children if name == DOCUMENT_PART else iter_root_children
+    return [(local, HEADER_NOISE_RE.sub('', markup)) for local, markup, _ in children(io.BytesIO(data))]
+
+
+def _preview(markup: str) -> str:
+    """The text of a block, or its start tag if it has none, shortened to PREVIEW_LENGTH."""
+    text = html.unescape(''.join(TEXT_RE.findall(markup))).strip() or markup[:markup.find('>') + 1]
+    return text if len(text) <= PREVIEW_LENGTH else text[:PREVIEW_LENGTH - 3] + '...'
+
+
+def _change(old: str, new: str) -> tuple[str, str]:
+    """Previews of a block edited in place; the markup from the first difference if the text is the same."""
+    before, after = _preview(old), _preview(new)
+    if before != after:
+        return before, after
+    start = next((i for i, (a, b) in enumerate(zip(old, new)) if a != b), min(len(old), len(new)))
+    start = old.rfind('<', 0, start + 1)
+    return old[start:start + PREVIEW_LENGTH], new[start:start + PREVIEW_LENGTH]
+
+
+def diff_part(name: str, old: bytes, new: bytes) -> dict:
+    """
+    Structural diff of one XML part, block by block and in order.
+
+    Returns:
+        {'blocks': [old count, new count], 'same': blocks unchanged,
+         'added': [[kind, new index, preview]],
+         'removed': [[kind, old index, preview]],
+         'changed': [[kind, old index, new index, old preview, new preview]],
+         'moved': [[kind, old index, new index, preview]]}; kind is the
+        block's local name (p, tbl, sectPr, Relationship, ...)
+    """
+    before, after = _blocks(name, old), _blocks(name, new)
+    matcher = difflib.SequenceMatcher(None, [key for _, key in before], [key for _, key in after], autojunk=False)
+    same = 0
+    added, removed, changed = [], [], []
+    for op, i1, i2, j1, j2 in matcher.get_opcodes():
+        if op == 'equal':
+            same += i2 - i1
+            continue
+        pairs = list(zip(range(i1, i2), range(j1, j2)))
+        if op == 'replace' and i2 - i1 == j2 - j1 and all(before[i][0] == after[j][0] for i, j in pairs):
+            # Edited in place
+            changed.extend([before[i][0], i, j, *_change(before[i][1], after[j][1])] for i, j in pairs)
+            continue
+        removed.extend([before[i][0], i, _preview(before[i][1])] for i in range(i1, i2))
+        added.extend([after[j][0], j, _preview(after[j][1])] for j in range(j1, j2))
+
+    # A block removed in one place and added unchanged in another has moved
+    added_by_key = {}
+    for entry in added:
+        added_by_key.setdefault(after[entry[1]][1], []).append(entry)
+    moved, still_removed = [], []
+    for entry in removed:
+        candidates = added_by_key.get(before[entry[1]][1])
+        if candidates:
+            target = candidates.pop(0)
+            moved.append([entry[0], entry[1], target[1], entry[2]])
+            added.remove(target)
+        else:
+            still_removed.append(entry)
+    return {'blocks': [len(before), len(after)], 'same': same, 'added': added, 'removed': still_removed,
+            'changed': changed, 'moved': moved}
+
+
+def diff_report(new_path: str, old_path: str) -> dict:
+    """
+    Compare a processed report with its backup, part by part.
+
+    Returns a plain-data result (safe to return from a worker process) with
+    'status' identical/changed/missing/failed, part counts and a diff per
+    differing part.
+    """
+    result = {'file': new_path, 'backup': old_path, 'status': 'failed', 'error': None,
+              'same': 0, 'changed': [], 'added': [], 'removed': [], 'parts': {}}
+    start = time.perf_counter()
+    if not os.path.exists(old_path):
+        result['status'] = 'missing'
+        return result
+    try:
+        with zipfile.ZipFile(new_path) as new_zip, zipfile.ZipFile(old_path) as old_zip:
+            new_infos, old_infos = new_zip.NameToInfo, old_zip.NameToInfo
+            result['added'] = sorted(new_infos.keys() - old_infos.keys())
+            result['removed'] = sorted(old_infos.keys() - new_infos.keys())
+            for name in sorted(new_infos.keys() & old_infos.keys()):
+                new_info, old_info = new_infos[name], old_infos[name]
+                if new_info.CRC == old_info.CRC and new_info.file_size == old_info.file_size:
+                    result['same'] += 1
+                    continue
+                result['changed'].append(name)
+                if name.endswith(('.xml', '.rels')):
+                    result['parts'][name] = diff_part(name, old_zip.read(old_info), new_zip.read(new_info))
+                else:
+                    result['parts'][name] = {'size': [old_info.file_size, new_info.file_size]}
+        changed = result['changed'] or result['added'] or result['removed']
+        result['status'] = 'changed' if changed else 'identical'
+    except Exception as e:
+        result['error'] = f'{type(e).__name__}: {e}'
+    result['time'] = round(time.perf_counter() - start, 6)
+    return result
+
+
+def run_diff(pairs: list[tuple[str, str]], jobs: int = None) -> list[dict]:
+    """Diff (processed, backup) pairs across a process pool; results in input order."""
+    jobs = jobs or os.cpu_count() or 1
+    if jobs == 1 or len(pairs) <= 1:
+        return [diff_report(new, old) for new, old in pairs]
+
+    results = []
+    with ProcessPoolExecutor(max_workers=min(jobs, len(pairs))) as pool:
+        futures = [pool.submit(diff_report, new, old) for new, old in pairs]
+        for future in as_completed(futures):
+            results.append(future.result())
+    order = {new: i for i, (new, _) in enumerate(pairs)}
+    results.sort(key=lambda r: order[r['file']])
+    return results
+
+
+def block_summary(result: dict, limit: int = 4) -> str:
+    """The largest block changes across all parts of a result: net count per kind, then edits and moves."""
+    net = Counter()
+    changed = moved = 0
+    for part in result['parts'].values():
+        if 'size' in part:
+            continue
+        net.update(entry[0] for entry in part['added'])
+        net.subtract(entry[0] for entry in part['removed'])
+        changed += len(part['changed'])
+        moved += len(part['moved'])
+    changes = sorted(((kind, n) for kind, n in net.items() if n), key=lambda item: (-abs(item[1]), item[0]))
+    summary = [f'{kind} {n:+d}' for kind, n in changes[:limit]]
+    if changed:
+        summary.append(f'{changed} changed')
+    if moved:
+        summary.append(f'{moved} moved')
+    return ', '.join(summary)
+
+
+def print_table(results: list[dict]) -> None:
+    print(f"{'file':<14}{'status':<11}{'same':>6}{'changed':>9}{'added':>7}{'removed':>9}  largest block changes")
+    for r in results:
+        print(f"{os.path.basename(r['file']):<14}{r['status']:<11}{r['same']:>6}{len(r['changed']):>9}"
+              f"{len(r['added']):>7}{len(r['removed']):>9}  {r['error'] or block_summary(r)}")
+
+
+def _print_limited(entries: list, line) -> None:
+    for entry in entries[:DETAIL_LIMIT]:
+        print('      ' + line(*entry))
+    if len(entries) > DETAIL_LIMIT:
+        print(f"      ... {len(entries) - DETAIL_LIMIT} more")
+
+
+def print_details(result: dict) -> None:
+    print(f"\n{result['file']} vs {result['backup']}")
+    for name in result['added']:
+        print(f"  + {name}")
+    for name in result['removed']:
+        print(f"  - {name}")
+    for name, part in result['parts'].items():
+        if 'size' in part:
+            print(f"  ~ {name}: {part['size'][0]} -> {part['size'][1]} bytes")
+            continue
+        print(f"  ~ {name}: {part['blocks'][0]} -> {part['blocks'][1]} blocks, {part['same']} unchanged")
+        _print_limited(part['removed'], lambda kind, i, text: f"- {kind} #{i} {text!r}")
+        _print_limited(part['added'], lambda kind, j, text: f"+ {kind} #{j} {text!r}")
+        _print_limited(part['changed'], lambda kind, i, j, old, new: f"~ {kind} #{i}: {old!r} -> {new!r}")
+        _print_limited(part['moved'], lambda kind, i, j, text: f"> {kind} #{i} -> #{j} {text!r}")
+
+
+def main(argv: list[str] = None) -> int:
+    parser = argparse.ArgumentParser(description='Diff processed REF615 reports against their backups.')
+    parser.add_argument('reports_dir', nargs='?', default=str(REPORTS_DIR),
+                        help='Directory containing the processed H*.docx reports')
+    parser.add_argument('backup_dir', nargs='?', default=None,
+                        help='Directory containing the backups (default: Final_Reports_Backup next to '
+                             'reports_dir)')
+    parser.add_argument('--suffix', default='',
+                        help="Backup file suffix, e.g. '.settings_bak' to compare H01.docx with "
+                             "H01.docx.settings_bak")
+    parser.add_argument('-j', '--jobs', type=int, default=None, help='Worker processes (default: CPU count)')
+    parser.add_argument('--details', action='store_true', help='Print the changes of every differing part')
+    parser.add_argument('--json', default=None, help='Write the full results to this JSON file')
+    args = parser.parse_args(argv)
+
+    reports_dir = Path(args.reports_dir)
+    backup_dir = Path(args.backup_dir) if args.backup_dir else reports_dir.with_name('Final_Reports_Backup')
+    pairs = [(str(path), str(backup_dir / (path.name + args.suffix)))
+             for path in sorted(reports_dir.glob('H*.docx'))]
+
+    start = time.perf_counter()
+    results = run_diff(pairs, args.jobs)
+    elapsed = time.perf_counter() - start
+
+    print_table(results)
+    if args.details:
+        for result in results:
+            if result['status'] == 'changed':
+                print_details(result)
+
+    counts = Counter(r['status'] for r in results)
+    print(f"\n{len(results)} reports compared in {elapsed:.3f}s: "
+          + ', '.join(f'{counts[status]} {status}' for status in ('identical', 'changed', 'missing', 'failed')))
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+    return 1 if counts['failed'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
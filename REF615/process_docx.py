@@ -8,15 +8,60 @@ This script optimizes the layout and footer of REF615 relay test reports:
 3. Fixes margins for proper page layout
 4. Removes excessive empty paragraphs
 5. Removes cell shading from signature table
+
+Usage:
+    python3 -m process_docx [INPUT ...] [-o OUTPUT_DIR] [-n] [-j JOBS] [--passes footer,...]
+    python3 -m process_docx 'reports/H0*.docx' --socket /tmp/ref615.sock
+
+INPUT is a report, a directory of H*.docx reports or a glob pattern. With
+--socket (or $REF615_SOCKET) the reports are handed to an already running
+`serve_docx.py --socket` worker, so a single-file call costs little more
+than its transform; without one they are processed here. Running it with
+-m rather than as a script lets Python reuse the compiled module.
+
+The opt-in media-recompress pass needs Pillow; without it the pass is
+skipped. Everything else uses the standard library only.
 """
 
+import argparse
+import bisect
+import codecs
+import glob
+import hashlib
+import json
 import os
+import posixpath
 import re
 import shutil
+import struct
+import sys
 import tempfile
+import time
+import xml.parsers.expat
 import zipfile
+import zlib
+from collections.abc import Callable
+from contextlib import contextmanager
 from pathlib import Path
 
+# csv, sqlite3, traceback, urllib.parse and concurrent.futures (which pulls in
+# multiprocessing) are imported where they are used: a single-file call, or
+# one handed to a warm worker (see serve_docx --socket), never needs them
+
+
+# Default location of the reports processed by main()
+REPORTS_DIR = Path('/Users/abdout/codebase/REF615/Final_Reports')
+
+
+# Incremental-processing cache kept next to the reports (see ProcessCache)
+CACHE_FILENAME = '.process_docx_cache.sqlite'
+
+# Bump when transform output changes for the same input and settings,
+# so cached results from older versions are not trusted
+# (2: a self-closing <w:sectPr/> is expanded to take the footer reference;
+# 3: paragraphs with layout-bearing properties are no longer trimmed as empty;
+# 4: --low-memory keeps CRLF in text spooled to disk)
+PROCESSOR_VERSION = 4
 
 # New margin values (in twips: 1440 twips = 1 inch)
 NEW_MARGINS = {
@@ -29,6 +74,16 @@ NEW_MARGINS = {
     'gutter': '0'
 }
 
+# Package parts rewritten by process_docx; every other member passes through
+DOCUMENT_PART = 'word/document.xml'
+CONTENT_TYPES_PART = '[Content_Types].xml'
+DOCUMENT_RELS_PART = 'word/_rels/document.xml.rels'
+FOOTER_PART = 'word/footer1.xml'
+FOOTER_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.wordprocessingml.footer+xml'
+
+# Members with these extensions are already compressed; new copies are stored
+STORED_EXTENSIONS = ('.jpeg', '.jpg', '.png', '.gif')
+
 # Namespaces used in Office Open XML
 NAMESPACES = {
     'w': 'http://schemas.openxmlformats.org/wordprocessingml/2006/main',
@@ -39,170 +94,1678 @@ NAMESPACES = {
 }
 
 
-def extract_docx(docx_path: str, temp_dir: str) -> None:
-    """Extract DOCX contents to temporary directory."""
-    with zipfile.ZipFile(docx_path, 'r') as zf:
-        zf.extractall(temp_dir)
+@contextmanager
+def stage_timer(timings: dict, stage: str):
+    """Record the wall time of a processing stage (seconds) into timings."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[stage] = round(time.perf_counter() - start, 6)
+
+
+class Tracer:
+    """
+    Opt-in instrumentation for processing one file.
+
+    Records nested stages (wall and CPU time) and named counters such as
+    bytes read/written and regex matches. A disabled tracer records
+    nothing, so code can wrap its stages unconditionally.
+    """
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self.events: list[dict] = []
+        self.counters: dict[str, int] = {}
+        self._depth = 0
+
+    @contextmanager
+    def stage(self, name: str):
+        """Time a stage; stages may nest."""
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter_ns()
+        cpu_start = time.process_time_ns()
+        self._depth += 1
+        try:
+            yield
+        finally:
+            self._depth -= 1
+            self.events.append({
+                'name': name,
+                'depth': self._depth,
+                'start_ns': start,
+                'wall_ns': time.perf_counter_ns() - start,
+                'cpu_ns': time.process_time_ns() - cpu_start,
+            })
+
+    def count(self, key: str, n: int = 1) -> None:
+        """Add n to a named counter."""
+        if self.enabled:
+            self.counters[key] = self.counters.get(key, 0) + n
+
+    def as_dict(self) -> dict:
+        """Plain-data trace, safe to return from a worker process."""
+        return {
+            'pid': os.getpid(),
+            'events': sorted(self.events, key=lambda e: (e['start_ns'], e['depth'])),
+            'counters': dict(self.counters),
+        }
+
+
+# Tracer used when none is given; never enabled
+NULL_TRACER = Tracer(enabled=False)
+
+
+def percentile(values: list[float], pct: float) -> float:
+    """Nearest-rank percentile of values (0 < pct <= 100)."""
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * pct // 100))
+    return ordered[int(rank) - 1]
+
+
+def timing_summary(results: list[dict]) -> dict[str, dict]:
+    """
+    Summarize per-stage wall times of processed results.
+
+    Returns {stage: {'count', 'total', 'p50', 'p90', 'p99', 'max'}} in
+    seconds, plus 'cpu' totals for stages that were traced.
+    """
+    walls = {}
+    cpus = {}
+    for result in results:
+        if result['status'] == 'skipped':
+            continue
+        for stage, seconds in result['timings'].items():
+            walls.setdefault(stage, []).append(seconds)
+        for event in (result.get('trace') or {}).get('events', []):
+            cpus[event['name']] = cpus.get(event['name'], 0) + event['cpu_ns'] / 1e9
+
+    summary = {}
+    for stage, values in walls.items():
+        summary[stage] = {
+            'count': len(values),
+            'total': round(sum(values), 6),
+            'p50': percentile(values, 50),
+            'p90': percentile(values, 90),
+            'p99': percentile(values, 99),
+            'max': max(values),
+        }
+        if stage in cpus:
+            summary[stage]['cpu'] = round(cpus[stage], 6)
+    return summary
+
+
+def write_trace(results: list[dict], trace_path: str) -> None:
+    """
+    Write the traces of processed results.
+
+    A .jsonl path gets one JSON object per file (events and counters); any
+    other path gets Chrome trace format (load it in chrome://tracing or
+    Perfetto), with one row per file under its worker process.
+    """
+    traced = [r for r in results if r.get('trace')]
+    if trace_path.endswith('.jsonl'):
+        with open(trace_path, 'w', encoding='utf-8') as f:
+            for r in traced:
+                f.write(json.dumps({'file': r['file'], **r['trace']}) + '\n')
+        return
+
+    events = []
+    for tid, r in enumerate(traced):
+        trace = r['trace']
+        events.append({'name': 'thread_name', 'ph': 'M', 'pid': trace['pid'], 'tid': tid,
+                       'args': {'name': os.path.basename(r['file'])}})
+        for event in trace['events']:
+            events.append({
+                'name': event['name'], 'cat': 'docx', 'ph': 'X',
+                'ts': event['start_ns'] / 1000, 'dur': event['wall_ns'] / 1000,
+                'pid': trace['pid'], 'tid': tid,
+                'args': {'cpu_ms': event['cpu_ns'] / 1e6},
+            })
+        if trace['events']:
+            events.append({'name': 'counters', 'ph': 'C', 'pid': trace['pid'], 'tid': tid,
+                           'ts': trace['events'][-1]['start_ns'] / 1000, 'args': trace['counters']})
+    with open(trace_path, 'w', encoding='utf-8') as f:
+        json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+
+
+def current_rss() -> int:
+    """
+    Resident set size of this process in bytes.
+
+    Read from /proc/self/statm where it exists; elsewhere (macOS) the peak
+    RSS from getrusage is the best available figure.
+    """
+    try:
+        with open('/proc/self/statm', 'rb') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak * 1024
+
 
+class MemoryMonitor:
+    """
+    Tracks the peak RSS of a pipeline run and enforces an optional limit.
+
+    sample() is called at stage boundaries, and for every chunk read in
+    low-memory mode; it raises MemoryError once RSS exceeds limit bytes.
+    """
+
+    def __init__(self, limit: int = None):
+        self.limit = limit
+        self.peak = 0
+
+    def sample(self) -> int:
+        rss = current_rss()
+        self.peak = max(self.peak, rss)
+        if self.limit is not None and rss > self.limit:
+            raise MemoryError(f'RSS of {rss / 2**20:.0f} MiB exceeds the '
+                              f'{self.limit / 2**20:.0f} MiB limit')
+        return rss
+
+
+class EncodedPart:
+    """
+    A part serialized once and written into many archives.
+
+    Holds the UTF-8 bytes and their CRC-32. The raw-deflate stream is made
+    the first time the part is written compressed and kept, so later
+    archives copy it like a raw member instead of compressing it again.
+    """
 
-def repackage_docx(temp_dir: str, output_path: str) -> None:
-    """Repackage temporary directory into DOCX file."""
-    with zipfile.ZipFile(output_path, 'w', zipfile.ZIP_DEFLATED) as zf:
-        for root, dirs, files in os.walk(temp_dir):
-            for file in files:
-                file_path = os.path.join(root, file)
-                arcname = os.path.relpath(file_path, temp_dir)
-                zf.write(file_path, arcname)
+    __slots__ = ('text', 'data', 'crc', '_deflated')
+
+    def __init__(self, text: str):
+        self.text = text
+        self.data = text.encode('utf-8')
+        self.crc = zlib.crc32(self.data)
+        self._deflated = None
+
+    def deflated(self) -> bytes:
+        if self._deflated is None:
+            self._deflated = _deflate(self.data)
+        return self._deflated
+
+
+def _deflate(data: bytes) -> bytes:
+    """Raw deflate stream of data, as stored in a ZIP member."""
+    compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15)
+    return compressor.compress(data) + compressor.flush()
+
+
+class ZipWriter:
+    """
+    Minimal deterministic ZIP writer for DOCX packages.
+
+    Unlike zipfile.ZipFile it can copy a member's compressed bytes from
+    another archive verbatim (copy_raw), so untouched parts are never
+    decompressed or recompressed. Every header field is derived from the
+    member metadata alone, so the same inputs always produce the same bytes.
+    ZIP64 archives are not supported (DOCX reports are far below 4 GiB).
+
+    If a PackageValidator is given, every member is fed to it as it is
+    written; raw-copied XML members are inflated chunk by chunk on the way.
+    """
+
+    CHUNK_SIZE = 1 << 16
+
+    def __init__(self, fp, validator: 'PackageValidator' = None):
+        self.fp = fp
+        self.validator = validator
+        self.members: list[zipfile.ZipInfo] = []
+        self.raw_copied_bytes = 0
+        self.encoded_bytes = 0
+
+    @staticmethod
+    def _encode_name(info: zipfile.ZipInfo) -> tuple[bytes, int]:
+        try:
+            return info.filename.encode('ascii'), info.flag_bits & ~0x800
+        except UnicodeEncodeError:
+            return info.filename.encode('utf-8'), info.flag_bits | 0x800
+
+    @staticmethod
+    def _dos_datetime(info: zipfile.ZipInfo) -> tuple[int, int]:
+        dt = info.date_time
+        dosdate = (dt[0] - 1980) << 9 | dt[1] << 5 | dt[2]
+        dostime = dt[3] << 11 | dt[4] << 5 | (dt[5] // 2)
+        return dosdate, dostime
+
+    def _write_local_header(self, info: zipfile.ZipInfo) -> None:
+        if info.compress_size > zipfile.ZIP64_LIMIT or self.fp.tell() > zipfile.ZIP64_LIMIT:
+            raise zipfile.LargeZipFile('ZipWriter does not write ZIP64 archives')
+        info.header_offset = self.fp.tell()
+        filename, flag_bits = self._encode_name(info)
+        dosdate, dostime = self._dos_datetime(info)
+        self.fp.write(struct.pack(
+            zipfile.structFileHeader, zipfile.stringFileHeader,
+            info.extract_version, info.reserved, flag_bits, info.compress_type,
+            dostime, dosdate, info.CRC, info.compress_size, info.file_size,
+            len(filename), len(info.extra)))
+        self.fp.write(filename)
+        self.fp.write(info.extra)
+        self.members.append(info)
+
+    def write(self, name: str, data: bytes | EncodedPart, date_time: tuple, compress_type: int = None) -> None:
+        """
+        Add a member from uncompressed bytes (stored for media, deflated otherwise).
+
+        An EncodedPart supplies its CRC and deflate stream, which are reused.
+        """
+        part = data if isinstance(data, EncodedPart) else None
+        if part is not None:
+            data = part.data
+        if compress_type is None:
+            stored = name.lower().endswith(STORED_EXTENSIONS)
+            compress_type = zipfile.ZIP_STORED if stored else zipfile.ZIP_DEFLATED
+
+        info = zipfile.ZipInfo(name, date_time=date_time)
+        info.compress_type = compress_type
+        info.create_system = 0
+        info.external_attr = 0
+        info.extract_version = 20 if compress_type == zipfile.ZIP_DEFLATED else 10
+        if compress_type == zipfile.ZIP_DEFLATED:
+            payload = part.deflated() if part is not None else _deflate(data)
+        else:
+            payload = data
+        info.CRC = part.crc if part is not None else zlib.crc32(data)
+        info.file_size = len(data)
+        info.compress_size = len(payload)
+
+        self._write_local_header(info)
+        self.fp.write(payload)
+        self.encoded_bytes += len(data)
+        if self.validator is not None:
+            self.validator.check_part(name, data)
+
+    def write_stream(self, name: str, date_time: tuple, compress_type: int,
+                     produce: Callable[[Callable[[bytes], None]], object]):
+        """
+        Add a member whose bytes are produced incrementally.
+
+        produce is called with a write(bytes) function. Data is checksummed,
+        compressed and validated chunk by chunk and the CRC and sizes are
+        patched into the local header afterwards, so the member is never held
+        in memory. Needs a seekable file; returns what produce returns.
+        """
+        info = zipfile.ZipInfo(name, date_time=date_time)
+        info.compress_type = compress_type
+        info.create_system = 0
+        info.external_attr = 0
+        info.extract_version = 20 if compress_type == zipfile.ZIP_DEFLATED else 10
+        info.CRC = info.file_size = info.compress_size = 0
+        self._write_local_header(info)
+
+        compressor = None
+        if compress_type == zipfile.ZIP_DEFLATED:
+            compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15)
+        elif compress_type != zipfile.ZIP_STORED:
+            raise ValueError(f'Cannot stream {name} with compression method {compress_type}')
+        parser = self.validator.open_part(name) if self.validator is not None else None
+
+        def write(data: bytes) -> None:
+            info.CRC = zlib.crc32(data, info.CRC)
+            info.file_size += len(data)
+            payload = compressor.compress(data) if compressor is not None else data
+            self.fp.write(payload)
+            info.compress_size += len(payload)
+            if parser is not None:
+                parser.feed(data)
+
+        result = produce(write)
+        if compressor is not None:
+            payload = compressor.flush()
+            self.fp.write(payload)
+            info.compress_size += len(payload)
+        if parser is not None:
+            parser.close()
+        if info.compress_size > zipfile.ZIP64_LIMIT or info.file_size > zipfile.ZIP64_LIMIT:
+            raise zipfile.LargeZipFile('ZipWriter does not write ZIP64 archives')
+
+        # CRC-32, compressed size and size follow the first 14 bytes of the local header
+        end = self.fp.tell()
+        self.fp.seek(info.header_offset + 14)
+        self.fp.write(struct.pack('<LLL', info.CRC, info.compress_size, info.file_size))
+        self.fp.seek(end)
+        self.encoded_bytes += info.file_size
+        return result
+
+    def copy_raw(self, source: zipfile.ZipFile, info: zipfile.ZipInfo) -> None:
+        """Copy a member of source without decompressing it."""
+        if info.flag_bits & 0x1:
+            raise ValueError(f'Cannot copy encrypted member {info.filename}')
+
+        src = source.fp
+        src.seek(info.header_offset)
+        header = struct.unpack(zipfile.structFileHeader, src.read(zipfile.sizeFileHeader))
+        if header[0] != zipfile.stringFileHeader:
+            raise zipfile.BadZipFile(f'Bad local file header for {info.filename}')
+        src.seek(header[-2] + header[-1], os.SEEK_CUR)
+        data_offset = src.tell()
+
+        copy = zipfile.ZipInfo(info.filename, date_time=info.date_time)
+        copy.compress_type = info.compress_type
+        copy.create_system = info.create_system
+        copy.create_version = info.create_version
+        copy.extract_version = min(info.extract_version, 20)
+        copy.external_attr = info.external_attr
+        copy.internal_attr = info.internal_attr
+        copy.comment = info.comment
+        # Sizes go in the local header, so a source data descriptor is dropped
+        copy.flag_bits = info.flag_bits & ~0x08
+        copy.CRC = info.CRC
+        copy.file_size = info.file_size
+        copy.compress_size = info.compress_size
+        self._write_local_header(copy)
+
+        # The bytes are the source's, so the validator only checks their CRC-32
+        # and parses just the parts the package-wide checks read
+        check = self.validator is not None
+        parser = self.validator.open_copied_part(info.filename) if check else None
+        inflater = zlib.decompressobj(-15) if info.compress_type == zipfile.ZIP_DEFLATED else None
+        if check and inflater is None and info.compress_type != zipfile.ZIP_STORED:
+            self.validator.corrupt[info.filename] = f'unsupported compression method {info.compress_type}'
+            check = False
+            parser = None
+        crc = 0
+
+        src.seek(data_offset)
+        remaining = info.compress_size
+        while remaining:
+            chunk = src.read(min(self.CHUNK_SIZE, remaining))
+            if not chunk:
+                raise zipfile.BadZipFile(f'Truncated data for {info.filename}')
+            self.fp.write(chunk)
+            remaining -= len(chunk)
+            if check:
+                data = inflater.decompress(chunk) if inflater is not None else chunk
+                crc = zlib.crc32(data, crc)
+                if parser is not None:
+                    parser.feed(data)
+        if check:
+            if inflater is not None:
+                crc = zlib.crc32(inflater.flush(), crc)
+            if crc != info.CRC:
+                self.validator.corrupt[info.filename] = f'CRC-32 {crc:08x}, expected {info.CRC:08x}'
+        if parser is not None:
+            parser.close()
+        self.raw_copied_bytes += info.compress_size
+
+    def close(self) -> None:
+        """Write the central directory and end-of-archive record."""
+        start = self.fp.tell()
+        for info in self.members:
+            filename, flag_bits = self._encode_name(info)
+            dosdate, dostime = self._dos_datetime(info)
+            self.fp.write(struct.pack(
+                zipfile.structCentralDir, zipfile.stringCentralDir,
+                info.create_version, info.create_system, info.extract_version, info.reserved,
+                flag_bits, info.compress_type, dostime, dosdate, info.CRC,
+                info.compress_size, info.file_size, len(filename), len(info.extra),
+                len(info.comment), 0, info.internal_attr, info.external_attr,
+                info.header_offset))
+            self.fp.write(filename)
+            self.fp.write(info.extra)
+            self.fp.write(info.comment)
+        end = self.fp.tell()
+        if len(self.members) > 0xFFFF or end > zipfile.ZIP64_LIMIT:
+            raise zipfile.LargeZipFile('ZipWriter does not write ZIP64 archives')
+        self.fp.write(struct.pack(
+            zipfile.structEndArchive, zipfile.stringEndArchive, 0, 0,
+            len(self.members), len(self.members), end - start, start, 0))
+
+
+def write_docx(source: zipfile.ZipFile, output_path: str, parts: dict[str, str | bytes | EncodedPart],
+               removed: set[str] = frozenset(), validator: 'PackageValidator' = None,
+               streams: dict[str, Callable] = None) -> dict[str, int]:
+    """
+    Write a new DOCX from an open source archive, replacing or adding parts.
+
+    Members named in parts are encoded and compressed from memory (bytes
+    as they are, an EncodedPart as already serialized); members named in streams
+    are produced incrementally (see ZipWriter.write_stream), and the
+    producer may return further parts to add; members
+    named in removed are left out; every other member of source is
+    raw-copied (compressed bytes, compression method, timestamp and order
+    unchanged). Parts not present in source are appended at the end. The archive is written to a temporary file next to
+    output_path and then renamed over it, so output_path may be the file
+    source was opened from. A validator, if given, sees every member as it
+    is written (see PackageValidator).
+
+    Returns:
+        Byte counts: raw-copied compressed bytes, uncompressed bytes encoded,
+        and the size of the written archive
+    """
+    parts = dict(parts)
+    streams = streams or {}
+    out_dir = os.path.dirname(os.path.abspath(output_path))
+    fd, tmp_path = tempfile.mkstemp(prefix='.', suffix='.docx.tmp', dir=out_dir)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            writer = ZipWriter(f, validator)
+            written = set()
+            for info in source.infolist():
+                if info.filename in removed:
+                    continue
+                if info.filename in parts:
+                    writer.write(info.filename, _part_bytes(parts[info.filename]),
+                                 info.date_time, info.compress_type)
+                elif info.filename in streams:
+                    produce = streams[info.filename]
+                    parts.update(writer.write_stream(info.filename, info.date_time, info.compress_type,
+                                                     produce) or {})
+                else:
+                    writer.copy_raw(source, info)
+                written.add(info.filename)
+
+            # New parts take the timestamp of the main document part
+            date_time = source.getinfo(DOCUMENT_PART).date_time
+            for name, content in parts.items():
+                if name not in written:
+                    writer.write(name, _part_bytes(content), date_time)
+            writer.close()
+            written_bytes = {
+                'bytes_raw_copied': writer.raw_copied_bytes,
+                'bytes_encoded': writer.encoded_bytes,
+                'bytes_written': f.tell(),
+            }
+
+        # mkstemp creates the file 0600; keep the permissions of the file we replace
+        if os.path.exists(output_path):
+            shutil.copymode(output_path, tmp_path)
+        else:
+            umask = os.umask(0)
+            os.umask(umask)
+            os.chmod(tmp_path, 0o666 & ~umask)
+        os.replace(tmp_path, output_path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    return written_bytes
+
+
+def _part_bytes(content: str | bytes | EncodedPart) -> bytes | EncodedPart:
+    return content.encode('utf-8') if isinstance(content, str) else content
+
+
+class DocxPackage:
+    """
+    An open DOCX shared by the transform passes of one pipeline run.
+
+    Parts are decoded on first read and cached, so every pass sees the
+    latest text of a part without re-reading the archive; parts written by
+    a pass are the ones save() re-encodes, everything else is raw-copied.
+    Binary parts (media) are read and written as bytes instead.
+    In low-memory mode a pass may instead register a part as streamed: it
+    is then produced while save() writes the archive and cannot be read.
+    """
+
+    def __init__(self, source: zipfile.ZipFile, tracer: Tracer = NULL_TRACER,
+                 monitor: MemoryMonitor = None):
+        self.source = source
+        self.tracer = tracer
+        self.monitor = monitor or MemoryMonitor()
+        self.parts: dict[str, str | bytes] = {}
+        self.encoded: dict[str, EncodedPart] = {}
+        self.modified: set[str] = set()
+        self.removed: set[str] = set()
+        self.streams: dict[str, Callable] = {}
+        self.stats: dict = {}
+
+    def names(self) -> list[str]:
+        """Names of all parts, including ones added by passes."""
+        names = self.source.namelist()
+        names += sorted(self.modified.difference(names))
+        return [name for name in names if name not in self.removed]
+
+    def has(self, name: str) -> bool:
+        if name in self.removed:
+            return False
+        return name in self.parts or name in self.source.NameToInfo
+
+    def read(self, name: str) -> str:
+        """Return the current text of a part."""
+        if name in self.streams:
+            raise ValueError(f'{name} is streamed in low-memory mode; no later pass can read it')
+        if name not in self.parts:
+            info = self.source.getinfo(name)
+            self.parts[name] = self.source.read(info).decode('utf-8')
+            self.tracer.count('bytes_read', info.compress_size)
+            self.tracer.count('bytes_decoded', info.file_size)
+        return self.parts[name]
+
+    def read_bytes(self, name: str) -> bytes:
+        """Return the current bytes of a binary part; source parts are not cached."""
+        if name in self.parts:
+            content = self.parts[name]
+            return content.encode('utf-8') if isinstance(content, str) else content
+        info = self.source.getinfo(name)
+        self.tracer.count('bytes_read', info.compress_size)
+        return self.source.read(info)
+
+    def size(self, name: str) -> int:
+        """Uncompressed size of a part, read from the archive directory if it is unmodified."""
+        if name in self.parts:
+            return len(self.read_bytes(name))
+        return self.source.getinfo(name).file_size
+
+    def write(self, name: str, content: str) -> None:
+        """Replace (or add) a part."""
+        self.parts[name] = content
+        self.encoded.pop(name, None)
+        self.modified.add(name)
+        self.removed.discard(name)
+
+    def write_bytes(self, name: str, data: bytes) -> None:
+        """Replace (or add) a binary part."""
+        self.parts[name] = data
+        self.encoded.pop(name, None)
+        self.modified.add(name)
+        self.removed.discard(name)
+
+    def write_encoded(self, name: str, part: EncodedPart) -> None:
+        """Replace (or add) a part with one serialized ahead of time."""
+        self.write(name, part.text)
+        self.encoded[name] = part
+
+    def stream(self, name: str, produce: Callable[[Callable[[bytes], None]], dict | None]) -> None:
+        """
+        Produce a source part while the archive is written (see write_docx).
+
+        produce receives a write(bytes) function and may return further
+        parts to add to the package.
+        """
+        if name in self.modified or name not in self.source.NameToInfo:
+            raise ValueError(f'Cannot stream {name}: it is not an unmodified source part')
+        self.streams[name] = produce
+
+    def remove(self, name: str) -> None:
+        """Drop a part from the package."""
+        self.parts.pop(name, None)
+        self.encoded.pop(name, None)
+        self.modified.discard(name)
+        self.removed.add(name)
+
+    def save(self, output_path: str, validator: 'PackageValidator' = None) -> None:
+        """Write the package, re-encoding only the parts passes changed."""
+        parts = {name: self.encoded.get(name) or self.parts[name] for name in self.modified}
+        written = write_docx(self.source, output_path, parts, self.removed, validator, self.streams)
+        for key, n in written.items():
+            self.tracer.count(key, n)
+
+
+RELATIONSHIP_RE = re.compile(r'<Relationship\b[^>]*>')
+HEADER_REFERENCE_RE = re.compile(r'<[\w.\-]+:headerReference\b[^>]*>')
+RID_ATTR_RE = re.compile(r'(\b[\w.\-]+:id\s*=\s*")([^"]*)(")')
+RID_NUMBER_RE = re.compile(r'Id="rId(\d+)"')
+OVERRIDE_RE = re.compile(r'<Override\b[^>]*>')
+PART_NAME_RE = re.compile(r'\bPartName="([^"]*)"')
+
+
+def parse_relationships(rels_content: str) -> dict[str, dict]:
+    """
+    Parse a .rels part into {Id: {'type', 'target', 'mode', 'span'}}.
+
+    type is the last segment of the relationship type URI (e.g. 'header'),
+    and span is the (start, end) offset of the Relationship element.
+    """
+    relationships = {}
+    for match in RELATIONSHIP_RE.finditer(rels_content):
+        attrs = {name: dq or sq for name, dq, sq in ATTR_RE.findall(match.group(0))}
+        if 'Id' in attrs:
+            relationships[attrs['Id']] = {
+                'type': attrs.get('Type', '').rsplit('/', 1)[-1],
+                'target': attrs.get('Target', ''),
+                'mode': attrs.get('TargetMode', 'Internal'),
+                'span': match.span(),
+            }
+    return relationships
+
+
+def rels_part_name(part_name: str) -> str:
+    """Name of the relationships part belonging to part_name."""
+    folder, _, base = part_name.rpartition('/')
+    return f'{folder}/_rels/{base}.rels' if folder else f'_rels/{base}.rels'
 
 
 def find_next_rid(rels_content: str) -> str:
     """Find the next available relationship ID."""
-    rids = re.findall(r'Id="rId(\d+)"', rels_content)
+    rids = RID_NUMBER_RE.findall(rels_content)
     if rids:
         max_rid = max(int(rid) for rid in rids)
         return f'rId{max_rid + 1}'
     return 'rId1'
 
 
-def find_signature_tables(document_content: str) -> list[tuple[int, int, str]]:
+# Signature-table cell shading removed from cleaned tables
+SIGNATURE_SHADING = 'FCE9D9'
+
+# Empty paragraphs kept where a run of them is trimmed
+MAX_EMPTY_PARAGRAPHS = 2
+
+# The only w:pPr children an empty paragraph may have: anything else (a border
+# used as a rule, shading, a frame, numbering, a page break) is visible layout
+EMPTY_PARAGRAPH_PROPERTIES = frozenset({'pStyle', 'spacing', 'jc', 'rPr'})
+
+XML_NS = 'http://www.w3.org/XML/1998/namespace'
+W_NS = NAMESPACES['w']
+R_NS = NAMESPACES['r']
+
+# One markup token: a start/end/empty-element tag, or a comment/PI/CDATA/doctype (no name)
+MARKUP_RE = re.compile(
+    r'<(?:(?P<close>/)?(?P<name>[^\s/>!?]+)'
+    r'(?P<attrs>[^>"\'/]*(?:(?:"[^"]*"|\'[^\']*\'|/(?!>))[^>"\'/]*)*)(?P<empty>/)?'
+    r'|!--.*?--|\?.*?\?|!\[CDATA\[.*?\]\]|![^>]*)>',
+    re.DOTALL)
+ATTR_RE = re.compile(r'([^\s=]+)\s*=\s*(?:"([^"]*)"|\'([^\']*)\')')
+XMLNS_RE = re.compile(r'xmlns(?::([^\s=]+))?\s*=\s*(?:"([^"]*)"|\'([^\']*)\')')
+WHITESPACE_RE = re.compile(r'\s*')
+
+
+def parse_attributes(attrs: str, ns: dict) -> dict[tuple[str, str], str]:
+    """Parse a tag's attribute text into {(namespace, local name): value}."""
+    result = {}
+    for name, dq, sq in ATTR_RE.findall(attrs):
+        prefix, _, local = name.rpartition(':')
+        result[(ns.get(prefix) if prefix else '', local)] = dq or sq
+    return result
+
+
+# w: elements recorded by index_document; every child of w:body is recorded too
+INDEXED_ELEMENTS = frozenset({'body', 'p', 'pPr', 'tbl', 'sectPr', 'drawing', 'shd', 'pgMar',
+                              'headerReference', 'footerReference'})
+
+
+class IndexedElement:
     """
-    Find all signature tables in the document.
-    A signature table contains "COMPANY" and has signature image references (rId7, rId8, rId9).
-    Returns list of (start, end, table_xml) tuples.
+    One element of an ElementIndex.
+
+    start/end span the whole element and tag_end is the end of its start tag
+    (equal to end for an empty-element tag). parent is the nearest indexed
+    ancestor; direct tells whether it is the real parent.
     """
-    signature_tables = []
 
-    for match in re.finditer(r'<w:tbl>.*?</w:tbl>', document_content, re.DOTALL):
-        table_xml = match.group(0)
-        # Check if this is a signature table
-        if 'COMPANY' in table_xml and ('rId7' in table_xml or 'rId8' in table_xml or 'rId9' in table_xml):
-            signature_tables.append((match.start(), match.end(), table_xml))
+    __slots__ = ('uri', 'local', 'start', 'tag_end', 'end', 'depth', 'parent', 'direct',
+                 'attrs', 'ns', 'position')
 
-    return signature_tables
+    def __init__(self, uri, local, start, tag_end, depth, parent, direct, attrs, ns, position):
+        self.uri = uri
+        self.local = local
+        self.start = start
+        self.tag_end = tag_end
+        self.end = tag_end
+        self.depth = depth
+        self.parent = parent
+        self.direct = direct
+        self.attrs = attrs
+        self.ns = ns
+        self.position = position
 
+    def is_w(self, local: str) -> bool:
+        return self.local == local and self.uri == W_NS
 
-def extract_signature_table(document_content: str) -> tuple[str, str]:
+    def attribute(self, uri: str, local: str) -> str | None:
+        return parse_attributes(self.attrs, self.ns).get((uri, local))
+
+
+class ElementIndex:
     """
-    Extract the last table (signature table) from document.xml.
-    Returns (table_xml, document_without_table).
+    Offsets of the structural elements of a WordprocessingML part.
+
+    Built once by index_document; elements are in document order, so the
+    descendants of an element are the contiguous run that follows it.
+    Edits are expressed as (start, end, replacement) splices against these
+    offsets and applied with apply_splices.
+    """
+
+    def __init__(self, text: str):
+        self.text = text
+        self.elements: list[IndexedElement] = []
+        self.starts: list[int] = []
+        self.w_prefix = 'w'
+        self.r_prefix = 'r'
+        self.tokens = 0
+        # _plain_properties results by (w:pPr markup, id of its namespaces); empty paragraphs repeat
+        self.plain_properties: dict[tuple[str, int], bool] = {}
+
+    def _scope(self, within: IndexedElement = None) -> list[IndexedElement]:
+        if within is None:
+            return self.elements
+        return self.elements[within.position + 1:bisect.bisect_left(self.starts, within.end)]
+
+    def select(self, local: str, within: IndexedElement = None) -> list[IndexedElement]:
+        """Every w:local element, optionally only the descendants of within."""
+        return [el for el in self._scope(within) if el.is_w(local)]
+
+    def outermost(self, local: str, within: IndexedElement = None) -> list[IndexedElement]:
+        """w:local elements that are not inside another w:local (below within)."""
+        return [el for el in self.select(local, within) if self.ancestor(el, local, within) is None]
+
+    def children(self, element: IndexedElement) -> list[IndexedElement]:
+        """Indexed direct children of element."""
+        return [el for el in self._scope(element) if el.parent is element and el.direct]
+
+    def ancestor(self, element: IndexedElement, local: str,
+                 stop: IndexedElement = None) -> IndexedElement | None:
+        """Nearest w:local ancestor of element, not looking above stop."""
+        el = element.parent
+        while el is not None and el is not stop:
+            if el.is_w(local):
+                return el
+            el = el.parent
+        return None
+
+    def markup(self, element: IndexedElement) -> str:
+        return self.text[element.start:element.end]
+
+
+def _index_plain(index: ElementIndex, base_ns: dict[str, str]) -> bool:
+    """
+    index_document for a plain part, matching only the tags of INDEXED_ELEMENTS.
+
+    A part is plain when it has no comment, CDATA section, doctype or
+    processing instruction after the XML declaration, declares namespaces
+    on its root element only, binds the WordprocessingML namespace to one
+    prefix and has no '>' outside tag ends (as many '<' as '>'). Every '<'
+    then starts a tag and every '/>' ends an empty one, so the depth at each
+    indexed tag is counted from the markup between indexed tags. Nothing is
+    recorded unless the whole part is plain and every w:body child is an
+    indexed element.
+
+    Returns:
+        Whether the part was indexed; if not, elements may hold a partial index
+    """
+    text = index.text
+    start = 0
+    if text.startswith('<?'):
+        start = text.find('?>') + 2
+        if not start:
+            return False
+    if '<!' in text or text.find('<?', start) != -1 or text.count('<') != text.count('>'):
+        return False
+    root = MARKUP_RE.search(text, start)
+    if root is None or root.group('close'):
+        return False
+    ns = base_ns
+    root_attrs = root.group('attrs')
+    if 'xmlns' in root_attrs:
+        ns = dict(ns)
+        for prefix, dq, sq in XMLNS_RE.findall(root_attrs):
+            ns[prefix] = dq or sq
+    w_prefixes = [prefix for prefix, uri in ns.items() if uri == W_NS]
+    if len(w_prefixes) != 1 or not w_prefixes[0] or text.find('xmlns', root.end()) != -1:
+        return False
+
+    elements = index.elements
+    names = '|'.join(sorted(INDEXED_ELEMENTS, key=len, reverse=True))
+    tags = re.compile(rf'<(/?){re.escape(w_prefixes[0])}:({names})(?=[\s/>])([^>]*?)(/?)>')
+    stack = []              # open indexed elements
+    depth = 0               # open elements of any kind
+    pos = start
+    for m in tags.finditer(text, start):
+        tag_start = m.start()
+        if text.find('<', pos, tag_start) != -1:
+            if stack and stack[-1].is_w('body') and depth == stack[-1].depth + 1:
+                return False    # a w:body child that is not indexed
+            depth += (text.count('<', pos, tag_start) - 2 * text.count('</', pos, tag_start)
+                      - text.count('/>', pos, tag_start))
+        pos = m.end()
+        close, local, attrs, empty = m.groups()
+        if close:
+            if not stack or stack[-1].local != local or stack[-1].depth != depth - 1:
+                return False
+            stack.pop().end = pos
+            depth -= 1
+            continue
+        parent = stack[-1] if stack else None
+        el = IndexedElement(W_NS, local, tag_start, pos, depth, parent,
+                            parent is not None and parent.depth == depth - 1, attrs, ns, len(elements))
+        elements.append(el)
+        if not empty:
+            stack.append(el)
+            depth += 1
+    if stack or text.count('<', pos) - 2 * text.count('</', pos) - text.count('/>', pos) + depth:
+        return False
+    if 'xmlns' in root_attrs:
+        by_uri = {uri: prefix for prefix, uri in ns.items()}
+        index.w_prefix, index.r_prefix = by_uri.get(W_NS, 'w'), by_uri.get(R_NS)
+    index.tokens = text.count('<')
+    return True
+
+
+def index_document(text: str, namespaces: dict[str, str] = None) -> ElementIndex:
+    """
+    Tokenize a WordprocessingML part once and index its structural elements.
+
+    Namespaces are resolved, so any prefix bound to the WordprocessingML
+    namespace is recognized; the prefixes the root element binds for the w
+    and r namespaces are recorded for generating new markup (r_prefix is
+    None when the root does not declare it). A fragment of a part is
+    indexed with the namespaces in scope where it occurs. Plain parts, as
+    Word writes them, only have their indexed tags matched (see
+    _index_plain); anything else is tokenized in full.
+
+    Raises:
+        ValueError: If the markup is unbalanced
+    """
+    index = ElementIndex(text)
+    base_ns = {'xml': XML_NS, **(namespaces or {})}
+    if not _index_plain(index, base_ns):
+        index.elements.clear()
+        _index_tokens(index, base_ns)
+    index.starts = [el.start for el in index.elements]
+    return index
+
+
+def _index_tokens(index: ElementIndex, base_ns: dict[str, str]) -> None:
+    """index_document for any part: every markup token is read."""
+    text = index.text
+    elements = index.elements
+    stack = []              # open elements: (name, indexed element or None, namespaces, nearest indexed)
+
+    tokens = 0
+    for m in MARKUP_RE.finditer(text):
+        tokens += 1
+        name = m.group('name')
+        if name is None:
+            continue
+
+        if m.group('close'):
+            if not stack:
+                raise ValueError(f'Unbalanced document.xml: unexpected </{name}> at offset {m.start()}')
+            el = stack.pop()[1]
+            if el is not None:
+                el.end = m.end()
+            continue
+
+        attrs = m.group('attrs')
+        if stack:
+            _, parent, ns, anchor = stack[-1]
+        else:
+            parent, ns, anchor = None, base_ns, None
+        if 'xmlns' in attrs:
+            ns = dict(ns)
+            for prefix, dq, sq in XMLNS_RE.findall(attrs):
+                ns[prefix] = dq or sq
+            if not stack:
+                by_uri = {uri: prefix for prefix, uri in ns.items()}
+                index.w_prefix, index.r_prefix = by_uri.get(W_NS, 'w'), by_uri.get(R_NS)
+
+        prefix, _, local = name.rpartition(':')
+        uri = ns.get(prefix)
+        el = None
+        if (uri == W_NS and local in INDEXED_ELEMENTS) or (parent is not None and parent.is_w('body')):
+            el = IndexedElement(uri, local, m.start(), m.end(), len(stack), anchor, parent is not None,
+                                attrs, ns, len(elements))
+            elements.append(el)
+        if not m.group('empty'):
+            stack.append((name, el, ns, el if el is not None else anchor))
+
+    if stack:
+        raise ValueError(f'Unbalanced document.xml: <{stack[-1][0]}> is never closed')
+    index.tokens = tokens
+
+
+def apply_splices(text: str, splices: list[tuple[int, int, str]]) -> str:
+    """
+    Apply (start, end, replacement) splices to text in a single join.
+
+    Splices nested inside an earlier, wider splice are dropped (the outer one
+    already replaces that range). An insertion (start == end) goes before a
+    replacement that starts at the same offset.
+    """
+    out = []
+    pos = 0
+    for start, end, replacement in sorted(splices, key=lambda s: (s[0], s[0] != s[1], -s[1])):
+        if start < pos:
+            continue
+        out.append(text[pos:start])
+        out.append(replacement)
+        pos = end
+    out.append(text[pos:])
+    return ''.join(out)
+
+
+def margin_tag(w: str = 'w') -> str:
+    """Build the w:pgMar element for NEW_MARGINS using prefix w."""
+    keys = ('top', 'right', 'bottom', 'left', 'header', 'footer', 'gutter')
+    attrs = ' '.join(f'{w}:{key}="{NEW_MARGINS[key]}"' for key in keys)
+    return f'<{w}:pgMar {attrs}/>'
+
+
+def footer_reference_tag(footer_rid: str, w: str = 'w', r: str = 'r') -> str:
+    """Build a default w:footerReference, declaring r locally if the document lacks it."""
+    if r is None:
+        return f'<{w}:footerReference {w}:type="default" xmlns:r="{R_NS}" r:id="{footer_rid}"/>'
+    return f'<{w}:footerReference {w}:type="default" {r}:id="{footer_rid}"/>'
+
+
+def _plain_properties(markup: str, ns: dict[str, str]) -> bool:
+    """Whether every child of a w:pPr (its markup) is one of EMPTY_PARAGRAPH_PROPERTIES."""
+    depth = 0
+    for m in MARKUP_RE.finditer(markup):
+        name = m.group('name')
+        if name is None:
+            continue
+        if m.group('close'):
+            depth -= 1
+            continue
+        if depth == 1:
+            prefix, _, local = name.rpartition(':')
+            if ns.get(prefix) != W_NS or local not in EMPTY_PARAGRAPH_PROPERTIES:
+                return False
+        if not m.group('empty'):
+            depth += 1
+    return True
+
+
+def is_empty_paragraph(index: ElementIndex, paragraph: IndexedElement) -> bool:
+    """
+    Whether a paragraph's only child is an optional w:pPr with nothing but
+    EMPTY_PARAGRAPH_PROPERTIES in it (so no section break, border, shading,
+    frame, numbering or page break).
+    """
+    text = index.text
+    if paragraph.tag_end == paragraph.end:
+        return True
+    pos = paragraph.tag_end
+    for child in index.children(paragraph):
+        if not child.is_w('pPr') or _has_element(text, pos, child.start):
+            return False
+        markup = index.markup(child)
+        key = (markup, id(child.ns))
+        plain = index.plain_properties.get(key)
+        if plain is None:
+            plain = index.plain_properties[key] = _plain_properties(markup, child.ns)
+        if not plain:
+            return False
+        pos = child.end
+    return not _has_element(text, pos, text.rindex('<', pos, paragraph.end))
+
+
+def _has_element(text: str, start: int, end: int) -> bool:
+    """Whether an element starts in text[start:end]."""
+    return text.find('<', start, end) != -1 and any(m.group('name') and not m.group('close') for m in MARKUP_RE.finditer(text, start, end))
+
+
+def _transform_stats(tokens: int = 0) -> dict:
+    return {'tables': 0, 'signature_tables': 0, 'drawings_removed': 0,
+            'shading_removed': 0, 'sections': 0, 'footer_refs_added': 0,
+            'empty_paragraphs_removed': 0, 'markup_tokens': tokens, 'splices': 0}
+
+
+def _table_edits(index: ElementIndex, table: IndexedElement, stats: dict) -> tuple[list, list]:
+    """
+    Signature-table cleaning of one outermost table.
+
+    Returns:
+        (cleaning splices, splices for the document): the drawings and
+        FCE9D9 shading of the table, and the same list if the table
+        mentions COMPANY (otherwise nothing)
+    """
+    drawings = index.outermost('drawing', within=table)
+    shading = [el for el in index.select('shd', within=table)
+               if index.ancestor(el, 'drawing', table) is None
+               and el.attribute(W_NS, 'fill') == SIGNATURE_SHADING]
+    cleaning = [(el.start, el.end, '') for el in drawings + shading]
+    stats['tables'] += 1
+    if 'COMPANY' not in index.markup(table):
+        return cleaning, []
+    if drawings:
+        stats['signature_tables'] += 1
+    stats['drawings_removed'] += len(drawings)
+    stats['shading_removed'] += len(shading)
+    return cleaning, cleaning
+
+
+def _section_edits(index: ElementIndex, footer_rid: str, stats: dict,
+                   w_prefix: str, r_prefix: str | None, sections: list = None) -> list[tuple[int, int, str]]:
+    """
+    Footer reference (after the first header reference) and margins for
+    every section: a w:sectPr in a w:pPr or w:body, or the root of an
+    indexed fragment. Each section touched is described in sections, if given.
+    """
+    text = index.text
+    splices = []
+    for sectpr in index.select('sectPr'):
+        if sectpr.parent is None:
+            if sectpr.depth:
+                continue
+        elif not (sectpr.direct and (sectpr.parent.is_w('pPr') or sectpr.parent.is_w('body'))):
+            continue
+        stats['sections'] += 1
+        children = index.children(sectpr)
+        headers = [el for el in children if el.is_w('headerReference')]
+        margins = [(el.start, el.end, margin_tag(w_prefix)) for el in children if el.is_w('pgMar')]
+        splices.extend(margins)
+        footer_reference = not any(el.is_w('footerReference') for el in children)
+        if sections is not None and (margins or footer_reference):
+            sections.append({'start': sectpr.start, 'end': sectpr.end, 'margins': len(margins),
+                             'footer_reference': footer_reference})
+        if footer_reference:
+            reference = footer_reference_tag(footer_rid, w_prefix, r_prefix)
+            if sectpr.tag_end == sectpr.end:
+                # <w:sectPr/>: expand it so the reference goes inside
+                name = MARKUP_RE.match(text, sectpr.start).group('name')
+                splices.append((sectpr.start, sectpr.end,
+                                text[sectpr.start:sectpr.end - 2] + '>' + reference + f'</{name}>'))
+            else:
+                insert_at = WHITESPACE_RE.match(text, headers[0].end).end() if headers else sectpr.tag_end
+                splices.append((insert_at, insert_at, reference))
+            stats['footer_refs_added'] += 1
+    return splices
+
+
+def plan_document(document_content: str, footer_rid: str) -> dict:
     """
-    # Find all tables
-    tables = list(re.finditer(r'<w:tbl>.*?</w:tbl>', document_content, re.DOTALL))
+    Work out every document.xml edit against one element index, without
+    applying any.
+
+    The markup is indexed once (see index_document), so nested tables are
+    matched correctly, and all edits are collected as splices to apply in
+    a single join (see transform_document):
 
+    1. Drawings and FCE9D9 cell shading are removed from every table that
+       mentions COMPANY (the signature tables)
+    2. The last table is lifted out of the document; its cleaned copy is
+       returned as the footer table
+    3. Every section (w:sectPr) gets a footerReference and NEW_MARGINS
+    4. Runs of empty paragraphs around the lifted table and at the end of
+       the body are trimmed to MAX_EMPTY_PARAGRAPHS
+
+    Returns:
+        {'splices': [(start, end, replacement)] in document.xml,
+         'footer_table': the cleaned footer table XML, 'stats': counts,
+         'edits': {'tables', 'sections', 'empty_paragraphs'}}, where edits
+        describes what is touched (character offsets into document.xml):
+        each outermost table (drawings and shading removed, whether it is a
+        signature table and whether it is lifted into the footer), each
+        section whose margins or footer reference change, and each empty
+        paragraph dropped as [start, end]
+    """
+    text = document_content
+    index = index_document(text)
+    splices = []
+    stats = _transform_stats(index.tokens)
+    edits = {'tables': [], 'sections': [], 'empty_paragraphs': []}
+
+    tables = []             # (start, end, cleaning splices) of outermost tables
+    for table in index.outermost('tbl'):
+        drawings, shading = stats['drawings_removed'], stats['shading_removed']
+        cleaning, document_edits = _table_edits(index, table, stats)
+        splices.extend(document_edits)
+        tables.append((table.start, table.end, cleaning))
+        edits['tables'].append({'start': table.start, 'end': table.end, 'signature': bool(document_edits),
+                                'drawings': stats['drawings_removed'] - drawings,
+                                'shading': stats['shading_removed'] - shading, 'lifted': False})
     if not tables:
         raise ValueError("No tables found in document")
 
-    last_table_match = tables[-1]
-    table_xml = last_table_match.group(0)
+    splices.extend(_section_edits(index, footer_rid, stats, index.w_prefix, index.r_prefix, edits['sections']))
+
+    # Lift the last table out of the document; its cleaned copy is the footer table
+    table_start, table_end, cleaning = tables[-1]
+    splices.append((table_start, table_end, ''))
+    edits['tables'][-1]['lifted'] = True
+    footer_table = apply_splices(text[table_start:table_end],
+                                 [(s - table_start, e - table_start, r) for s, e, r in cleaning])
+
+    # Trim empty-paragraph runs around the lifted table and at the end of the body
+    body_items = []         # (kind, start, end) of body children
+    for body in index.select('body'):
+        for el in index.children(body):
+            kind = ('empty' if is_empty_paragraph(index, el) else 'p') if el.is_w('p') else el.local
+            body_items.append((kind, el.start, el.end))
+    items = [item for item in body_items if item[1:] != (table_start, table_end)]
+    run_ends = [len(items) - 1 if items and items[-1][0] == 'sectPr' else len(items)]
+    if len(items) < len(body_items):
+        run_ends.append(next((i for i, item in enumerate(items) if item[1] >= table_end), len(items)))
+
+    dropped = set()
+    for run_end in run_ends:
+        run_start = run_end
+        while run_start > 0 and items[run_start - 1][0] == 'empty':
+            run_start -= 1
+        while run_end < len(items) and items[run_end][0] == 'empty':
+            run_end += 1
+        dropped.update(range(run_start, run_end - MAX_EMPTY_PARAGRAPHS))
+    for i in sorted(dropped):
+        splices.append((items[i][1], items[i][2], ''))
+        edits['empty_paragraphs'].append([items[i][1], items[i][2]])
+    stats['empty_paragraphs_removed'] = len(dropped)
+    stats['splices'] = len(splices)
+
+    return {'splices': splices, 'footer_table': footer_table, 'stats': stats, 'edits': edits}
+
+
+def transform_document(document_content: str, footer_rid: str) -> tuple[str, str, dict]:
+    """
+    Apply every document.xml edit of the footer pass (see plan_document).
 
-    # Find position to cut - include some empty paragraphs before table
-    start_pos = last_table_match.start()
+    Returns:
+        (document_xml, footer_table_xml, stats)
+    """
+    plan = plan_document(document_content, footer_rid)
+    return apply_splices(document_content, plan['splices']), plan['footer_table'], plan['stats']
 
-    # Look for empty paragraphs before the table (keep 2 max)
-    # Find the section of content before the table
-    before_table = document_content[:start_pos]
 
-    # Find where to cut (remove excessive empty paragraphs)
-    # Pattern for empty paragraph
-    empty_para_pattern = r'<w:p[^>]*>(?:<w:pPr>(?:<w:spacing[^/]*/?>)?</w:pPr>)?</w:p>'
+# Text held back by the low-memory engine stays in memory up to this many
+# characters per spool before it is moved to a temporary file
+SPOOL_MEMORY = 1 << 20
 
-    # Find consecutive empty paragraphs before the table
-    matches = list(re.finditer(empty_para_pattern, before_table))
 
-    if len(matches) >= 2:
-        # Find consecutive empty paragraphs at the end
-        consecutive_start = None
-        for i in range(len(matches) - 1, -1, -1):
-            match = matches[i]
-            # Check if this paragraph is at the end of before_table
-            if match.end() == len(before_table) or \
-               (i < len(matches) - 1 and matches[i + 1].start() == match.end()):
-                consecutive_start = i
-            else:
-                break
-
-        if consecutive_start is not None:
-            num_consecutive = len(matches) - consecutive_start
-            if num_consecutive > 2:
-                # Remove all but 2 empty paragraphs
-                keep_from = matches[consecutive_start + num_consecutive - 2].start()
-                before_table = before_table[:keep_from] + before_table[matches[consecutive_start].start():]
-                before_table = document_content[:matches[consecutive_start].start()]
-
-    # Also remove the table itself
-    end_pos = last_table_match.end()
-
-    # Find content before excessive empty paragraphs
-    # Look for the last non-empty content
-    content_before = document_content[:start_pos]
-
-    # Find and count trailing empty paragraphs
-    trailing_empty = []
-    pos = len(content_before)
-    while pos > 0:
-        # Try to match empty paragraph ending at pos
-        match = re.search(r'<w:p[^>]*>(?:<w:pPr>[^<]*(?:<[^/][^>]*/>)*</w:pPr>)?</w:p>$', content_before[:pos])
-        if match and match.end() == pos:
-            trailing_empty.insert(0, (match.start(), match.end()))
-            pos = match.start()
+def _unterminated(buffer: str, start: int) -> bool:
+    """Whether a comment or CDATA section at start lacks its terminator in buffer."""
+    for opening, terminator in (('<!--', '-->'), ('<![CDATA[', ']]>')):
+        if buffer.startswith(opening, start):
+            return buffer.find(terminator, start + len(opening)) < 0
+    return False
+
+
+class _Spool:
+    """Text held back by _BodyStream: in memory up to SPOOL_MEMORY, then in a temporary file."""
+
+    __slots__ = ('file',)
+
+    def __init__(self):
+        self.file = None
+
+    def write(self, text: str) -> None:
+        if self.file is None:
+            self.file = tempfile.SpooledTemporaryFile(max_size=SPOOL_MEMORY, mode='w+', encoding='utf-8',
+                                                      newline='')
+        self.file.write(text)
+
+    def drain(self, write: Callable[[str], None]) -> None:
+        """Pass the held text on to write and discard it."""
+        if self.file is None:
+            return
+        self.file.seek(0)
+        while chunk := self.file.read(ZipWriter.CHUNK_SIZE):
+            write(chunk)
+        self.close()
+
+    def close(self) -> None:
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+class _EmptyRun:
+    """
+    A run of empty paragraphs, each with the text (gap) before it.
+
+    The last MAX_EMPTY_PARAGRAPHS are kept in memory; older ones can only be
+    dropped or written unchanged, so they are spooled as gap NUL paragraph
+    NUL (NUL cannot occur in XML).
+    """
+
+    __slots__ = ('count', 'tail', 'spool')
+
+    def __init__(self):
+        self.count = 0
+        self.tail = []
+        self.spool = _Spool()
+
+    def add(self, gap: str, text: str) -> None:
+        self.count += 1
+        self.tail.append((gap, text))
+        if len(self.tail) > MAX_EMPTY_PARAGRAPHS:
+            self.spool.write('\0'.join(self.tail.pop(0)) + '\0')
+
+    def drain(self, write: Callable[[str], None]) -> None:
+        """Pass the whole run on to write (it is not trimmed)."""
+        self.spool.drain(lambda chunk: write(chunk.replace('\0', '')))
+        for gap, text in self.tail:
+            write(gap)
+            write(text)
+
+    def drain_gaps(self, write: Callable[[str], None]) -> None:
+        """Pass on only the gaps of the spooled paragraphs, dropping the paragraphs."""
+        field = 0
+
+        def gaps(chunk: str) -> None:
+            nonlocal field
+            for i, piece in enumerate(chunk.split('\0')):
+                if not (field + i) % 2:
+                    write(piece)
+            field += chunk.count('\0')
+
+        self.spool.drain(gaps)
+
+
+class _BodyStream:
+    """
+    Orders the edited body children of a streamed document.xml.
+
+    Makes the same decisions as transform_document while holding back only
+    the children those decisions may still change: the last table seen (it
+    is lifted unless another table follows) with the empty-paragraph runs
+    on either side of it, everything after it (spooled), and the run and
+    sectPr at the end, which are trimmed if the body ends there. Every child
+    comes with the text before it (its gap), which stays in place when the
+    child is dropped.
+    """
+
+    def __init__(self, write: Callable[[str], None]):
+        self.write = write
+        # Held children: ['run', _EmptyRun], ['text', _Spool], ['sectPr', markup],
+        # ['tbl', gap, markup, cleaned copy]
+        self.items = []
+        self.table = None           # the held table item
+        self.dropped = 0
+
+    def add(self, kind: str, gap: str, text: str, footer_table: str = None) -> None:
+        """Add a body child of kind 'tbl', 'sectPr', 'empty' or 'other'."""
+        items = self.items
+        if kind == 'empty':
+            if not items or items[-1][0] != 'run':
+                items.append(['run', _EmptyRun()])
+            items[-1][1].add(gap, text)
+            return
+        if kind == 'tbl':
+            # Another table follows, so a held one stays in the document
+            self._flush(self._tail_start(len(items)))
+            self.table = ['tbl', gap, text, footer_table]
+            items.append(self.table)
+            return
+        if kind == 'sectPr':
+            items.append(['sectPr', gap + text])
+        else:
+            if not items or items[-1][0] != 'text':
+                items.append(['text', _Spool()])
+            items[-1][1].write(gap + text)
+        if self.table is None:
+            self._flush(self._tail_start(len(items)))
         else:
-            break
+            self._compact()
+
+    def _tail_start(self, end: int) -> int:
+        """
+        Start of the items a table (or the end of the body) at end may trim:
+        the run right before it, or a sectPr right before it and the run
+        before that sectPr.
+        """
+        items = self.items
+        if end and items[end - 1][0] == 'run':
+            return end - 1
+        if end and items[end - 1][0] == 'sectPr':
+            end -= 1
+            if end and items[end - 1][0] == 'run':
+                end -= 1
+        return end
+
+    def _emit(self, item: list, write: Callable[[str], None]) -> None:
+        """Write a held item unchanged."""
+        if item[0] in ('run', 'text'):
+            item[1].drain(write)
+        elif item[0] == 'tbl':
+            write(item[1])
+            write(item[2])
+        else:
+            write(item[1])
+
+    def _flush(self, end: int) -> None:
+        for item in self.items[:end]:
+            self._emit(item, self.write)
+        del self.items[:end]
+
+    def _compact(self) -> None:
+        """Merge everything between the held table's neighbours and the tail into one spool."""
+        items = self.items
+        t = items.index(self.table)
+        lo = t + 2 if t + 1 < len(items) and items[t + 1][0] == 'run' else t + 1
+        hi = self._tail_start(len(items))
+        if hi - lo < 1 or (hi - lo == 1 and items[lo][0] == 'text'):
+            return
+        if items[lo][0] != 'text':
+            items.insert(lo, ['text', _Spool()])
+            hi += 1
+        spool = items[lo][1]
+        for item in items[lo + 1:hi]:
+            self._emit(item, spool.write)
+        del items[lo + 1:hi]
+
+    def _trim(self, *members: _EmptyRun | str) -> None:
+        """Write runs (and gaps between them) as one run trimmed to its last MAX_EMPTY_PARAGRAPHS."""
+        total = sum(member.count for member in members if isinstance(member, _EmptyRun))
+        dropping = total - min(total, MAX_EMPTY_PARAGRAPHS)
+        self.dropped += dropping
+        for member in members:
+            if isinstance(member, str):
+                self.write(member)
+                continue
+            # Spooled paragraphs precede the last MAX_EMPTY_PARAGRAPHS, so they all go
+            member.drain_gaps(self.write)
+            dropping -= member.count - len(member.tail)
+            for gap, text in member.tail:
+                self.write(gap)
+                if dropping:
+                    dropping -= 1
+                else:
+                    self.write(text)
+
+    def finish(self) -> str:
+        """Write out everything held, lifting the last table; returns its cleaned copy."""
+        if self.table is None:
+            raise ValueError("No tables found in document")
+        items = self.items
+        t = items.index(self.table)
+        lo = t - 1 if t and items[t - 1][0] == 'run' else t
+        hi = t + 2 if t + 1 < len(items) and items[t + 1][0] == 'run' else t + 1
+        # The runs either side of the lifted table (and its gap) become one run
+        members = [item[1] for item in items[lo:t]] + [self.table[1]] + [item[1] for item in items[t + 1:hi]]
+        items[lo:hi] = [['trim', members, hi - lo - 1]]
+
+        # The run before the last child (or before a final sectPr) is trimmed too
+        last = len(items) - 1
+        if items[last][0] == 'trim' and not items[last][2]:
+            last -= 1
+        if last >= 0 and items[last][0] == 'sectPr':
+            last -= 1
+        if last >= 0 and items[last][0] == 'run':
+            items[last] = ['trim', [items[last][1]], 1]
+
+        for item in items:
+            if item[0] == 'trim':
+                self._trim(*item[1])
+            else:
+                self._emit(item, self.write)
+        self.items = []
+        return self.table[3]
 
-    # Keep only 2 empty paragraphs
-    if len(trailing_empty) > 2:
-        cut_pos = trailing_empty[0][0]  # Remove all
-        keep_paras = content_before[trailing_empty[-2][0]:trailing_empty[-1][1]]
-        content_before = content_before[:cut_pos]
-    else:
-        keep_paras = ''
 
-    # Rebuild document without the table
-    document_without_table = content_before + keep_paras + document_content[end_pos:]
+class _TextSink:
+    """Collects output text and passes it on UTF-8 encoded, in pieces of about CHUNK_SIZE."""
+
+    def __init__(self, write: Callable[[bytes], None]):
+        self._write = write
+        self.pieces = []
+        self.size = 0
+
+    def __call__(self, text: str) -> None:
+        self.pieces.append(text)
+        self.size += len(text)
+        if self.size >= ZipWriter.CHUNK_SIZE:
+            self.flush()
 
-    return table_xml, document_without_table
+    def flush(self) -> None:
+        if self.pieces:
+            self._write(''.join(self.pieces).encode('utf-8'))
+            self.pieces = []
+            self.size = 0
 
 
-def remove_images_from_all_signature_tables(document_content: str) -> str:
+def _edit_block(text: str, namespaces: dict[str, str], prefixes: tuple[str, str | None],
+                footer_rid: str, stats: dict) -> tuple[str, str, str | None]:
+    """
+    Apply the transform_document edits to one body child.
+
+    Returns:
+        (kind, edited markup, cleaned copy): kind is 'tbl', 'sectPr', 'empty'
+        (an empty paragraph) or 'other'; the cleaned copy of a table is what
+        the footer gets if it is lifted
+    """
+    index = index_document(text, namespaces)
+    root = index.elements[0] if index.elements and index.elements[0].start == 0 else None
+    splices = []
+    root_cleaning = None
+    for table in index.outermost('tbl'):
+        cleaning, edits = _table_edits(index, table, stats)
+        splices.extend(edits)
+        if table is root:
+            root_cleaning = cleaning
+    splices.extend(_section_edits(index, footer_rid, stats, *prefixes))
+    stats['splices'] += len(splices)
+
+    kind = 'other'
+    if root is not None:
+        if root.is_w('tbl'):
+            return 'tbl', apply_splices(text, splices), apply_splices(text, root_cleaning)
+        if root.is_w('sectPr'):
+            kind = 'sectPr'
+        elif root.is_w('p') and is_empty_paragraph(index, root):
+            kind = 'empty'
+    return kind, apply_splices(text, splices), None
+
+
+class _BodyScanner:
     """
-    Find all signature tables and remove drawing elements (images) and cell shading from them.
-    Signature tables are identified by containing 'COMPANY' text.
+    Splits a document.xml stream into the children of w:body.
+
+    The part is decoded and tokenized chunk by chunk, and only the body
+    child being read is held in memory. Namespace declarations on the
+    elements above the body are tracked, so ns, the w and r prefixes
+    (prefixes) and whether element names can be matched as plain strings
+    (plain_names: only prefixes[0] is bound to the w namespace) are current
+    for every child. This is the reading half of stream_document and all of
+    iter_body_children. With root set, the children of the root element are
+    split out instead, for parts without a w:body (see iter_root_children).
     """
-    def clean_signature_table_match(match):
-        table_xml = match.group(0)
 
-        # Check if this is a signature table (contains COMPANY)
-        if 'COMPANY' not in table_xml:
-            return table_xml  # Not a signature table, leave unchanged
+    def __init__(self, stream, monitor: MemoryMonitor = None, root: bool = False):
+        self.stream = stream
+        self.monitor = monitor
+        self.root = root
+        self.ns = {}
+        self.prefixes = ('w', 'r')
+        self.plain_names = True
+        self.tokens = 0
+
+    def events(self):
+        """
+        Read the part.
+
+        Yields:
+            ('text', markup) for everything else up to and including
+            <w:body>, and after </w:body>;
+            ('child', gap, name, markup, empty) for every w:body child, with
+            the text and comments before it (its gap); empty is set for a
+            paragraph whose children are w:pPr elements holding only
+            EMPTY_PARAGRAPH_PROPERTIES (a hint: markup with a namespace
+            declaration, or when plain_names is not set, needs a real check);
+            ('end', gap, markup) for </w:body>
+
+        Raises:
+            ValueError: If the markup is unbalanced
+        """
+        decoder = codecs.getincrementaldecoder('utf-8')()
+        ns = self.ns
+        p_name, ppr_name = 'w:p', 'w:pPr'
+        plain_ppr_names = frozenset(f'w:{local}' for local in EMPTY_PARAGRAPH_PROPERTIES)
+        depth = 0               # open elements outside the body child being read
+        in_body = False
+        body_seen = False
+        block = None            # pieces of the open body child read before the current buffer
+        block_start = 0         # offset of the rest of it in the buffer
+        block_depth = 0
+        block_name = None
+        block_empty = False     # named w:p, every child named w:pPr and only plain_ppr_names in those
+        gap = []                # text and comments since the last body child
+        tokens = 0
+
+        buffer = ''
+        pos = 0                 # end of the last token consumed
+        eof = False
+        while not eof:
+            if self.monitor is not None:
+                self.monitor.sample()
+            chunk = self.stream.read(ZipWriter.CHUNK_SIZE)
+            eof = not chunk
+            if block is not None:
+                block.append(buffer[block_start:pos])
+                block_start = 0
+            buffer = buffer[pos:] + decoder.decode(chunk, final=eof)
+            pos = 0
+
+            for m in MARKUP_RE.finditer(buffer):
+                token_start, token_end = m.span()
+                name, close, empty = m.group('name', 'close', 'empty')
+                if name is None and not eof and _unterminated(buffer, token_start):
+                    break           # a comment or CDATA section continues in the next chunk
+                text_start, pos = pos, token_end
+                tokens += 1
+
+                if block is not None:
+                    if name is None:
+                        continue
+                    if close:
+                        block_depth -= 1
+                        if block_depth:
+                            continue
+                    else:
+                        if block_empty and (name not in plain_ppr_names if block_depth == 2
+                                            else block_depth == 1 and name != ppr_name):
+                            block_empty = False
+                        if not empty:
+                            block_depth += 1
+                        continue
+                elif in_body:
+                    gap.append(buffer[text_start:token_start])
+                    if name is None:
+                        gap.append(m.group())
+                        continue
+                    if close:
+                        in_body = False
+                        depth -= 1
+                        yield 'end', ''.join(gap), m.group()
+                        gap = []
+                        continue
+                    block, block_start, block_name, block_empty = [], token_start, name, name == p_name
+                    if not empty:
+                        block_depth = 1
+                        continue
+                else:
+                    yield 'text', buffer[text_start:token_end]
+                    if name is None:
+                        continue
+                    if close:
+                        if not depth:
+                            raise ValueError(f'Unbalanced document.xml: unexpected </{name}>')
+                        depth -= 1
+                        continue
+                    attrs = m.group('attrs')
+                    if 'xmlns' in attrs and depth <= 1:
+                        ns = self.ns = dict(ns)
+                        for prefix, dq, sq in XMLNS_RE.findall(attrs):
+                            ns[prefix] = dq or sq
+                        if not depth:
+                            by_uri = {uri: prefix for prefix, uri in ns.items()}
+                            self.prefixes = (by_uri.get(W_NS, 'w'), by_uri.get(R_NS))
+                        w_prefix = self.prefixes[0]
+                        p_name, ppr_name = (f'{w_prefix}:p', f'{w_prefix}:pPr') if w_prefix else ('p', 'pPr')
+                        plain_ppr_names = frozenset(f'{w_prefix}:{local}' if w_prefix else local
+                                                    for local in EMPTY_PARAGRAPH_PROPERTIES)
+                        self.plain_names = list(ns.values()).count(W_NS) == 1 and ns.get(w_prefix) == W_NS
+                    if not empty:
+                        depth += 1
+                        if not body_seen and depth == (1 if self.root else 2):
+                            prefix, _, local = name.rpartition(':')
+                            if self.root or local == 'body' and ns.get(prefix) == W_NS:
+                                in_body = body_seen = True
+                    continue
+
+                # A body child is complete
+                text = ''.join(block) + buffer[block_start:token_end] if block else buffer[block_start:token_end]
+                block = None
+                yield 'child', ''.join(gap), block_name, text, block_empty
+                gap = []
+
+        if block is not None or depth:
+            raise ValueError('Unbalanced document.xml: the part ends inside an element')
+        self.tokens = tokens
+        yield 'text', buffer[pos:]
+
+
+def stream_document(stream, write: Callable[[bytes], None], footer_rid: str,
+                    monitor: MemoryMonitor = None) -> tuple[str, dict]:
+    """
+    transform_document for a document.xml read from and written to streams.
 
-        # Remove all drawing elements (signature images)
-        cleaned = re.sub(r'<w:drawing>.*?</w:drawing>', '', table_xml, flags=re.DOTALL)
+    The part is read one w:body child at a time (see _BodyScanner). Each
+    child is edited on its own (see _edit_block) and handed to a
+    _BodyStream, which writes it out unless it may still be lifted or
+    trimmed; everything outside the body passes straight through. Memory is
+    bounded by the largest body child plus what _BodyStream holds back
+    beyond SPOOL_MEMORY, instead of several copies of the whole part.
 
-        # Remove cell shading with FCE9D9 color
-        cleaned = re.sub(r'<w:shd[^>]*w:fill="FCE9D9"[^>]*/>', '', cleaned)
+    Children that cannot need an edit (no table, sectPr or namespace
+    declaration in them) are classified from the scan alone, without
+    being indexed again.
 
-        return cleaned
+    Args:
+        stream: Binary file object of the source document.xml
+        write: Receives the output bytes
+        footer_rid: Relationship id of the footer part
+        monitor: Optional MemoryMonitor sampled for every chunk read
 
-    # Process all tables
-    result = re.sub(r'<w:tbl>.*?</w:tbl>', clean_signature_table_match, document_content, flags=re.DOTALL)
+    Returns:
+        (footer_table_xml, stats), as from transform_document
 
-    return result
+    Raises:
+        ValueError: If the markup is unbalanced or has no table
+    """
+    stats = _transform_stats()
+    sink = _TextSink(write)
+    body = _BodyStream(sink)
+    scanner = _BodyScanner(stream, monitor)
+    footer_table = None
+    for event in scanner.events():
+        if event[0] == 'text':
+            sink(event[1])
+        elif event[0] == 'child':
+            _, gap, _, text, empty = event
+            if scanner.plain_names and 'tbl' not in text and 'sectPr' not in text and 'xmlns' not in text:
+                body.add('empty' if empty else 'other', gap, text)
+            else:
+                kind, edited, cleaned = _edit_block(text, scanner.ns, scanner.prefixes, footer_rid, stats)
+                body.add(kind, gap, edited, cleaned)
+        else:
+            # </w:body>: everything held back is decided now
+            footer_table = body.finish()
+            sink(event[1])
+            sink(event[2])
 
+    if footer_table is None:
+        raise ValueError("No tables found in document")
+    sink.flush()
+    stats['markup_tokens'] = scanner.tokens
+    stats['empty_paragraphs_removed'] = body.dropped
+    stats['splices'] += body.dropped + 1        # and the lifted table
+    return footer_table, stats
 
-def clean_signature_table(table_xml: str) -> str:
+
+def iter_body_children(stream, monitor: MemoryMonitor = None):
     """
-    Clean the signature table:
-    1. Remove drawing elements (signature images)
-    2. Remove cell shading (FCE9D9)
+    Read the children of w:body from a document.xml stream, one at a time.
+
+    Only the body child being read is held in memory (see _BodyScanner).
+
+    Args:
+        stream: Binary file object of the source document.xml
+        monitor: Optional MemoryMonitor sampled for every chunk read
+
+    Yields:
+        (local name, markup, namespaces in scope) for every w:body child
+
+    Raises:
+        ValueError: If the markup is unbalanced
     """
-    # Remove all drawing elements (signature images)
-    # Pattern: <w:drawing>...</w:drawing>
-    cleaned = re.sub(r'<w:drawing>.*?</w:drawing>', '', table_xml, flags=re.DOTALL)
+    scanner = _BodyScanner(stream, monitor)
+    for event in scanner.events():
+        if event[0] == 'child':
+            yield event[2].rpartition(':')[2], event[3], scanner.ns
 
-    # Remove cell shading with FCE9D9 color
-    # Pattern: <w:shd w:val="clear" w:color="auto" w:fill="FCE9D9"/>
-    cleaned = re.sub(r'<w:shd[^>]*w:fill="FCE9D9"[^>]*/>', '', cleaned)
 
-    return cleaned
+def iter_root_children(stream):
+    """iter_body_children for any XML part: the children of its root element."""
+    scanner = _BodyScanner(stream, root=True)
+    for event in scanner.events():
+        if event[0] == 'child':
+            yield event[2].rpartition(':')[2], event[3], scanner.ns
 
 
 def create_footer_xml(table_xml: str) -> str:
@@ -255,7 +1818,7 @@ def update_content_types(content_types_xml: str) -> str:
         return content_types_xml
 
     # Add footer override before the closing </Types> tag
-    footer_override = '<Override PartName="/word/footer1.xml" ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.footer+xml"/>'
+    footer_override = f'<Override PartName="/word/footer1.xml" ContentType="{FOOTER_CONTENT_TYPE}"/>'
 
     return content_types_xml.replace('</Types>', footer_override + '</Types>')
 
@@ -272,238 +1835,1325 @@ def update_document_rels(rels_content: str, footer_rid: str) -> str:
     return rels_content.replace('</Relationships>', footer_rel + '</Relationships>')
 
 
-def update_sectpr_elements(document_content: str, footer_rid: str) -> str:
+# Transform passes by name; each one edits a DocxPackage in place
+PASSES: dict[str, Callable[[DocxPackage], None]] = {}
+
+# Passes run by process_docx when none are given
+DEFAULT_PASSES = ('footer',)
+
+# Variants of passes that process_docx runs instead in low-memory mode
+STREAMING_PASSES: dict[str, Callable[[DocxPackage], None]] = {}
+
+
+def register_pass(name: str, streaming: bool = False):
+    """Decorator registering a transform pass (or its low-memory variant) under name."""
+    def decorator(func):
+        (STREAMING_PASSES if streaming else PASSES)[name] = func
+        return func
+    return decorator
+
+
+# Rendered footer parts by SHA-256 of their cleaned signature table, shared
+# by every report a (worker) process handles: reports signed by the same
+# people get the same footer, which is then rendered and compressed once
+_FOOTER_CACHE: dict[str, EncodedPart] = {}
+FOOTER_CACHE_SIZE = 64
+
+
+def _footer_package_parts(package: DocxPackage) -> str:
+    """Register footer1.xml in the content types and document rels; returns its rId."""
+    with package.tracer.stage('footer.package_parts'):
+        content_types = package.read(CONTENT_TYPES_PART)
+        package.write(CONTENT_TYPES_PART, update_content_types(content_types))
+
+        rels_content = package.read(DOCUMENT_RELS_PART)
+        footer_rid = find_next_rid(rels_content)
+        package.write(DOCUMENT_RELS_PART, update_document_rels(rels_content, footer_rid))
+    return footer_rid
+
+
+def _render_footer(package: DocxPackage, table_xml: str) -> EncodedPart:
+    """The footer part for a cleaned signature table, from _FOOTER_CACHE if possible."""
+    with package.tracer.stage('footer.render'):
+        key = hashlib.sha256(table_xml.encode('utf-8')).hexdigest()
+        footer = _FOOTER_CACHE.get(key)
+        cache_result = 'hit' if footer is not None else 'miss'
+        if footer is None:
+            if len(_FOOTER_CACHE) >= FOOTER_CACHE_SIZE:
+                _FOOTER_CACHE.pop(next(iter(_FOOTER_CACHE)))
+            footer = _FOOTER_CACHE[key] = EncodedPart(create_footer_xml(table_xml))
+    package.tracer.count(f'footer_cache.{cache_result}')
+    package.stats['footer_cache'] = cache_result
+    return footer
+
+
+def _record_footer_stats(package: DocxPackage, footer_rid: str, edit_stats: dict) -> None:
+    package.tracer.count('regex.markup_tokens', edit_stats['markup_tokens'])
+    package.tracer.count('splices', edit_stats['splices'])
+    package.stats['footer_rid'] = footer_rid
+    package.stats['signature_tables'] = edit_stats['signature_tables']
+    package.stats['edits'] = edit_stats
+
+
+@register_pass('footer')
+def footer_pass(package: DocxPackage) -> None:
     """
-    Update all sectPr elements:
-    1. Add footerReference
-    2. Update margins
+    Move the last signature table into a native footer and fix the layout.
+
+    Cleans every signature table, lifts the last table into footer1.xml,
+    references that footer from every section, applies NEW_MARGINS and
+    trims excessive empty paragraphs (see transform_document).
     """
-    def replace_sectpr(match):
-        sectpr = match.group(0)
+    footer_rid = _footer_package_parts(package)
 
-        # Check if footer reference already exists
-        if 'w:footerReference' not in sectpr:
-            # Find position to insert footer reference (after header reference if exists)
-            header_match = re.search(r'(<w:headerReference[^/]*/>\s*)', sectpr)
-            if header_match:
-                insert_pos = header_match.end()
-                footer_ref = f'<w:footerReference w:type="default" r:id="{footer_rid}"/>'
-                sectpr = sectpr[:insert_pos] + footer_ref + sectpr[insert_pos:]
-            else:
-                # Insert after <w:sectPr...>
-                insert_pos = sectpr.find('>') + 1
-                footer_ref = f'<w:footerReference w:type="default" r:id="{footer_rid}"/>'
-                sectpr = sectpr[:insert_pos] + footer_ref + sectpr[insert_pos:]
+    with package.tracer.stage('footer.transform'):
+        document_content, table_xml, edit_stats = transform_document(package.read(DOCUMENT_PART), footer_rid)
+        package.write(DOCUMENT_PART, document_content)
+    _record_footer_stats(package, footer_rid, edit_stats)
+    package.write_encoded(FOOTER_PART, _render_footer(package, table_xml))
 
-        # Update margins
-        margin_pattern = r'<w:pgMar[^/]*/>'
-        new_margin = f'<w:pgMar w:top="{NEW_MARGINS["top"]}" w:right="{NEW_MARGINS["right"]}" w:bottom="{NEW_MARGINS["bottom"]}" w:left="{NEW_MARGINS["left"]}" w:header="{NEW_MARGINS["header"]}" w:footer="{NEW_MARGINS["footer"]}" w:gutter="{NEW_MARGINS["gutter"]}"/>'
-        sectpr = re.sub(margin_pattern, new_margin, sectpr)
 
-        return sectpr
+def apply_footer_plan(package: DocxPackage, plan: dict) -> None:
+    """
+    footer_pass with document.xml edits worked out beforehand.
 
-    # Find and replace all sectPr elements
-    result = re.sub(r'<w:sectPr[^>]*>.*?</w:sectPr>', replace_sectpr, document_content, flags=re.DOTALL)
+    Args:
+        package: The report, with no footer1.xml yet
+        plan: plan_document's result for its document.xml plus the
+            'footer_rid' it was planned with (a plan_docx entry)
 
-    return result
+    Raises:
+        ValueError: If the package would give the footer another rId
+    """
+    footer_rid = _footer_package_parts(package)
+    if footer_rid != plan['footer_rid']:
+        raise ValueError(f"footer rId {footer_rid} differs from planned {plan['footer_rid']}")
+
+    with package.tracer.stage('footer.transform'):
+        package.write(DOCUMENT_PART, apply_splices(package.read(DOCUMENT_PART), plan['splices']))
+    _record_footer_stats(package, footer_rid, plan['stats'])
+    package.write_encoded(FOOTER_PART, _render_footer(package, plan['footer_table']))
+
+
+@register_pass('footer', streaming=True)
+def footer_stream_pass(package: DocxPackage) -> None:
+    """
+    footer_pass for low-memory mode.
+
+    document.xml is streamed from the source archive into the output while
+    it is written (see stream_document); footer1.xml, known only once the
+    whole part has been read, is added after it.
+    """
+    if DOCUMENT_PART in package.parts:
+        # An earlier pass already holds the whole part; streaming saves nothing
+        footer_pass(package)
+        return
 
+    footer_rid = _footer_package_parts(package)
+    if package.has(FOOTER_PART) and FOOTER_PART in package.source.NameToInfo:
+        package.remove(FOOTER_PART)
 
-def remove_empty_paragraphs_before_end(document_content: str) -> str:
-    """Remove excessive empty paragraphs before the document end, keeping max 2."""
-    # Find the last </w:body> tag
-    body_end = document_content.rfind('</w:body>')
-    if body_end == -1:
-        return document_content
+    def produce(write: Callable[[bytes], None]) -> dict[str, EncodedPart]:
+        with package.tracer.stage('footer.transform'), package.source.open(DOCUMENT_PART) as stream:
+            table_xml, edit_stats = stream_document(stream, write, footer_rid, package.monitor)
+        _record_footer_stats(package, footer_rid, edit_stats)
+        return {FOOTER_PART: _render_footer(package, table_xml)}
 
-    content_before_end = document_content[:body_end]
-    content_after = document_content[body_end:]
+    package.stream(DOCUMENT_PART, produce)
 
-    # Pattern for empty paragraph (may have spacing properties but no text)
-    empty_para_pattern = r'<w:p[^>]*>(?:<w:pPr>(?:<w:spacing[^/]*/?>|<w:rPr>[^<]*</w:rPr>|[^<])*</w:pPr>)?</w:p>\s*'
 
-    # Find trailing empty paragraphs
-    trailing_match = re.search(f'({empty_para_pattern})+$', content_before_end)
+# rsid and paragraph-id attributes: revision bookkeeping that never changes
+# how a header renders, but makes otherwise identical headers differ
+HEADER_NOISE_RE = re.compile(r'\s[\w.\-]+:(?:rsid\w*|paraId|textId)\s*=\s*"[^"]*"')
 
-    if trailing_match:
-        trailing_paras = trailing_match.group(0)
-        # Count empty paragraphs
-        empty_paras = re.findall(empty_para_pattern, trailing_paras)
+# Canonicalized headers by SHA-256 of their original text, shared by every
+# report a (worker) process handles, so each distinct variant is stripped once
+_HEADER_CACHE: dict[str, str] = {}
+HEADER_CACHE_SIZE = 64
 
-        if len(empty_paras) > 2:
-            # Keep only last 2
-            keep = ''.join(empty_paras[-2:])
-            content_before_end = content_before_end[:trailing_match.start()] + keep
 
-    return content_before_end + content_after
+def canonicalize_header(header_xml: str, tracer: Tracer = NULL_TRACER) -> str:
+    """Strip revision noise from a header part (memoized by content hash)."""
+    key = hashlib.sha256(header_xml.encode('utf-8')).hexdigest()
+    canonical = _HEADER_CACHE.get(key)
+    if canonical is None:
+        canonical, matches = HEADER_NOISE_RE.subn('', header_xml)
+        if len(_HEADER_CACHE) >= HEADER_CACHE_SIZE:
+            _HEADER_CACHE.pop(next(iter(_HEADER_CACHE)))
+        _HEADER_CACHE[key] = canonical
+        tracer.count('regex.header_noise', matches)
+    return canonical
 
 
-def process_docx(input_path: str, output_path: str = None) -> bool:
+def _header_parts(package: DocxPackage) -> dict[str, str]:
+    """Map the rId of every internal header relationship to its part name."""
+    rels = parse_relationships(package.read(DOCUMENT_RELS_PART))
+    return {rid: 'word/' + rel['target'].lstrip('/').removeprefix('word/')
+            for rid, rel in rels.items() if rel['type'] == 'header' and rel['mode'] == 'Internal'}
+
+
+@register_pass('shared-headers')
+def shared_headers_pass(package: DocxPackage) -> None:
+    """
+    Collapse identical header parts onto one shared part.
+
+    Headers whose canonical text (see canonicalize_header) and relationships
+    are identical are merged: every w:headerReference is pointed at the
+    first such part, and the duplicates are removed along with their .rels
+    part, their document relationship and their content-type override. The
+    header parts themselves are never rewritten, so the one kept is
+    raw-copied.
+
+    Only revision noise is ignored. The nine headers of the current reports
+    also differ in column widths and run formatting (126 distinct variants
+    across the 14 reports), which would change the rendered pages if they
+    were merged, so on those reports the pass collapses nothing.
+    """
+    header_parts = _header_parts(package)
+    canonical_part = {}         # (header hash, rels hash) -> part kept
+    redirect = {}               # rId of a duplicate -> rId of the part kept
+    part_rid = {}
+    for rid, name in sorted(header_parts.items(), key=lambda item: item[1]):
+        if not package.has(name):
+            continue
+        part_rid.setdefault(name, rid)
+        rels_name = rels_part_name(name)
+        rels = package.read(rels_name) if package.has(rels_name) else ''
+        key = (hashlib.sha256(canonicalize_header(package.read(name)).encode('utf-8')).digest(),
+               hashlib.sha256(rels.encode('utf-8')).digest())
+        kept = canonical_part.setdefault(key, name)
+        if kept != name:
+            redirect[rid] = part_rid[kept]
+
+    collapsed = sorted({header_parts[rid] for rid in redirect})
+    package.stats['shared_headers'] = {'parts': len(part_rid), 'collapsed': len(collapsed)}
+    if not redirect:
+        return
+
+    def repoint(match):
+        return RID_ATTR_RE.sub(lambda m: m.group(1) + redirect.get(m.group(2), m.group(2)) + m.group(3),
+                               match.group(0))
+
+    package.write(DOCUMENT_PART, HEADER_REFERENCE_RE.sub(repoint, package.read(DOCUMENT_PART)))
+
+    # Drop the duplicates' relationships, content-type overrides and parts
+    rels_content = package.read(DOCUMENT_RELS_PART)
+    relationships = parse_relationships(rels_content)
+    spans = [relationships[rid]['span'] + ('',) for rid in redirect]
+    package.write(DOCUMENT_RELS_PART, apply_splices(rels_content, spans))
+
+    removed_names = {'/' + name for name in collapsed}
+
+    def drop_override(match):
+        part = PART_NAME_RE.search(match.group(0))
+        return '' if part and part.group(1) in removed_names else match.group(0)
+
+    package.write(CONTENT_TYPES_PART, OVERRIDE_RE.sub(drop_override, package.read(CONTENT_TYPES_PART)))
+    for name in collapsed:
+        package.remove(name)
+        package.remove(rels_part_name(name))
+
+
+# Package folder of images and other media
+MEDIA_FOLDER = 'word/media/'
+
+# Smallest image the media-recompress pass re-encodes; below this the
+# saving is a few hundred bytes at most
+MEDIA_RECOMPRESS_BYTES = 16 * 1024
+
+# JPEG quality budget of media-recompress (IJG scale): quantization finer
+# than this quality is coarsened to it, coarser images are only re-coded
+MEDIA_JPEG_QUALITY = 85
+
+# Recompressed images by SHA-256 of the original (None when nothing was
+# gained), shared by every report a (worker) process handles, so an image
+# that ships in every report is encoded once
+_MEDIA_CACHE: dict[str, bytes | None] = {}
+MEDIA_CACHE_SIZE = 64
+
+TARGET_RE = re.compile(r'(\bTarget\s*=\s*)("[^"]*"|\'[^\']*\')')
+
+
+def _pillow():
+    """PIL.Image, or None when Pillow (an optional dependency) is not installed."""
+    try:
+        from PIL import Image
+    except ImportError:
+        return None
+    return Image
+
+
+def _jpeg_quantization(image_module, quality: int) -> int:
+    """Sum of the luminance quantization table Pillow writes at quality."""
+    import io
+
+    buffer = io.BytesIO()
+    image_module.new('L', (8, 8)).save(buffer, 'JPEG', quality=quality)
+    with image_module.open(buffer) as image:
+        return sum(image.quantization[0])
+
+
+def recompress_image(data: bytes, tracer: Tracer = NULL_TRACER) -> bytes | None:
+    """
+    A smaller encoding of a PNG or JPEG within MEDIA_JPEG_QUALITY (memoized
+    by content hash), or None if the image cannot be made smaller or
+    Pillow is not installed.
+
+    PNGs are re-encoded losslessly. A JPEG whose quantization is finer than
+    MEDIA_JPEG_QUALITY is re-encoded at that quality, a coarser one with its
+    own tables; both keep their chroma subsampling and get optimized
+    Huffman tables. Resolution, ICC profile and EXIF data are kept.
+    """
+    image_module = _pillow()
+    if image_module is None:
+        return None
+    import io
+
+    key = hashlib.sha256(data).hexdigest()
+    if key in _MEDIA_CACHE:
+        tracer.count('media_cache.hit')
+        return _MEDIA_CACHE[key]
+    tracer.count('media_cache.miss')
+    smaller = None
+    try:
+        with image_module.open(io.BytesIO(data)) as image:
+            keep = {field: image.info[field] for field in ('dpi', 'icc_profile', 'exif') if field in image.info}
+            buffer = io.BytesIO()
+            if image.format == 'PNG':
+                image.save(buffer, 'PNG', optimize=True, **keep)
+                smaller = buffer.getvalue()
+            elif image.format == 'JPEG' and image.mode in ('L', 'RGB'):
+                coarser = sum(image.quantization[0]) >= _jpeg_quantization(image_module, MEDIA_JPEG_QUALITY)
+                image.save(buffer, 'JPEG', quality='keep' if coarser else MEDIA_JPEG_QUALITY,
+                           subsampling='keep', optimize=True, progressive='progressive' in image.info, **keep)
+                smaller = buffer.getvalue()
+    except (OSError, ValueError, image_module.DecompressionBombError):
+        smaller = None
+    if smaller is not None and len(smaller) >= len(data):
+        smaller = None
+    if len(_MEDIA_CACHE) >= MEDIA_CACHE_SIZE:
+        _MEDIA_CACHE.pop(next(iter(_MEDIA_CACHE)))
+    _MEDIA_CACHE[key] = smaller
+    return smaller
+
+
+def _media_signature(package: DocxPackage, name: str) -> tuple[int, int]:
+    """(size, CRC-32) of a part, from the archive directory if it is unmodified."""
+    if name in package.parts:
+        data = package.read_bytes(name)
+        return len(data), zlib.crc32(data)
+    info = package.source.getinfo(name)
+    return info.file_size, info.CRC
+
+
+@register_pass('media')
+def media_pass(package: DocxPackage) -> None:
+    """
+    Drop media nothing references and merge identical media.
+
+    A media relationship whose rId no longer appears in its source part is
+    removed (the footer pass deletes signature drawings but not their
+    relationships), then every media part no relationship targets. Media
+    parts with the same bytes are merged onto the first: their
+    relationships are pointed at it and the copies removed. Only parts whose
+    size and CRC-32 match are hashed. In low-memory mode the document is
+    produced while the archive is written, so its relationships are kept.
+    """
+    from urllib.parse import quote
+
+    rels_names = [name for name in package.names() if name.endswith('.rels')]
+    targets = {}                # media part -> rels parts with a relationship to it
+    pruned = 0
+    for rels_name in rels_names:
+        source = relationship_source(rels_name)
+        rels_content = package.read(rels_name)
+        text = package.read(source) if package.has(source) and source not in package.streams else None
+        unreferenced = []
+        for rid, rel in parse_relationships(rels_content).items():
+            target = resolve_target(source, rel['target'])
+            if rel['mode'] == 'External' or not target.startswith(MEDIA_FOLDER):
+                continue
+            if text is not None and f'"{rid}"' not in text and f"'{rid}'" not in text:
+                unreferenced.append(rel['span'] + ('',))
+            else:
+                targets.setdefault(target, set()).add(rels_name)
+        if unreferenced:
+            package.write(rels_name, apply_splices(rels_content, unreferenced))
+            pruned += len(unreferenced)
+
+    media = [name for name in package.names() if name.startswith(MEDIA_FOLDER)]
+    unused = [name for name in media if name not in targets]
+
+    by_signature = {}
+    for name in sorted(targets.keys() & set(media)):
+        by_signature.setdefault(_media_signature(package, name), []).append(name)
+    redirect = {}               # duplicate part -> part kept
+    for names in by_signature.values():
+        if len(names) < 2:
+            continue
+        kept = {}
+        for name in names:
+            first = kept.setdefault(hashlib.sha256(package.read_bytes(name)).digest(), name)
+            if first != name:
+                redirect[name] = first
+
+    for rels_name in sorted({rels_name for name in redirect for rels_name in targets[name]}):
+        source = relationship_source(rels_name)
+        rels_content = package.read(rels_name)
+        splices = []
+        for rel in parse_relationships(rels_content).values():
+            target = resolve_target(source, rel['target'])
+            if rel['mode'] != 'External' and target in redirect:
+                kept = redirect[target]
+                new_target = ('/' + kept if rel['target'].startswith('/')
+                              else posixpath.relpath(kept, posixpath.dirname(source) or '.'))
+                start, end = rel['span']
+                element = TARGET_RE.sub(lambda m: f'{m.group(1)}"{quote(new_target)}"',
+                                        rels_content[start:end], count=1)
+                splices.append((start, end, element))
+        package.write(rels_name, apply_splices(rels_content, splices))
+
+    dropped = unused + sorted(redirect)
+    package.stats['media'] = {
+        'parts': len(media),
+        'relationships_pruned': pruned,
+        'unreferenced': len(unused),
+        'duplicates': len(redirect),
+        'bytes_removed': sum(package.size(name) for name in dropped),
+    }
+    if not dropped:
+        return
+
+    removed_names = {'/' + name for name in dropped}
+
+    def drop_override(match):
+        part = PART_NAME_RE.search(match.group(0))
+        return '' if part and part.group(1) in removed_names else match.group(0)
+
+    content_types = package.read(CONTENT_TYPES_PART)
+    pruned_types = OVERRIDE_RE.sub(drop_override, content_types)
+    if pruned_types != content_types:
+        package.write(CONTENT_TYPES_PART, pruned_types)
+    for name in dropped:
+        package.remove(name)
+
+
+@register_pass('media-recompress')
+def media_recompress_pass(package: DocxPackage) -> None:
+    """
+    Re-encode PNG and JPEG media of MEDIA_RECOMPRESS_BYTES or more with Pillow.
+
+    PNGs are recompressed losslessly; JPEGs get optimized Huffman tables and
+    quantization no finer than MEDIA_JPEG_QUALITY (see recompress_image). An
+    image is replaced only if that makes it smaller, and each distinct
+    image is encoded once per process. Pillow is optional: without it the
+    pass is skipped and says so in its statistics.
+    """
+    if _pillow() is None:
+        package.tracer.count('media.no_pillow')
+        package.stats['media_recompress'] = {'skipped': 'Pillow is not installed'}
+        return
+
+    recompressed = saved = 0
+    for name in package.names():
+        if not name.startswith(MEDIA_FOLDER) or package.size(name) < MEDIA_RECOMPRESS_BYTES:
+            continue
+        data = package.read_bytes(name)
+        smaller = recompress_image(data, package.tracer)
+        if smaller is not None:
+            package.write_bytes(name, smaller)
+            recompressed += 1
+            saved += len(data) - len(smaller)
+
+    package.stats['media_recompress'] = {
+        'recompressed': recompressed,
+        'bytes_saved': saved,
+    }
+
+
+def process_docx(input_path: str, output_path: str = None, stats: dict = None,
+                 passes: tuple[str, ...] = DEFAULT_PASSES, tracer: Tracer = NULL_TRACER,
+                 validator: 'PackageValidator' = None, low_memory: bool = False,
+                 monitor: MemoryMonitor = None) -> bool:
     """
     Process a single DOCX file.
 
+    The archive is opened once and every pass runs against the same
+    DocxPackage, so N passes cost one unzip and one zip. In low-memory mode
+    passes with a streaming variant (STREAMING_PASSES) run that instead,
+    so document.xml is never held in memory whole.
+
     Args:
         input_path: Path to input DOCX file
         output_path: Path for output file (defaults to overwriting input)
+        stats: Optional dict that receives per-pass timings, pass statistics
+            (footer rId, signature-table count, ...) and the error traceback
+            on failure
+        passes: Names of registered passes to run, in order
+        tracer: Optional Tracer receiving stage timings and byte/regex counters
+        validator: Optional PackageValidator fed the output while it is written
+        low_memory: Run the streaming variants of passes where there are any
+        monitor: Optional MemoryMonitor sampled throughout; its peak RSS is
+            recorded in stats['peak_rss'], and exceeding its limit fails the file
 
     Returns:
         True if successful, False otherwise
     """
     if output_path is None:
         output_path = input_path
-
-    print(f"\nProcessing: {input_path}")
+    if stats is None:
+        stats = {}
+    timings = stats.setdefault('timings', {})
+    monitor = monitor or MemoryMonitor()
+    pass_funcs = {**PASSES, **STREAMING_PASSES} if low_memory else PASSES
 
     try:
-        # Create temporary directory
-        with tempfile.TemporaryDirectory() as temp_dir:
-            # Extract DOCX
-            extract_docx(input_path, temp_dir)
-
-            # Read document.xml
-            doc_path = os.path.join(temp_dir, 'word', 'document.xml')
-            with open(doc_path, 'r', encoding='utf-8') as f:
-                document_content = f.read()
-
-            # First, remove images from ALL signature tables throughout the document
-            print("  - Removing signature images from all signature tables...")
-            sig_tables = find_signature_tables(document_content)
-            print(f"    Found {len(sig_tables)} signature tables with images")
-            document_content = remove_images_from_all_signature_tables(document_content)
-
-            # Extract and clean signature table for footer
-            print("  - Extracting last signature table for footer...")
-            table_xml, document_without_table = extract_signature_table(document_content)
-
-            print("  - Cleaning signature table (removing images and shading)...")
-            cleaned_table = clean_signature_table(table_xml)
-
-            # Create footer XML
-            print("  - Creating footer1.xml...")
-            footer_xml = create_footer_xml(cleaned_table)
-
-            # Write footer file
-            footer_path = os.path.join(temp_dir, 'word', 'footer1.xml')
-            with open(footer_path, 'w', encoding='utf-8') as f:
-                f.write(footer_xml)
-
-            # Update Content_Types.xml
-            print("  - Updating [Content_Types].xml...")
-            content_types_path = os.path.join(temp_dir, '[Content_Types].xml')
-            with open(content_types_path, 'r', encoding='utf-8') as f:
-                content_types = f.read()
-            content_types = update_content_types(content_types)
-            with open(content_types_path, 'w', encoding='utf-8') as f:
-                f.write(content_types)
-
-            # Update document.xml.rels
-            print("  - Updating document.xml.rels...")
-            rels_path = os.path.join(temp_dir, 'word', '_rels', 'document.xml.rels')
-            with open(rels_path, 'r', encoding='utf-8') as f:
-                rels_content = f.read()
-
-            footer_rid = find_next_rid(rels_content)
-            print(f"    Using relationship ID: {footer_rid}")
-
-            rels_content = update_document_rels(rels_content, footer_rid)
-            with open(rels_path, 'w', encoding='utf-8') as f:
-                f.write(rels_content)
-
-            # Update document.xml
-            print("  - Updating document.xml (adding footer references, updating margins)...")
-            # Note: document_without_table already has images removed from all signature tables
-            document_content = update_sectpr_elements(document_without_table, footer_rid)
-
-            # Remove excessive empty paragraphs
-            print("  - Removing excessive empty paragraphs...")
-            document_content = remove_empty_paragraphs_before_end(document_content)
-
-            with open(doc_path, 'w', encoding='utf-8') as f:
-                f.write(document_content)
-
-            # Repackage DOCX
-            print("  - Repackaging DOCX...")
-            repackage_docx(temp_dir, output_path)
-
-            print(f"  SUCCESS: {output_path}")
+        unknown = [name for name in passes if name not in PASSES]
+        if unknown:
+            raise ValueError(f"Unknown pass(es): {', '.join(unknown)}")
+
+        with tracer.stage('open'):
+            source = zipfile.ZipFile(input_path, 'r')
+        with source:
+            package = DocxPackage(source, tracer, monitor)
+            package.stats = stats
+
+            for name in passes:
+                with stage_timer(timings, name), tracer.stage(name):
+                    pass_funcs[name](package)
+                monitor.sample()
+
+            # Write the output archive straight from the source archive
+            with stage_timer(timings, 'write'), tracer.stage('write'):
+                package.save(output_path, validator)
+            monitor.sample()
+
             return True
 
     except Exception as e:
-        print(f"  ERROR: {e}")
+        stats['error'] = f'{type(e).__name__}: {e}'
         import traceback
-        traceback.print_exc()
+        stats['traceback'] = traceback.format_exc()
         return False
+    finally:
+        stats['peak_rss'] = monitor.peak
 
 
-def validate_docx(docx_path: str) -> bool:
-    """Basic validation that DOCX can be opened and has expected structure."""
-    try:
-        with zipfile.ZipFile(docx_path, 'r') as zf:
-            # Check required files exist
-            names = zf.namelist()
-            required = ['word/document.xml', '[Content_Types].xml', 'word/footer1.xml']
+CONTENT_TYPES_NS = 'http://schemas.openxmlformats.org/package/2006/content-types'
+PACKAGE_RELS_NS = 'http://schemas.openxmlformats.org/package/2006/relationships'
 
-            for req in required:
-                if req not in names:
-                    print(f"  Validation FAILED: Missing {req}")
-                    return False
+# Package parts parsed by PackageValidator; anything else is only checked for a content type
+XML_PART_EXTENSIONS = ('.xml', '.rels')
 
-            # Try to read document.xml
-            with zf.open('word/document.xml') as f:
-                content = f.read().decode('utf-8')
 
-                # Check for footer references
-                if 'w:footerReference' not in content:
-                    print("  Validation WARNING: No footer references found in document")
+def relationship_source(rels_name: str) -> str:
+    """Name of the part a relationships part belongs to ('' for the package)."""
+    folder, _, base = rels_name.rpartition('/')
+    folder = folder.removesuffix('_rels').rstrip('/')
+    base = base.removesuffix('.rels')
+    return f'{folder}/{base}' if folder else base
 
-                # Check margins were updated
-                if 'w:footer="720"' not in content:
-                    print("  Validation WARNING: Footer margin may not be updated")
 
-            # Try to read footer
-            with zf.open('word/footer1.xml') as f:
-                footer = f.read().decode('utf-8')
+def resolve_target(source: str, target: str) -> str:
+    """Part name an internal relationship target points at, relative to its source part."""
+    from urllib.parse import unquote
 
-                # Check signature images removed
-                if 'w:drawing' in footer:
-                    print("  Validation WARNING: Drawing elements still present in footer")
+    target = unquote(target)
+    if target.startswith('/'):
+        return posixpath.normpath(target).lstrip('/')
+    return posixpath.normpath(posixpath.join(posixpath.dirname(source), target)).lstrip('/')
 
-                # Check shading removed
-                if 'FCE9D9' in footer:
-                    print("  Validation WARNING: Cell shading still present in footer")
 
-            print("  Validation PASSED")
-            return True
+# Expat names elements and attributes '<namespace URI> <local name>'
+_R_ATTR = R_NS + ' '
+_W_SECTPR = W_NS + ' sectPr'
+_W_SECTION_PARENTS = (W_NS + ' pPr', W_NS + ' body')
+_W_FOOTER_REFERENCE = W_NS + ' footerReference'
+_W_PGMAR = W_NS + ' pgMar'
+_W_DRAWING = W_NS + ' drawing'
+_W_SHD = W_NS + ' shd'
+_W_FILL = W_NS + ' fill'
+_PGMAR_ATTRS = {key: f'{W_NS} {key}' for key in NEW_MARGINS}
 
+
+class _PartParser:
+    """
+    Streams one XML part through expat, recording what PackageValidator checks.
+
+    Handlers are chosen per part, so most parts only pay for collecting
+    r:id references and only document.xml tracks element nesting.
+    """
+
+    def __init__(self, validator: 'PackageValidator', name: str):
+        self.validator = validator
+        self.name = name
+        self.references = validator.references.setdefault(name, set())
+        self.stack: list[str] = []
+        self.section_depth = None
+        self.error = None
+        self.parser = xml.parsers.expat.ParserCreate(namespace_separator=' ')
+        if name == DOCUMENT_PART:
+            validator.document_parsed = True
+            self.parser.StartElementHandler = self._start_document
+            self.parser.EndElementHandler = self._end_document
+        elif name == FOOTER_PART:
+            self.parser.StartElementHandler = self._start_footer
+        elif name.endswith('.rels'):
+            self.relationships = validator.relationships.setdefault(name, {})
+            self.parser.StartElementHandler = self._start_rels
+        elif name == CONTENT_TYPES_PART:
+            self.parser.StartElementHandler = self._start_content_types
+        else:
+            self.parser.StartElementHandler = self._start
+
+    def feed(self, data: bytes) -> None:
+        if self.error is None:
+            try:
+                self.parser.Parse(data, False)
+            except xml.parsers.expat.ExpatError as e:
+                self.error = str(e)
+
+    def close(self) -> None:
+        if self.error is None:
+            try:
+                self.parser.Parse(b'', True)
+            except xml.parsers.expat.ExpatError as e:
+                self.error = str(e)
+        if self.error is not None:
+            self.validator.malformed[self.name] = self.error
+
+    def _start(self, name: str, attrs: dict) -> None:
+        for key, value in attrs.items():
+            if key.startswith(_R_ATTR):
+                self.references.add(value)
+
+    def _start_document(self, name: str, attrs: dict) -> None:
+        if attrs:
+            self._start(name, attrs)
+        stack = self.stack
+        if name == _W_SECTPR and stack and stack[-1] in _W_SECTION_PARENTS:
+            self.section_depth = len(stack)
+            self.validator.sections.append({'footer': False, 'margins': None})
+        elif self.section_depth is not None and len(stack) == self.section_depth + 1:
+            if name == _W_FOOTER_REFERENCE:
+                self.validator.sections[-1]['footer'] = True
+            elif name == _W_PGMAR:
+                self.validator.sections[-1]['margins'] = {key: attrs.get(attr) for key, attr in _PGMAR_ATTRS.items()}
+        stack.append(name)
+
+    def _end_document(self, name: str) -> None:
+        self.stack.pop()
+        if self.section_depth == len(self.stack):
+            self.section_depth = None
+
+    def _start_footer(self, name: str, attrs: dict) -> None:
+        if attrs:
+            self._start(name, attrs)
+        if name == _W_DRAWING:
+            self.validator.footer_drawings += 1
+        elif name == _W_SHD and attrs.get(_W_FILL) == SIGNATURE_SHADING:
+            self.validator.footer_shading += 1
+
+    def _start_rels(self, name: str, attrs: dict) -> None:
+        if name == PACKAGE_RELS_NS + ' Relationship':
+            self.relationships[attrs.get('Id')] = (attrs.get('Target', ''), attrs.get('TargetMode', 'Internal'))
+
+    def _start_content_types(self, name: str, attrs: dict) -> None:
+        if name == CONTENT_TYPES_NS + ' Default':
+            self.validator.default_types.add(attrs.get('Extension', '').lower())
+        elif name == CONTENT_TYPES_NS + ' Override':
+            part = attrs.get('PartName', '').lstrip('/')
+            self.validator.override_types[part.lower()] = part
+            if part.lower() == FOOTER_PART:
+                self.validator.footer_content_type = attrs.get('ContentType')
+
+
+class PackageValidator:
+    """
+    Streaming structural validation of a DOCX package.
+
+    Each part a pass wrote is fed through an incremental expat parser as it
+    is written (see ZipWriter), so no part is held as a string or re-read
+    from the output archive. Raw-copied members are the source's bytes, so
+    they only get a CRC-32 check; of those, just relationship parts and
+    [Content_Types].xml are parsed, for what they declare. finish() then
+    checks, across the whole package:
+
+    - every written XML part is well-formed, every copied member matches
+      its CRC-32
+    - every r:id (r:embed, ...) in a written part resolves in the part's
+      relationships, and every internal relationship target exists
+    - every part has a content type (Default or Override)
+    - (when expect_footer is set) document.xml has a relationship to the
+      footer and the footer its own content type override; every section
+      has a footerReference and NEW_MARGINS, and the footer has no
+      signature drawings or shading
+
+    Args:
+        expect_footer: Check the layout the footer pass produces
+    """
+
+    def __init__(self, expect_footer: bool = True):
+        self.expect_footer = expect_footer
+        self.names: set[str] = set()
+        self.malformed: dict[str, str] = {}
+        self.corrupt: dict[str, str] = {}
+        self.references: dict[str, set[str]] = {}
+        self.relationships: dict[str, dict[str, tuple[str, str]]] = {}
+        self.default_types: set[str] = set()
+        self.override_types: dict[str, str] = {}
+        self.sections: list[dict] = []
+        self.footer_drawings = 0
+        self.footer_shading = 0
+        self.footer_content_type = None
+        self.document_parsed = False
+
+    def open_part(self, name: str) -> _PartParser | None:
+        """Register a written part; returns a parser to feed its bytes to if it is XML."""
+        self.names.add(name)
+        if name.lower().endswith(XML_PART_EXTENSIONS):
+            return _PartParser(self, name)
+        return None
+
+    def open_copied_part(self, name: str) -> _PartParser | None:
+        """Register a raw-copied part; returns a parser only for relationships and content types."""
+        self.names.add(name)
+        if name.endswith('.rels') or name == CONTENT_TYPES_PART:
+            return _PartParser(self, name)
+        return None
+
+    def check_part(self, name: str, data: bytes) -> None:
+        """Register and parse a part whose bytes are already in memory."""
+        parser = self.open_part(name)
+        if parser is not None:
+            parser.feed(data)
+            parser.close()
+
+    def finish(self, warnings: list = None) -> bool:
+        """
+        Run the package-wide checks.
+
+        Problems are appended to warnings. Returns False if the package is
+        broken (missing parts, malformed XML, dangling relationships or
+        content types); layout problems are only warnings.
+        """
+        if warnings is None:
+            warnings = []
+        errors = []
+
+        required = [DOCUMENT_PART, CONTENT_TYPES_PART] + ([FOOTER_PART] if self.expect_footer else [])
+        errors.extend(f"Missing {name}" for name in required if name not in self.names)
+        errors.extend(f"{name} is not well-formed: {error}" for name, error in sorted(self.malformed.items()))
+        errors.extend(f"{name} is corrupt: {error}" for name, error in sorted(self.corrupt.items()))
+
+        for part, rids in sorted(self.references.items()):
+            if not rids:
+                continue
+            defined = self.relationships.get(rels_part_name(part), {})
+            missing = sorted(rids.difference(defined))
+            if missing:
+                errors.append(f"{part} references undefined relationship(s) {', '.join(missing)}")
+        for rels_name, relationships in sorted(self.relationships.items()):
+            source = relationship_source(rels_name)
+            for rid, (target, mode) in relationships.items():
+                if mode != 'External' and resolve_target(source, target) not in self.names:
+                    errors.append(f"{rels_name}: {rid} targets missing part {resolve_target(source, target)}")
+
+        if CONTENT_TYPES_PART in self.names:
+            for name in sorted(self.names):
+                if name == CONTENT_TYPES_PART or name.endswith('/'):
+                    continue
+                extension = name.rpartition('.')[2].lower()
+                if name.lower() not in self.override_types and extension not in self.default_types:
+                    errors.append(f"{name} has no content type")
+            lowered = {name.lower() for name in self.names}
+            for key in sorted(self.override_types.keys() - lowered):
+                warnings.append(f"Validation WARNING: Content type override for missing part "
+                                f"/{self.override_types[key]}")
+
+        if self.expect_footer and FOOTER_PART in self.names:
+            targets = self.relationships.get(DOCUMENT_RELS_PART, {}).values()
+            if not any(resolve_target(DOCUMENT_PART, target) == FOOTER_PART for target, _ in targets):
+                errors.append(f"{DOCUMENT_RELS_PART} has no relationship to {FOOTER_PART}")
+            if self.footer_content_type != FOOTER_CONTENT_TYPE:
+                errors.append(f"{FOOTER_PART} has no footer content type override")
+
+        # Sections are only known when document.xml was written, not copied
+        if self.expect_footer and self.document_parsed:
+            missing_footer = sum(1 for section in self.sections if not section['footer'])
+            if not self.sections:
+                warnings.append("Validation WARNING: No sections found in document")
+            elif missing_footer:
+                warnings.append(f"Validation WARNING: {missing_footer} of {len(self.sections)} sections "
+                                f"have no footer reference")
+            wrong_margins = sum(1 for section in self.sections if section['margins'] != NEW_MARGINS)
+            if wrong_margins:
+                warnings.append(f"Validation WARNING: {wrong_margins} of {len(self.sections)} sections "
+                                f"have margins other than NEW_MARGINS")
+        if self.expect_footer:
+            if self.footer_drawings:
+                warnings.append("Validation WARNING: Drawing elements still present in footer")
+            if self.footer_shading:
+                warnings.append("Validation WARNING: Cell shading still present in footer")
+
+        warnings.extend(f"Validation FAILED: {error}" for error in errors)
+        return not errors
+
+
+def validate_docx(docx_path: str, warnings: list = None, expect_footer: bool = True) -> bool:
+    """
+    Validate a DOCX on disk with PackageValidator, streaming each part.
+
+    Problems are appended to warnings (if given) instead of being printed, so
+    validation can run inside batch workers.
+    """
+    if warnings is None:
+        warnings = []
+    validator = PackageValidator(expect_footer)
+    try:
+        with zipfile.ZipFile(docx_path, 'r') as zf:
+            for info in zf.infolist():
+                parser = validator.open_part(info.filename)
+                if parser is None:
+                    continue
+                with zf.open(info) as f:
+                    while chunk := f.read(ZipWriter.CHUNK_SIZE):
+                        parser.feed(chunk)
+                parser.close()
     except Exception as e:
-        print(f"  Validation FAILED: {e}")
+        warnings.append(f"Validation FAILED: {e}")
         return False
+    return validator.finish(warnings)
+
+
+def file_sha256(path: str) -> str:
+    """SHA-256 hex digest of a file's contents."""
+    with open(path, 'rb') as f:
+        return hashlib.file_digest(f, 'sha256').hexdigest()
+
+
+def config_hash(passes: tuple[str, ...]) -> str:
+    """Hash of everything besides the input file that determines the output."""
+    config = {
+        'version': PROCESSOR_VERSION,
+        'passes': list(passes),
+        'margins': NEW_MARGINS,
+        'shading': SIGNATURE_SHADING,
+        'max_empty_paragraphs': MAX_EMPTY_PARAGRAPHS,
+        'media_recompress_bytes': MEDIA_RECOMPRESS_BYTES,
+        'media_jpeg_quality': MEDIA_JPEG_QUALITY,
+    }
+    if 'media-recompress' in passes:
+        # Its output depends on the Pillow release, and on Pillow being there at all
+        image_module = _pillow()
+        config['pillow'] = image_module.__version__ if image_module is not None else None
+    return hashlib.sha256(json.dumps(config, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+class ProcessCache:
+    """
+    Persistent record of processed reports, stored in a SQLite sidecar.
+
+    Each input path maps to the configuration hash it was processed with,
+    the SHA-256 of the input and of the output, and the stat (size, mtime)
+    of both files afterwards. A file is up to date when the configuration
+    matches and neither file changed: an unchanged stat answers that
+    without reading the file, otherwise the content hash decides. Every
+    record is committed immediately, so an interrupted batch keeps what it
+    finished.
+
+    The configuration hash only covers the settings (see config_hash), not
+    the code: any change that alters the output for the same input and
+    settings must bump PROCESSOR_VERSION in the same commit, or records
+    written before it keep being trusted.
+    """
+
+    def __init__(self, path: str):
+        import sqlite3
+
+        self.path = path
+        self.db = sqlite3.connect(path)
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS processed (
+                input_path TEXT PRIMARY KEY,
+                output_path TEXT NOT NULL,
+                config TEXT NOT NULL,
+                input_sha256 TEXT NOT NULL,
+                output_sha256 TEXT NOT NULL,
+                input_size INTEGER NOT NULL,
+                input_mtime_ns INTEGER NOT NULL,
+                output_size INTEGER NOT NULL,
+                output_mtime_ns INTEGER NOT NULL
+            )""")
+        self.db.commit()
+
+    def close(self) -> None:
+        self.db.close()
+
+    @staticmethod
+    def _unchanged(path: str, size: int, mtime_ns: int, digests: tuple[str, ...]) -> bool:
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return False
+        if st.st_size == size and st.st_mtime_ns == mtime_ns:
+            return True
+        return file_sha256(path) in digests
+
+    def is_up_to_date(self, input_path: str, output_path: str, config: str) -> bool:
+        """True if input_path was already processed into output_path with config."""
+        row = self.db.execute(
+            'SELECT output_path, config, input_sha256, output_sha256, input_size, input_mtime_ns, '
+            'output_size, output_mtime_ns FROM processed WHERE input_path = ?',
+            (os.path.abspath(input_path),)).fetchone()
+        if row is None:
+            return False
+        cached_output, cached_config, input_sha, output_sha, in_size, in_mtime, out_size, out_mtime = row
+        if cached_output != os.path.abspath(output_path) or cached_config != config:
+            return False
+
+        if os.path.abspath(input_path) == cached_output:
+            # Processed in place: the input is now the output
+            return self._unchanged(input_path, in_size, in_mtime, (output_sha,))
+        return (self._unchanged(input_path, in_size, in_mtime, (input_sha,))
+                and self._unchanged(output_path, out_size, out_mtime, (output_sha,)))
+
+    def record(self, result: dict, config: str) -> None:
+        """Remember a successfully processed report (see process_report)."""
+        in_stat = os.stat(result['file'])
+        out_stat = os.stat(result['output'])
+        self.db.execute(
+            'INSERT OR REPLACE INTO processed VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            (os.path.abspath(result['file']), os.path.abspath(result['output']), config,
+             result['input_sha256'], result['output_sha256'], in_stat.st_size, in_stat.st_mtime_ns,
+             out_stat.st_size, out_stat.st_mtime_ns))
+        self.db.commit()
+
+
+def process_report(input_path: str, output_path: str = None,
+                   passes: tuple[str, ...] = DEFAULT_PASSES, trace: bool = False,
+                   low_memory: bool = False, max_rss: int = None) -> dict:
+    """
+    Process and validate one report, returning a structured result.
+
+    This is the unit of work of the batch engine: it never prints, and the
+    returned dict is plain data so it can travel back from a worker process.
+    With trace, the result also carries the file's Tracer data under 'trace'.
+    low_memory and max_rss (bytes) select the streaming engine and the RSS
+    limit (see process_docx); the peak RSS is in details['peak_rss'].
+    """
+    if output_path is None:
+        output_path = input_path
+
+    stats = {'timings': {}}
+    result = {
+        'file': input_path,
+        'output': output_path,
+        'status': 'failed',
+        'footer_rid': None,
+        'signature_tables': 0,
+        'timings': stats['timings'],
+        'warnings': [],
+        'error': None,
+    }
+
+    tracer = Tracer() if trace else NULL_TRACER
+    start = time.perf_counter()
+    # The output is validated while it is written; the footer layout is
+    # only expected when the footer pass ran
+    validator = PackageValidator(expect_footer='footer' in passes)
+    monitor = MemoryMonitor(max_rss)
+    try:
+        result['input_sha256'] = file_sha256(input_path)
+    except OSError as e:
+        # A missing or unreadable input fails like any other report
+        stats['error'] = f'{type(e).__name__}: {e}'
+        processed = False
+    else:
+        processed = process_docx(input_path, output_path, stats, passes, tracer, validator, low_memory, monitor)
+    if processed:
+        result['output_sha256'] = file_sha256(output_path)
+        with stage_timer(result['timings'], 'validate'), tracer.stage('validate'):
+            valid = validator.finish(result['warnings'])
+        result['status'] = 'ok' if valid else 'invalid'
+    else:
+        result['error'] = stats.get('error')
+        result['traceback'] = stats.get('traceback')
+
+    result['footer_rid'] = stats.get('footer_rid')
+    result['signature_tables'] = stats.get('signature_tables', 0)
+    result['details'] = {key: value for key, value in stats.items()
+                         if key not in ('timings', 'error', 'traceback', 'footer_rid', 'signature_tables')}
+    result['timings']['total'] = round(time.perf_counter() - start, 6)
+    if trace:
+        result['trace'] = tracer.as_dict()
+    return result
+
+
+def write_manifest(results: list[dict], manifest_path: str) -> None:
+    """Write batch results as JSON, or as CSV when the path ends in .csv."""
+    if manifest_path.endswith('.csv'):
+        import csv
+
+        stages = sorted({stage for r in results for stage in r['timings']})
+        fieldnames = ['file', 'output', 'status', 'footer_rid', 'signature_tables', 'error', 'warnings']
+        fieldnames += [f'time_{stage}' for stage in stages]
+        with open(manifest_path, 'w', encoding='utf-8', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=fieldnames)
+            writer.writeheader()
+            for r in results:
+                row = {key: r.get(key) for key in fieldnames[:6]}
+                row['warnings'] = '; '.join(r['warnings'])
+                for stage in stages:
+                    row[f'time_{stage}'] = r['timings'].get(stage)
+                writer.writerow(row)
+    else:
+        # Traces go to their own file (see write_trace)
+        with open(manifest_path, 'w', encoding='utf-8') as f:
+            json.dump([{k: v for k, v in r.items() if k != 'trace'} for r in results], f, indent=2)
+
+
+def connect_worker(socket_path: str):
+    """Connect to a warm worker (serve_docx --socket); None if nothing is listening."""
+    import socket
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(socket_path)
+    except (FileNotFoundError, ConnectionRefusedError):
+        sock.close()
+        return None
+    return sock
+
+
+def process_remote(sock, jobs: list[tuple[str, str]], passes: tuple[str, ...] = DEFAULT_PASSES,
+                   trace: bool = False, low_memory: bool = False, max_rss: int = None):
+    """
+    Hand (input, output) pairs to a warm worker and yield its results as they finish.
 
+    The worker already has the processor imported and its pool started, so
+    each report costs only its own processing. Results are process_report
+    dicts with the paths as given here.
 
-def main():
-    """Process all REF615 report files."""
-    reports_dir = Path('/Users/abdout/codebase/REF615/Final_Reports')
+    Raises:
+        RuntimeError: if the worker refuses the request (it runs a different
+            processor configuration, e.g. older code)
+        OSError: if the connection fails
+    """
+    paths = {}
+    for input_path, output_path in jobs:
+        paths[os.path.abspath(input_path)] = (input_path, output_path)
+    request = {'files': [[os.path.abspath(i), os.path.abspath(o)] for i, o in jobs],
+               'passes': list(passes), 'config': config_hash(passes), 'trace': trace,
+               'low_memory': low_memory, 'max_rss': max_rss}
+    with sock, sock.makefile('rb') as replies:
+        sock.sendall(json.dumps(request).encode('utf-8') + b'\n')
+        for line in replies:
+            result = json.loads(line)
+            if 'status' not in result:
+                raise RuntimeError(result.get('error', 'bad reply'))
+            result['file'], result['output'] = paths[result['file']]
+            yield result
+
+
+def run_batch(files: list, jobs: int = None, manifest_path: str = None,
+              passes: tuple[str, ...] = DEFAULT_PASSES, output_dir: str = None,
+              cache_path: str = None, trace_path: str = None, low_memory: bool = False,
+              max_rss: int = None, socket_path: str = None) -> list[dict]:
+    """
+    Process many reports across a process pool.
+
+    Args:
+        files: Report paths to process
+        jobs: Worker processes (defaults to the CPU count; 1 runs inline)
+        manifest_path: Optional JSON/CSV manifest of per-file results
+        passes: Names of registered passes to run on every file
+        output_dir: Write outputs here instead of overwriting the inputs
+        cache_path: Optional ProcessCache database; files already processed
+            with the same inputs and configuration are skipped
+        trace_path: Trace every file and write the traces here (see write_trace)
+        low_memory: Stream document.xml instead of loading it (see process_docx)
+        max_rss: Fail any file whose worker exceeds this RSS (bytes)
+        socket_path: Hand the files to the warm worker listening here
+            (serve_docx --socket); files it cannot take are processed locally
 
-    # List of files to process
-    files = sorted(reports_dir.glob('H*.docx'))
+    Returns:
+        One result dict per file (see process_report), in input order
+    """
+    files = [str(f) for f in files]
+    outputs = {path: os.path.join(output_dir, os.path.basename(path)) if output_dir else path
+               for path in files}
+    jobs = jobs or os.cpu_count() or 1
+    results = []
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+
+    cache = ProcessCache(cache_path) if cache_path else None
+    config = config_hash(passes)
+    trace = trace_path is not None
+    pending = []
+    for path in files:
+        if cache is not None and cache.is_up_to_date(path, outputs[path], config):
+            results.append({'file': path, 'output': outputs[path], 'status': 'skipped',
+                            'footer_rid': None, 'signature_tables': 0, 'timings': {},
+                            'warnings': [], 'error': None})
+        else:
+            pending.append(path)
+
+    def report(result):
+        line = f"  [{result['status'].upper()}] {result['file']} ({result['timings']['total']:.3f}s)"
+        if result['error']:
+            line += f" - {result['error']}"
+        print(line)
+        for warning in result['warnings']:
+            print(f"      {warning}")
+        if cache is not None and result['status'] == 'ok':
+            cache.record(result, config)
+
+    try:
+        worker = connect_worker(socket_path) if socket_path and pending else None
+        if worker is not None:
+            done = set()
+            problem = 'it closed the connection'
+            try:
+                for result in process_remote(worker, [(path, outputs[path]) for path in pending],
+                                             passes, trace, low_memory, max_rss):
+                    results.append(result)
+                    done.add(result['file'])
+                    report(result)
+            except (OSError, RuntimeError, ValueError) as e:
+                problem = str(e)
+            pending = [path for path in pending if path not in done]
+            if pending:
+                print(f"  Worker at {socket_path} stopped ({problem}); processing {len(pending)} files here")
+
+        if jobs == 1 or len(pending) <= 1:
+            for path in pending:
+                results.append(process_report(path, outputs[path], passes, trace, low_memory, max_rss))
+                report(results[-1])
+        else:
+            from concurrent.futures import ProcessPoolExecutor, as_completed
+
+            with ProcessPoolExecutor(max_workers=min(jobs, len(pending))) as pool:
+                futures = [pool.submit(process_report, path, outputs[path], passes, trace, low_memory, max_rss)
+                           for path in pending]
+                for future in as_completed(futures):
+                    results.append(future.result())
+                    report(results[-1])
+    finally:
+        if cache is not None:
+            cache.close()
+
+    order = {path: i for i, path in enumerate(files)}
+    results.sort(key=lambda r: order[r['file']])
+
+    if manifest_path:
+        write_manifest(results, manifest_path)
+    if trace_path:
+        write_trace(results, trace_path)
+
+    return results
+
+
+def print_summary(results: list[dict], elapsed: float) -> None:
+    """Print per-stage percentiles and throughput of a batch."""
+    processed = sum(1 for r in results if r['status'] != 'skipped')
+    print(f"\n{processed} files processed in {elapsed:.3f}s "
+          f"({processed / elapsed if elapsed else 0:.1f} files/s)")
+    summary = timing_summary(results)
+    print(f"  {'stage':<18}{'total':>10}{'p50':>10}{'p90':>10}{'p99':>10}{'max':>10}{'cpu':>10}")
+    for stage, row in summary.items():
+        cpu = f"{row['cpu']:.4f}" if 'cpu' in row else '-'
+        print(f"  {stage:<18}{row['total']:>10.4f}{row['p50']:>10.4f}{row['p90']:>10.4f}"
+              f"{row['p99']:>10.4f}{row['max']:>10.4f}{cpu:>10}")
+
+
+def profile_batch(files: list, profile_path: str, **batch_args) -> list[dict]:
+    """
+    Run a batch in this process under cProfile and tracemalloc.
+
+    Worker processes are invisible to the profiler, so the batch runs with
+    jobs=1. The pstats file is saved to profile_path; the top functions and
+    the peak/top memory allocations are printed.
+    """
+    import cProfile
+    import pstats
+    import tracemalloc
+
+    batch_args['jobs'] = 1
+    profiler = cProfile.Profile()
+    tracemalloc.start()
+    profiler.enable()
+    try:
+        results = run_batch(files, **batch_args)
+    finally:
+        profiler.disable()
+        snapshot = tracemalloc.take_snapshot()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    profiler.dump_stats(profile_path)
+    print(f"\nProfile saved to {profile_path}")
+    pstats.Stats(profiler).sort_stats('cumulative').print_stats(20)
+
+    print(f"Peak traced memory: {peak / 1024 / 1024:.1f} MiB")
+    for stat in snapshot.statistics('lineno')[:10]:
+        print(f"  {stat}")
+    return results
+
+
+def find_reports(inputs: list[str]) -> list[str]:
+    """
+    Expand command-line inputs into report paths, in order and without repeats.
+
+    A directory stands for the H*.docx reports in it, an argument with glob
+    characters is expanded (so patterns work unquoted or quoted), and
+    anything else names a file.
+
+    Raises:
+        FileNotFoundError: if a file does not exist or a pattern matches nothing
+    """
+    files = {}
+    for entry in inputs:
+        if os.path.isdir(entry):
+            matches = sorted(str(path) for path in Path(entry).glob('H*.docx'))
+        elif glob.escape(entry) != entry:
+            matches = sorted(glob.glob(entry, recursive=True))
+            if not matches:
+                raise FileNotFoundError(f'no reports match {entry}')
+        elif os.path.isfile(entry):
+            matches = [entry]
+        else:
+            raise FileNotFoundError(f'no such report: {entry}')
+        for path in matches:
+            files.setdefault(os.path.abspath(path), path)
+    return list(files.values())
+
+
+def print_plan(files: list[str], output_dir: str, cache_path: str, passes: tuple[str, ...]) -> int:
+    """
+    Print what a batch would do without writing anything (--dry-run).
+
+    Returns:
+        The number of files that would be processed
+    """
+    # Only an existing cache is consulted, so a dry run never creates one
+    cache = ProcessCache(cache_path) if cache_path and os.path.exists(cache_path) else None
+    config = config_hash(passes)
+    count = 0
+    try:
+        for path in files:
+            output = os.path.join(output_dir, os.path.basename(path)) if output_dir else path
+            if cache is not None and cache.is_up_to_date(path, output, config):
+                print(f"  [UP TO DATE] {path}")
+                continue
+            count += 1
+            print(f"  [PROCESS] {path} -> {output}" if output != path else f"  [PROCESS] {path} (in place)")
+    finally:
+        if cache is not None:
+            cache.close()
+    return count
+
+
+def main(argv: list[str] = None) -> int:
+    """Process REF615 report files given as paths, directories or glob patterns."""
+    parser = argparse.ArgumentParser(description='Process REF615 relay test reports.')
+    parser.add_argument('inputs', nargs='*', default=[str(REPORTS_DIR)], metavar='INPUT',
+                        help='Report files, directories of H*.docx reports, or glob patterns '
+                             f'(default: {REPORTS_DIR})')
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help='Worker processes (default: CPU count)')
+    parser.add_argument('--manifest', default=None,
+                        help='Write per-file results to this JSON or CSV file')
+    parser.add_argument('-o', '--output-dir', default=None,
+                        help='Write processed reports here (default: overwrite in place)')
+    parser.add_argument('-n', '--dry-run', action='store_true',
+                        help='List the reports that would be processed and where, without writing anything')
+    parser.add_argument('--no-cache', action='store_true',
+                        help=f'Reprocess every file, ignoring the {CACHE_FILENAME} sidecar')
+    parser.add_argument('--passes', default=','.join(DEFAULT_PASSES),
+                        help=f"Comma-separated passes to run (available: {', '.join(PASSES)})")
+    parser.add_argument('--socket', default=os.environ.get('REF615_SOCKET'), metavar='PATH',
+                        help='Hand the reports to the warm worker listening on this Unix socket '
+                             '(serve_docx --socket), processing locally if there is none '
+                             '(default: $REF615_SOCKET)')
+    parser.add_argument('--trace', default=None,
+                        help='Write per-file stage traces (.jsonl, or Chrome trace format otherwise)')
+    parser.add_argument('--profile', default=None,
+                        help='Run in-process under cProfile and tracemalloc; save pstats here')
+    parser.add_argument('--low-memory', action='store_true',
+                        help='Stream document.xml through the footer pass instead of loading it whole')
+    parser.add_argument('--max-rss', type=int, default=None, metavar='MIB',
+                        help='Fail any file whose worker process exceeds this resident size')
+    args = parser.parse_args(argv)
+
+    passes = tuple(name.strip() for name in args.passes.split(',') if name.strip())
+    unknown = [name for name in passes if name not in PASSES]
+    if unknown:
+        parser.error(f"unknown pass(es): {', '.join(unknown)}")
+
+    try:
+        files = find_reports(args.inputs)
+    except FileNotFoundError as e:
+        parser.error(str(e))
+    if args.output_dir:
+        names = {}
+        for path in files:
+            other = names.setdefault(os.path.basename(path), path)
+            if other != path:
+                parser.error(f'{other} and {path} would both be written to '
+                             f'{os.path.join(args.output_dir, os.path.basename(path))}')
 
     print(f"Found {len(files)} DOCX files to process")
     print("=" * 60)
 
-    success_count = 0
-    fail_count = 0
+    # The cache sidecar lives with the outputs: in the output directory, or
+    # in the first input directory (or that of the first file) in place
+    if args.output_dir:
+        cache_dir = args.output_dir
+    elif os.path.isdir(args.inputs[0]):
+        cache_dir = args.inputs[0]
+    else:
+        cache_dir = os.path.dirname(files[0]) if files else '.'
+    cache_path = None if args.no_cache else str(Path(cache_dir) / CACHE_FILENAME)
+
+    if args.dry_run:
+        count = print_plan(files, args.output_dir, cache_path, passes)
+        print(f"\nDry run: {count} would be processed, {len(files) - count} up to date "
+              f"(passes: {', '.join(passes)})")
+        return 0
+
+    batch_args = dict(jobs=args.jobs, manifest_path=args.manifest, passes=passes,
+                      output_dir=args.output_dir, cache_path=cache_path, trace_path=args.trace,
+                      low_memory=args.low_memory, max_rss=args.max_rss and args.max_rss * 2**20)
+
+    start = time.perf_counter()
+    if args.profile:
+        results = profile_batch(files, args.profile, **batch_args)
+    else:
+        results = run_batch(files, socket_path=args.socket, **batch_args)
+    elapsed = time.perf_counter() - start
 
-    for docx_file in files:
-        if process_docx(str(docx_file)):
-            if validate_docx(str(docx_file)):
-                success_count += 1
-            else:
-                fail_count += 1
-        else:
-            fail_count += 1
+    success_count = sum(1 for r in results if r['status'] == 'ok')
+    skip_count = sum(1 for r in results if r['status'] == 'skipped')
+    fail_count = len(results) - success_count - skip_count
 
     print("\n" + "=" * 60)
-    print(f"COMPLETE: {success_count} succeeded, {fail_count} failed")
+    print(f"COMPLETE: {success_count} succeeded, {skip_count} up to date, {fail_count} failed")
+    footer_cache = [r.get('details', {}).get('footer_cache') for r in results]
+    if any(footer_cache):
+        print(f"Footer cache: {footer_cache.count('hit')} hits, {footer_cache.count('miss')} misses")
+    peak_rss = [r.get('details', {}).get('peak_rss', 0) for r in results]
+    if args.low_memory or args.max_rss:
+        print(f"Peak RSS: {max(peak_rss, default=0) / 2**20:.1f} MiB")
+    if args.manifest:
+        print(f"Manifest: {args.manifest}")
+    if args.trace or args.profile:
+        print_summary(results, elapsed)
+    if args.trace:
+        print(f"Trace: {args.trace}")
+    return 1 if fail_count else 0
 
 
 if __name__ == '__main__':
-    main()
+    sys.exit(main())
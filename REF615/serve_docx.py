@@ -0,0 +1,479 @@
+#!/usr/bin/env python3
+"""
+Long-running service for the REF615 DOCX processor
+
+Watches a drop directory and processes every report that lands in it,
+optionally serves a local HTTP endpoint that takes a DOCX upload and returns
+the processed file, and optionally keeps a Unix socket open for
+`process_docx.py --socket`, so scripts that call the processor once per file
+hand their files to this warm worker instead of starting Python each time.
+Transforms run in a process pool that is started once, so each report only
+pays for its own processing.
+
+Concurrency is bounded by the pool size. Watched files wait in a bounded
+queue (the watcher stops reading events while it is full); uploads beyond
+the queue size are refused with 503 and a Retry-After header.
+
+Usage:
+    python3 serve_docx.py DROP_DIR -o PROCESSED_DIR [--http 8615] [-j JOBS]
+    curl --data-binary @H01.docx http://127.0.0.1:8615/process -o H01.docx
+    python3 serve_docx.py --socket /tmp/ref615.sock &
+    python3 -m process_docx H01.docx -o out --socket /tmp/ref615.sock
+"""
+
+import argparse
+import asyncio
+import ctypes
+import ctypes.util
+import json
+import os
+import signal
+import stat
+import struct
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from process_docx import (CACHE_FILENAME, DEFAULT_PASSES, PASSES, ProcessCache, config_hash,
+                          connect_worker, process_report)
+
+
+DOCX_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.wordprocessingml.document'
+
+# Largest accepted upload
+MAX_UPLOAD_BYTES = 64 * 1024 * 1024
+
+# inotify(7) constants
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_Q_OVERFLOW = 0x00004000
+INOTIFY_EVENT = struct.Struct('iIII')
+
+
+def is_report(name: str) -> bool:
+    """Whether a file in the drop directory should be processed (skips Word lock and temp files)."""
+    return name.endswith('.docx') and not name.startswith(('.', '~$'))
+
+
+def _init_worker() -> None:
+    # Ctrl-C reaches the whole process group; the service shuts the pool down itself
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def _warm_up() -> int:
+    """Runs once in each pool worker so imports happen before the first report."""
+    return os.getpid()
+
+
+async def close_writer(writer: asyncio.StreamWriter) -> None:
+    """Close a connection and wait until it is gone; a peer that already hung up is fine."""
+    writer.close()
+    try:
+        await writer.wait_closed()
+    except ConnectionError:
+        pass
+
+
+class Inotify:
+    """Minimal inotify(7) watch on one directory, read from the event loop."""
+
+    def __init__(self, path: str):
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        if libc.inotify_add_watch(self.fd, os.fsencode(path), IN_CLOSE_WRITE | IN_MOVED_TO) < 0:
+            errno = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(errno, f'inotify_add_watch failed for {path}')
+
+    def read_names(self) -> tuple[list[str], bool]:
+        """
+        Drain pending events.
+
+        Returns:
+            Names of files written or moved into the directory, and whether
+            the kernel queue overflowed (events were lost)
+        """
+        names = []
+        overflow = False
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return names, overflow
+        offset = 0
+        while offset < len(data):
+            _, mask, _, length = INOTIFY_EVENT.unpack_from(data, offset)
+            offset += INOTIFY_EVENT.size
+            name = data[offset:offset + length].rstrip(b'\0')
+            offset += length
+            if mask & IN_Q_OVERFLOW:
+                overflow = True
+            elif name:
+                names.append(os.fsdecode(name))
+        return names, overflow
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+
+class ReportService:
+    """
+    Processes reports from a watched directory, HTTP uploads and socket requests.
+
+    Args:
+        output_dir: Where processed watched reports are written (None without
+            a watched directory)
+        jobs: Worker processes, which is also the number of reports in flight
+        queue_size: Reports allowed to wait for a worker
+        passes: Names of registered passes to run on every report
+    """
+
+    def __init__(self, output_dir: str, jobs: int, queue_size: int,
+                 passes: tuple[str, ...] = DEFAULT_PASSES):
+        self.output_dir = output_dir
+        self.jobs = jobs
+        self.queue_size = queue_size
+        self.passes = passes
+        self.config = config_hash(passes)
+        self.pool = ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker)
+        self.slots = asyncio.Semaphore(jobs)
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.queued = set()
+        self.waiting = 0
+        self.counters = {'ok': 0, 'invalid': 0, 'failed': 0, 'skipped': 0, 'rejected': 0}
+        self.started = time.time()
+        self.cache = None
+        if output_dir is not None:
+            os.makedirs(output_dir, exist_ok=True)
+            self.cache = ProcessCache(os.path.join(output_dir, CACHE_FILENAME))
+
+    async def start(self) -> None:
+        """Start every pool worker now so the first report does not pay for it."""
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*(loop.run_in_executor(self.pool, _warm_up) for _ in range(self.jobs)))
+
+    async def process(self, input_path: str, output_path: str, passes: tuple[str, ...] = None,
+                      trace: bool = False, low_memory: bool = False, max_rss: int = None) -> dict:
+        """Run process_report in the pool once a slot is free (with the service's passes by default)."""
+        self.waiting += 1
+        try:
+            await self.slots.acquire()
+        finally:
+            self.waiting -= 1
+        try:
+            loop = asyncio.get_running_loop()
+            result = await loop.run_in_executor(self.pool, process_report, input_path, output_path,
+                                                passes or self.passes, trace, low_memory, max_rss)
+        finally:
+            self.slots.release()
+        self.counters[result['status']] += 1
+        return result
+
+    def busy(self) -> bool:
+        """Whether another upload would exceed the queue."""
+        return self.waiting >= self.queue_size
+
+    async def enqueue(self, path: str) -> None:
+        """Queue a watched file; waits while the queue is full."""
+        if path in self.queued:
+            return
+        self.queued.add(path)
+        await self.queue.put(path)
+
+    async def worker(self) -> None:
+        """Take watched files off the queue and process them."""
+        while True:
+            path = await self.queue.get()
+            try:
+                await self._process_watched(path)
+            except Exception as e:
+                print(f"  [FAILED] {path} - {e}", flush=True)
+                self.counters['failed'] += 1
+            finally:
+                self.queued.discard(path)
+                self.queue.task_done()
+
+    async def _process_watched(self, path: str) -> None:
+        output = os.path.join(self.output_dir, os.path.basename(path))
+        if not os.path.exists(path):
+            return
+        if self.cache.is_up_to_date(path, output, self.config):
+            self.counters['skipped'] += 1
+            return
+        result = await self.process(path, output)
+        line = f"  [{result['status'].upper()}] {path} ({result['timings']['total']:.3f}s)"
+        if result['error']:
+            line += f" - {result['error']}"
+        print(line, flush=True)
+        for warning in result['warnings']:
+            print(f"      {warning}", flush=True)
+        if result['status'] == 'ok':
+            self.cache.record(result, self.config)
+
+    async def scan(self, watch_dir: str) -> None:
+        """Queue every report already in the directory."""
+        for entry in sorted(os.scandir(watch_dir), key=lambda e: e.name):
+            if entry.is_file() and is_report(entry.name):
+                await self.enqueue(entry.path)
+
+    async def watch(self, watch_dir: str, poll_interval: float) -> None:
+        """Queue reports as they arrive, using inotify where available and polling otherwise."""
+        await self.scan(watch_dir)
+        try:
+            inotify = Inotify(watch_dir)
+        except (OSError, AttributeError) as e:
+            print(f"inotify unavailable ({e}); polling every {poll_interval}s", flush=True)
+            await self._poll(watch_dir, poll_interval)
+            return
+
+        loop = asyncio.get_running_loop()
+        ready = asyncio.Event()
+        loop.add_reader(inotify.fd, ready.set)
+        try:
+            while True:
+                await ready.wait()
+                ready.clear()
+                names, overflow = inotify.read_names()
+                if overflow:
+                    await self.scan(watch_dir)
+                for name in names:
+                    if is_report(name):
+                        await self.enqueue(os.path.join(watch_dir, name))
+        finally:
+            loop.remove_reader(inotify.fd)
+            inotify.close()
+
+    async def _poll(self, watch_dir: str, poll_interval: float) -> None:
+        # A file is queued once its size and mtime are unchanged between two
+        # polls, so half-copied reports are not picked up, and again only
+        # after it changes
+        seen = {}
+        queued = {}
+        while True:
+            current = {}
+            for entry in os.scandir(watch_dir):
+                if entry.is_file() and is_report(entry.name):
+                    stat = entry.stat()
+                    current[entry.path] = (stat.st_size, stat.st_mtime_ns)
+            for path, signature in current.items():
+                if seen.get(path) == signature and queued.get(path) != signature:
+                    queued[path] = signature
+                    await self.enqueue(path)
+            seen = current
+            await asyncio.sleep(poll_interval)
+
+    async def handle_http(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """
+        Serve one HTTP/1.1 request.
+
+        POST /process   body is a DOCX; responds with the processed DOCX, or
+                        422 and the JSON result if it could not be processed
+        GET  /health    JSON counters
+        """
+        try:
+            request = await reader.readline()
+            method, target, _ = request.decode('latin-1').split(' ', 2)
+            headers = {}
+            while (line := await reader.readline()) not in (b'\r\n', b'\n', b''):
+                key, _, value = line.decode('latin-1').partition(':')
+                headers[key.strip().lower()] = value.strip()
+
+            if method == 'GET' and target == '/health':
+                body = {'counters': self.counters, 'queued': self.queue.qsize(), 'waiting': self.waiting,
+                        'jobs': self.jobs, 'uptime': round(time.time() - self.started, 1)}
+                await self._respond(writer, 200, json.dumps(body).encode(), 'application/json')
+            elif method == 'POST' and target.split('?')[0] == '/process':
+                await self._handle_upload(reader, writer, headers)
+            else:
+                await self._respond(writer, 404, b'not found\n')
+        except (ValueError, asyncio.IncompleteReadError):
+            await self._respond(writer, 400, b'bad request\n')
+        except ConnectionError:
+            pass
+        finally:
+            await close_writer(writer)
+
+    async def _handle_upload(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+                             headers: dict) -> None:
+        length = int(headers.get('content-length', '-1'))
+        if length < 0:
+            await self._respond(writer, 411, b'content-length required\n')
+            return
+        if length > MAX_UPLOAD_BYTES:
+            await self._respond(writer, 413, b'upload too large\n')
+            return
+        if self.busy():
+            self.counters['rejected'] += 1
+            await self._respond(writer, 503, b'busy\n', extra_headers={'Retry-After': '1'})
+            return
+
+        data = await reader.readexactly(length)
+        with tempfile.TemporaryDirectory(prefix='serve_docx_') as tmp:
+            input_path = os.path.join(tmp, 'upload.docx')
+            output_path = os.path.join(tmp, 'processed.docx')
+            Path(input_path).write_bytes(data)
+            result = await self.process(input_path, output_path)
+            print(f"  [{result['status'].upper()}] upload ({length} bytes, "
+                  f"{result['timings']['total']:.3f}s)", flush=True)
+            if result['status'] == 'ok':
+                await self._respond(writer, 200, Path(output_path).read_bytes(), DOCX_CONTENT_TYPE)
+                return
+        summary = {key: result[key] for key in ('status', 'error', 'warnings')}
+        await self._respond(writer, 422, json.dumps(summary).encode(), 'application/json')
+
+    async def handle_socket(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """
+        Serve one process_docx --socket request.
+
+        The request is one JSON line: {'files': [[input, output], ...],
+        'passes', 'config', 'trace', 'low_memory', 'max_rss'}. Every report is
+        queued for the pool at once and its process_report result is sent back
+        as a JSON line when it finishes. A request made with another processor
+        configuration (older or newer code) gets a single {'error'} line.
+        """
+        tasks = []
+        try:
+            request = json.loads(await reader.readline())
+            passes = tuple(request['passes'])
+            if any(name not in PASSES for name in passes) or request['config'] != config_hash(passes):
+                error = 'worker runs a different processor configuration; restart it'
+                writer.write(json.dumps({'error': error}).encode() + b'\n')
+                await writer.drain()
+                return
+            options = {key: request[key] for key in ('trace', 'low_memory', 'max_rss')}
+            tasks = [asyncio.create_task(self._process_requested(input_path, output_path, passes, options))
+                     for input_path, output_path in request['files']]
+            for task in asyncio.as_completed(tasks):
+                result = await task
+                print(f"  [{result['status'].upper()}] {result['file']} "
+                      f"({result['timings']['total']:.3f}s)", flush=True)
+                writer.write(json.dumps(result).encode() + b'\n')
+                await writer.drain()
+        except (ValueError, KeyError, TypeError):
+            writer.write(json.dumps({'error': 'bad request'}).encode() + b'\n')
+        except ConnectionError:
+            pass
+        finally:
+            # A client that went away does not need its remaining reports
+            for task in tasks:
+                task.cancel()
+            await close_writer(writer)
+
+    async def _process_requested(self, input_path: str, output_path: str, passes: tuple[str, ...],
+                                 options: dict) -> dict:
+        # process_report raises only before it starts (e.g. a missing input);
+        # the client still gets a result for every file it sent
+        try:
+            return await self.process(input_path, output_path, passes, **options)
+        except Exception as e:
+            self.counters['failed'] += 1
+            return {'file': input_path, 'output': output_path, 'status': 'failed', 'footer_rid': None,
+                    'signature_tables': 0, 'timings': {'total': 0.0}, 'warnings': [],
+                    'error': f'{type(e).__name__}: {e}'}
+
+    async def _respond(self, writer: asyncio.StreamWriter, status: int, body: bytes,
+                       content_type: str = 'text/plain', extra_headers: dict = None) -> None:
+        reasons = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 411: 'Length Required',
+                   413: 'Payload Too Large', 422: 'Unprocessable Entity', 503: 'Service Unavailable'}
+        headers = {'Content-Type': content_type, 'Content-Length': str(len(body)), 'Connection': 'close',
+                   **(extra_headers or {})}
+        head = f'HTTP/1.1 {status} {reasons[status]}\r\n'
+        head += ''.join(f'{key}: {value}\r\n' for key, value in headers.items()) + '\r\n'
+        writer.write(head.encode('latin-1') + body)
+        await writer.drain()
+
+    def close(self) -> None:
+        self.pool.shutdown(cancel_futures=True)
+        if self.cache is not None:
+            self.cache.close()
+
+
+async def serve(args: argparse.Namespace) -> None:
+    passes = tuple(name.strip() for name in args.passes.split(',') if name.strip())
+    jobs = args.jobs or os.cpu_count() or 1
+    service = ReportService(args.output_dir, jobs, args.queue_size, passes)
+    await service.start()
+
+    tasks = [asyncio.create_task(service.worker()) for _ in range(jobs)]
+    if args.watch_dir:
+        tasks.append(asyncio.create_task(service.watch(args.watch_dir, args.poll_interval)))
+    servers = []
+    if args.http is not None:
+        servers.append(await asyncio.start_server(service.handle_http, args.host, args.http))
+        print(f"HTTP: POST http://{args.host}:{args.http}/process", flush=True)
+    if args.socket is not None:
+        # Only this user may hand the worker files to read and write
+        umask = os.umask(0o177)
+        try:
+            servers.append(await asyncio.start_unix_server(service.handle_socket, args.socket))
+        finally:
+            os.umask(umask)
+        print(f"Socket: process_docx.py --socket {args.socket}", flush=True)
+    if args.watch_dir:
+        print(f"Watching {args.watch_dir} -> {args.output_dir}", flush=True)
+    print(f"{jobs} workers, queue of {args.queue_size}, passes: {', '.join(passes)}", flush=True)
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    await stop.wait()
+
+    print("Shutting down", flush=True)
+    for server in servers:
+        server.close()
+        await server.wait_closed()
+    if args.socket is not None:
+        os.unlink(args.socket)
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    service.close()
+    print(f"Processed: {service.counters}", flush=True)
+
+
+def main(argv: list[str] = None) -> int:
+    parser = argparse.ArgumentParser(description='Process REF615 reports as they arrive.')
+    parser.add_argument('watch_dir', nargs='?', default=None, help='Drop directory to watch')
+    parser.add_argument('-o', '--output-dir', default=None,
+                        help='Where processed reports are written (default: WATCH_DIR/processed)')
+    parser.add_argument('--http', type=int, default=None, metavar='PORT', help='Serve uploads on this port')
+    parser.add_argument('--host', default='127.0.0.1', help='Address for --http (default: 127.0.0.1)')
+    parser.add_argument('--socket', default=None, metavar='PATH',
+                        help='Take process_docx.py --socket requests on this Unix socket')
+    parser.add_argument('-j', '--jobs', type=int, default=None, help='Worker processes (default: CPU count)')
+    parser.add_argument('--queue-size', type=int, default=32, help='Reports allowed to wait for a worker')
+    parser.add_argument('--poll-interval', type=float, default=1.0,
+                        help='Seconds between scans when inotify is unavailable')
+    parser.add_argument('--passes', default=','.join(DEFAULT_PASSES),
+                        help=f"Comma-separated passes to run (available: {', '.join(PASSES)})")
+    args = parser.parse_args(argv)
+
+    if args.watch_dir is None and args.http is None and args.socket is None:
+        parser.error('give a directory to watch, --http PORT, --socket PATH, or a combination')
+    unknown = [name for name in args.passes.split(',') if name.strip() and name.strip() not in PASSES]
+    if unknown:
+        parser.error(f"unknown pass(es): {', '.join(unknown)}")
+    if args.output_dir is None and args.watch_dir is not None:
+        args.output_dir = os.path.join(args.watch_dir, 'processed')
+    if args.watch_dir and os.path.abspath(args.output_dir) == os.path.abspath(args.watch_dir):
+        parser.error('the output directory must differ from the watched directory')
+    if args.socket is not None and os.path.exists(args.socket):
+        # A socket left behind by a worker that died is replaced; a live one is not
+        worker = connect_worker(args.socket)
+        if worker is not None:
+            worker.close()
+            parser.error(f'a worker is already listening on {args.socket}')
+        if not stat.S_ISSOCK(os.stat(args.socket).st_mode):
+            parser.error(f'{args.socket} exists and is not a socket')
+        os.unlink(args.socket)
+
+    asyncio.run(serve(args))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
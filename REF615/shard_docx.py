@@ -0,0 +1,434 @@
+#!/usr/bin/env python3
+"""
+Sharded, resumable batch runs of the REF615 DOCX processor
+
+A campaign is a work queue: a SQLite file, normally on a shared path, with
+one item per report. `init` fills it from the H*.docx glob; `work` starts
+worker processes that claim items one at a time, process them with
+process_report and checkpoint the result (run it on every host that
+mounts the queue); `status` summarizes it.
+
+Outputs go to a separate directory and are written to a temporary file
+that is renamed into place (see write_docx), so a crash never leaves a
+half-written report. A restarted run continues where it stopped: finished
+items are never redone, and items claimed by a worker that died are
+claimed again, straight away if it ran on this host, otherwise once its
+lease expires. Re-running `init` adds new reports and requeues reports
+whose input changed or whose output disappeared.
+
+The queue relies on SQLite's file locking, so the shared filesystem must
+support POSIX locks (NFSv4, SMB); it keeps the rollback journal because
+WAL does not work across hosts.
+
+Usage:
+    python3 shard_docx.py init QUEUE REPORTS_DIR -o OUTPUT_DIR [--passes footer]
+    python3 shard_docx.py work QUEUE [-j JOBS]
+    python3 shard_docx.py status QUEUE [--json FILE]
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import socket
+import sqlite3
+import sys
+import time
+from collections import Counter
+from contextlib import contextmanager
+from pathlib import Path
+
+from process_docx import DEFAULT_PASSES, PASSES, REPORTS_DIR, config_hash, process_report
+
+
+# Seconds a claimed item stays reserved for the worker that claimed it
+LEASE_SECONDS = 15 * 60
+
+# Claims of one item (each lost to a worker that died) before it is marked failed
+MAX_ATTEMPTS = 3
+
+# Seconds to wait for another worker's lock on the queue
+BUSY_TIMEOUT = 60
+
+STATUSES = ('pending', 'claimed', 'ok', 'invalid', 'failed')
+
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS settings (
+        key TEXT PRIMARY KEY,
+        value TEXT NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS items (
+        id INTEGER PRIMARY KEY,
+        input_path TEXT NOT NULL UNIQUE,
+        output_path TEXT NOT NULL,
+        input_size INTEGER NOT NULL,
+        input_mtime_ns INTEGER NOT NULL,
+        status TEXT NOT NULL DEFAULT 'pending',
+        worker TEXT,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        lease_until REAL,
+        finished_at REAL,
+        elapsed REAL,
+        input_sha256 TEXT,
+        output_sha256 TEXT,
+        error TEXT,
+        warnings TEXT
+    );
+    CREATE INDEX IF NOT EXISTS items_status ON items (status, id);
+"""
+
+
+def worker_name() -> str:
+    """Identity recorded on claimed items: host:pid."""
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    # A killed worker lingers as a zombie until its parent reaps it
+    try:
+        with open(f'/proc/{pid}/stat', 'rb') as f:
+            return f.read().rpartition(b')')[2].split()[0] != b'Z'
+    except (OSError, IndexError):
+        return True
+
+
+class WorkQueue:
+    """
+    The SQLite work queue of a sharded run.
+
+    Every state change runs in its own IMMEDIATE transaction, so concurrent
+    workers (processes or hosts) serialize on the database lock and an item
+    is never claimed twice while its lease holds.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.db = sqlite3.connect(path, timeout=BUSY_TIMEOUT, isolation_level=None)
+        self.db.executescript(SCHEMA)
+
+    def close(self) -> None:
+        self.db.close()
+
+    @contextmanager
+    def _transaction(self):
+        self.db.execute('BEGIN IMMEDIATE')
+        try:
+            yield
+        except BaseException:
+            self.db.execute('ROLLBACK')
+            raise
+        self.db.execute('COMMIT')
+
+    def settings(self) -> dict:
+        """The run settings stored by configure() (empty before init)."""
+        return {key: json.loads(value) for key, value in self.db.execute('SELECT key, value FROM settings')}
+
+    def configure(self, settings: dict, reset: bool = False) -> None:
+        """
+        Store the run settings.
+
+        Raises:
+            ValueError: If the queue already holds items processed with
+                other settings and reset is not set
+        """
+        with self._transaction():
+            current = self.settings()
+            if current and current != settings:
+                if not reset:
+                    raise ValueError(f'{self.path} was initialized with other settings '
+                                     f'(use --reset to start over): {current}')
+            if reset:
+                self.db.execute('DELETE FROM items')
+            self.db.execute('DELETE FROM settings')
+            self.db.executemany('INSERT INTO settings VALUES (?, ?)',
+                                [(key, json.dumps(value)) for key, value in settings.items()])
+
+    def add(self, files: list, output_dir: str) -> tuple[int, int]:
+        """
+        Queue reports, writing each output to output_dir under its own name.
+
+        Reports already queued are left alone unless they are finished and
+        their input changed or their output is gone; those are requeued.
+
+        Returns:
+            (reports added, reports requeued)
+        """
+        added = requeued = 0
+        with self._transaction():
+            for path in files:
+                input_path = os.path.abspath(path)
+                output_path = os.path.join(os.path.abspath(output_dir), os.path.basename(input_path))
+                st = os.stat(input_path)
+                row = self.db.execute(
+                    'SELECT id, status, input_size, input_mtime_ns FROM items WHERE input_path = ?',
+                    (input_path,)).fetchone()
+                if row is None:
+                    self.db.execute(
+                        'INSERT INTO items (input_path, output_path, input_size, input_mtime_ns) '
+                        'VALUES (?, ?, ?, ?)', (input_path, output_path, st.st_size, st.st_mtime_ns))
+                    added += 1
+                    continue
+                item_id, status, size, mtime_ns = row
+                changed = (size, mtime_ns) != (st.st_size, st.st_mtime_ns)
+                if status in ('ok', 'invalid', 'failed') and (changed or not os.path.exists(output_path)):
+                    self.db.execute(
+                        "UPDATE items SET status = 'pending', attempts = 0, worker = NULL, error = NULL, "
+                        'output_path = ?, input_size = ?, input_mtime_ns = ? WHERE id = ?',
+                        (output_path, st.st_size, st.st_mtime_ns, item_id))
+                    requeued += 1
+        return added, requeued
+
+    def claim(self, worker: str) -> tuple[int, str, str] | None:
+        """
+        Claim the next pending item (or one whose lease expired) for worker.
+
+        Returns:
+            (item id, input path, output path), or None when nothing is left
+        """
+        now = time.time()
+        with self._transaction():
+            # Items whose workers kept dying are not handed out again
+            self.db.execute(
+                "UPDATE items SET status = 'failed', error = ?, finished_at = ? "
+                "WHERE status = 'claimed' AND lease_until < ? AND attempts >= ?",
+                (f'abandoned after {MAX_ATTEMPTS} attempts', now, now, MAX_ATTEMPTS))
+            row = self.db.execute(
+                "SELECT id, input_path, output_path FROM items "
+                "WHERE status = 'pending' OR (status = 'claimed' AND lease_until < ?) "
+                "ORDER BY id LIMIT 1", (now,)).fetchone()
+            if row is None:
+                return None
+            self.db.execute(
+                "UPDATE items SET status = 'claimed', worker = ?, lease_until = ?, attempts = attempts + 1 "
+                "WHERE id = ?", (worker, now + LEASE_SECONDS, row[0]))
+        return row
+
+    def complete(self, item_id: int, worker: str, result: dict) -> bool:
+        """
+        Checkpoint a processed item (see process_report).
+
+        Returns:
+            False if worker no longer holds the item (its lease expired and
+            another worker claimed it); the result is then not recorded
+        """
+        with self._transaction():
+            cursor = self.db.execute(
+                'UPDATE items SET status = ?, finished_at = ?, elapsed = ?, input_sha256 = ?, '
+                'output_sha256 = ?, error = ?, warnings = ?, lease_until = NULL '
+                "WHERE id = ? AND worker = ? AND status = 'claimed'",
+                (result['status'], time.time(), result['timings'].get('total'),
+                 result.get('input_sha256'), result.get('output_sha256'), result['error'],
+                 json.dumps(result['warnings']), item_id, worker))
+        return cursor.rowcount == 1
+
+    def reclaim_orphans(self, host: str) -> int:
+        """Release items claimed by workers on host that are no longer running."""
+        with self._transaction():
+            rows = self.db.execute(
+                "SELECT id, worker, attempts FROM items WHERE status = 'claimed' AND worker LIKE ?",
+                (host + ':%',)).fetchall()
+            orphans = [(item_id, attempts) for item_id, worker, attempts in rows
+                       if not _pid_alive(int(worker.rpartition(':')[2]))]
+            for item_id, attempts in orphans:
+                if attempts >= MAX_ATTEMPTS:
+                    self.db.execute(
+                        "UPDATE items SET status = 'failed', error = ?, finished_at = ? WHERE id = ?",
+                        (f'abandoned after {MAX_ATTEMPTS} attempts', time.time(), item_id))
+                else:
+                    self.db.execute("UPDATE items SET status = 'pending', worker = NULL WHERE id = ?",
+                                    (item_id,))
+        return len(orphans)
+
+    def retry_failed(self) -> int:
+        """Requeue every failed item."""
+        with self._transaction():
+            cursor = self.db.execute(
+                "UPDATE items SET status = 'pending', attempts = 0, worker = NULL, error = NULL "
+                "WHERE status = 'failed'")
+        return cursor.rowcount
+
+    def counts(self) -> Counter:
+        return Counter(dict(self.db.execute('SELECT status, COUNT(*) FROM items GROUP BY status')))
+
+    def items(self) -> list[dict]:
+        cursor = self.db.execute('SELECT * FROM items ORDER BY id')
+        columns = [column[0] for column in cursor.description]
+        return [dict(zip(columns, row)) for row in cursor]
+
+
+def work(queue_path: str) -> Counter:
+    """
+    Claim and process items until the queue is drained.
+
+    Returns:
+        Items checkpointed by this worker, by status ('lost' for results
+        not recorded because the lease had expired)
+    """
+    queue = WorkQueue(queue_path)
+    worker = worker_name()
+    counts = Counter()
+    try:
+        settings = queue.settings()
+        passes = tuple(settings['passes'])
+        if settings['config'] != config_hash(passes):
+            raise SystemExit(f'{queue_path} was initialized by a different processor version; '
+                             f're-run init with --reset')
+        while (item := queue.claim(worker)) is not None:
+            item_id, input_path, output_path = item
+            start = time.perf_counter()
+            try:
+                result = process_report(input_path, output_path, passes,
+                                        low_memory=settings['low_memory'], max_rss=settings['max_rss'])
+            except Exception as e:
+                # Checkpoint it as failed rather than dying with the item claimed:
+                # every other worker would wait out the lease, then fail the same way
+                result = {'file': input_path, 'output': output_path, 'status': 'failed',
+                          'timings': {'total': round(time.perf_counter() - start, 6)}, 'warnings': [],
+                          'error': f'{type(e).__name__}: {e}'}
+            if not queue.complete(item_id, worker, result):
+                result['status'] = 'lost'
+            counts[result['status']] += 1
+            line = f"  [{result['status'].upper()}] {input_path} ({result['timings']['total']:.3f}s)"
+            if result['error']:
+                line += f" - {result['error']}"
+            print(line, flush=True)
+    finally:
+        queue.close()
+    return counts
+
+
+def _work_process(queue_path: str) -> None:
+    try:
+        work(queue_path)
+    except KeyboardInterrupt:
+        # The claimed item stays claimed; the next run on this host reclaims it
+        sys.exit(130)
+
+
+def print_status(queue: WorkQueue) -> None:
+    counts = queue.counts()
+    total = sum(counts.values())
+    print(f"{queue.path}: {total} items - " + ', '.join(f'{counts[status]} {status}' for status in STATUSES))
+    for item in queue.items():
+        if item['status'] in ('failed', 'invalid'):
+            print(f"  [{item['status'].upper()}] {item['input_path']} - {item['error'] or item['warnings']}")
+        elif item['status'] == 'claimed':
+            remaining = (item['lease_until'] or 0) - time.time()
+            print(f"  [CLAIMED] {item['input_path']} by {item['worker']} "
+                  f"(attempt {item['attempts']}, lease {max(remaining, 0):.0f}s)")
+
+
+def main(argv: list[str] = None) -> int:
+    parser = argparse.ArgumentParser(description='Sharded, resumable REF615 report processing.')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    init = commands.add_parser('init', help='Create or update the work queue from the H*.docx glob')
+    init.add_argument('queue', help='Work queue database (on a path every worker host can reach)')
+    init.add_argument('reports_dir', nargs='?', default=str(REPORTS_DIR),
+                      help='Directory containing the H*.docx reports')
+    init.add_argument('-o', '--output-dir', required=True,
+                      help='Directory for the processed reports (must differ from reports_dir)')
+    init.add_argument('--passes', default=','.join(DEFAULT_PASSES),
+                      help=f"Comma-separated passes to run (available: {', '.join(PASSES)})")
+    init.add_argument('--low-memory', action='store_true', help='Use the streaming engine')
+    init.add_argument('--max-rss', type=int, default=None, metavar='MIB',
+                      help='Fail any report whose worker process exceeds this resident size')
+    init.add_argument('--reset', action='store_true',
+                      help='Drop every item and start over (needed to change settings)')
+
+    run = commands.add_parser('work', help='Process queued items until none are left')
+    run.add_argument('queue', help='Work queue database')
+    run.add_argument('-j', '--jobs', type=int, default=None, help='Worker processes (default: CPU count)')
+    run.add_argument('--retry-failed', action='store_true', help='Requeue failed items first')
+
+    status = commands.add_parser('status', help='Summarize the work queue')
+    status.add_argument('queue', help='Work queue database')
+    status.add_argument('--json', default=None, help='Write every item to this JSON file')
+    args = parser.parse_args(argv)
+
+    if args.command == 'init':
+        passes = tuple(name.strip() for name in args.passes.split(',') if name.strip())
+        unknown = [name for name in passes if name not in PASSES]
+        if unknown:
+            parser.error(f"unknown pass(es): {', '.join(unknown)}")
+        reports_dir = Path(args.reports_dir).resolve()
+        output_dir = Path(args.output_dir).resolve()
+        if output_dir == reports_dir:
+            parser.error('the output directory must differ from the reports directory')
+        output_dir.mkdir(parents=True, exist_ok=True)
+        settings = {
+            'output_dir': str(output_dir),
+            'passes': list(passes),
+            'config': config_hash(passes),
+            'low_memory': args.low_memory,
+            'max_rss': args.max_rss and args.max_rss * 2**20,
+        }
+        queue = WorkQueue(args.queue)
+        try:
+            queue.configure(settings, args.reset)
+            added, requeued = queue.add(sorted(reports_dir.glob('H*.docx')), str(output_dir))
+            print(f"{added} reports added, {requeued} requeued")
+            print_status(queue)
+        except ValueError as e:
+            parser.error(str(e))
+        finally:
+            queue.close()
+        return 0
+
+    queue = WorkQueue(args.queue)
+    try:
+        if args.command == 'status':
+            print_status(queue)
+            if args.json:
+                with open(args.json, 'w', encoding='utf-8') as f:
+                    json.dump(queue.items(), f, indent=2)
+            return 0
+        if not queue.settings():
+            parser.error(f'{args.queue} has not been initialized (run init first)')
+        if args.retry_failed:
+            print(f"{queue.retry_failed()} failed items requeued")
+        reclaimed = queue.reclaim_orphans(socket.gethostname())
+        if reclaimed:
+            print(f"{reclaimed} items of stopped workers on this host reclaimed")
+    finally:
+        queue.close()
+
+    jobs = args.jobs or os.cpu_count() or 1
+    start = time.perf_counter()
+    if jobs == 1:
+        try:
+            work(args.queue)
+        except KeyboardInterrupt:
+            return 130
+    else:
+        workers = [multiprocessing.Process(target=_work_process, args=(args.queue,)) for _ in range(jobs)]
+        for process in workers:
+            process.start()
+        try:
+            for process in workers:
+                process.join()
+        except KeyboardInterrupt:
+            # Workers got the same SIGINT; wait for them to leave the queue consistent
+            for process in workers:
+                process.join()
+            return 130
+    elapsed = time.perf_counter() - start
+
+    queue = WorkQueue(args.queue)
+    try:
+        print(f"\nWorkers finished in {elapsed:.3f}s")
+        print_status(queue)
+        counts = queue.counts()
+    finally:
+        queue.close()
+    return 1 if counts['failed'] or counts['invalid'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,19 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+REF615_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REF615_DIR))
+
+from process_docx import NAMESPACES  # noqa: E402
+
+
+@pytest.fixture
+def make_document():
+    """Build a minimal document.xml around body markup."""
+    def make(body: str, newline: str = '') -> str:
+        return (f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>{newline}'
+                f'<w:document xmlns:w="{NAMESPACES["w"]}" xmlns:r="{NAMESPACES["r"]}">{newline}'
+                f'<w:body>{body}</w:body>{newline}</w:document>')
+    return make
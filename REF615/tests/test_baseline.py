@@ -0,0 +1,82 @@
+"""
+The footer pass against the output of the original script
+
+Final_Reports holds what the original regex-based script made of the
+reports in Final_Reports_Backup. The current pipeline reproduces it part
+for part, except for two intended changes:
+- empty paragraphs whose w:pPr holds a w:pStyle and a w:rPr are trimmed
+  too (the original pattern only matched spacing-only paragraphs)
+- parts keep their CRLF line endings (the original re-read them in text
+  mode, which turned CRLF into LF)
+"""
+
+import io
+import zipfile
+from difflib import SequenceMatcher
+
+import pytest
+
+from conftest import REF615_DIR
+from process_docx import (CONTENT_TYPES_PART, DOCUMENT_PART, DOCUMENT_RELS_PART, index_document,
+                          is_empty_paragraph, iter_body_children, process_docx)
+
+SOURCE_DIR = REF615_DIR / 'Final_Reports_Backup'
+BASELINE_DIR = REF615_DIR / 'Final_Reports'
+# Parts the original script read and rewrote in text mode
+TEXT_MODE_PARTS = (CONTENT_TYPES_PART, DOCUMENT_RELS_PART)
+
+REPORTS = sorted(path.name for path in SOURCE_DIR.glob('H*.docx'))
+
+
+def _body_children(data: bytes) -> list[tuple[str, dict]]:
+    return [(markup, ns) for _, markup, ns in iter_body_children(io.BytesIO(data))]
+
+
+def _assert_document_matches(new: bytes, old: bytes) -> None:
+    # Everything outside w:body is unchanged
+    assert new[:new.index(b'<w:body>')] == old[:old.index(b'<w:body>')]
+    assert new[new.rindex(b'</w:body>'):] == old[old.rindex(b'</w:body>'):]
+
+    new_children, old_children = _body_children(new), _body_children(old)
+    matcher = SequenceMatcher(None, [markup for markup, _ in old_children],
+                              [markup for markup, _ in new_children], autojunk=False)
+    removed = []
+    for tag, i1, i2, _, _ in matcher.get_opcodes():
+        if tag != 'equal':
+            assert tag == 'delete', 'only removals differ from the original output'
+            removed.extend(old_children[i1:i2])
+    assert removed, 'the pStyle/rPr empty paragraphs are trimmed now'
+    for markup, ns in removed:
+        index = index_document(markup, ns)
+        assert is_empty_paragraph(index, index.elements[0])
+        assert '<w:pStyle' in markup and '<w:rPr>' in markup
+
+
+@pytest.mark.parametrize('name', REPORTS)
+def test_footer_pass_matches_baseline(tmp_path, name):
+    output = tmp_path / name
+    assert process_docx(str(SOURCE_DIR / name), str(output))
+
+    with zipfile.ZipFile(output) as ours, zipfile.ZipFile(BASELINE_DIR / name) as baseline, \
+            zipfile.ZipFile(SOURCE_DIR / name) as source:
+        assert sorted(ours.namelist()) == sorted(baseline.namelist())
+        for part in ours.namelist():
+            new, old = ours.read(part), baseline.read(part)
+            if part == DOCUMENT_PART:
+                _assert_document_matches(new, old)
+                continue
+            if part in TEXT_MODE_PARTS:
+                assert new.replace(b'\r\n', b'\n') == old, part
+                assert new.count(b'\r\n') == source.read(part).count(b'\r\n'), part
+            else:
+                assert new == old, part
+
+
+def test_crlf_parts_are_preserved(tmp_path):
+    # The reports' rels and content types use CRLF, which the original turned into LF
+    output = tmp_path / REPORTS[0]
+    assert process_docx(str(SOURCE_DIR / REPORTS[0]), str(output))
+    with zipfile.ZipFile(output) as ours, zipfile.ZipFile(BASELINE_DIR / REPORTS[0]) as baseline:
+        for part in TEXT_MODE_PARTS:
+            assert b'?>\r\n' in ours.read(part)
+            assert b'\r\n' not in baseline.read(part)
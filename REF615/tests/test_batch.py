@@ -0,0 +1,49 @@
+"""
+run_batch and its manifest, with one good and one missing report
+"""
+
+import csv
+import json
+from collections import Counter
+
+import pytest
+
+from conftest import REF615_DIR
+from process_docx import run_batch
+
+SOURCE = REF615_DIR / 'Final_Reports_Backup' / 'H01.docx'
+
+
+@pytest.mark.parametrize('jobs', [1, 2])
+@pytest.mark.parametrize('suffix', ['.json', '.csv'])
+def test_manifest(tmp_path, capsys, jobs, suffix):
+    missing = tmp_path / 'H99.docx'
+    manifest = tmp_path / f'manifest{suffix}'
+    results = run_batch([SOURCE, missing], jobs=jobs, manifest_path=str(manifest),
+                        output_dir=str(tmp_path / 'out'))
+    assert Counter(r['status'] for r in results) == {'ok': 1, 'failed': 1}
+
+    if suffix == '.json':
+        rows = json.loads(manifest.read_text(encoding='utf-8'))
+        good, bad = rows
+        assert good['timings']['total'] > 0 and 'footer' in good['timings']
+        assert good['warnings'] == [] and good['input_sha256'] and good['output_sha256']
+        assert bad['warnings'] == []
+    else:
+        with open(manifest, encoding='utf-8', newline='') as f:
+            reader = csv.DictReader(f)
+            rows = list(reader)
+        assert reader.fieldnames[:7] == ['file', 'output', 'status', 'footer_rid', 'signature_tables',
+                                         'error', 'warnings']
+        assert 'time_total' in reader.fieldnames and 'time_footer' in reader.fieldnames
+        good, bad = rows
+        assert float(good['time_total']) > 0 and good['warnings'] == ''
+        assert bad['time_footer'] == ''
+
+    # In input order, whichever finished first
+    assert [row['file'] for row in rows] == [str(SOURCE), str(missing)]
+    assert [row['status'] for row in rows] == ['ok', 'failed']
+    assert good['output'] == str(tmp_path / 'out' / 'H01.docx')
+    assert str(good['footer_rid']).startswith('rId') and int(good['signature_tables']) > 0
+    assert not good['error']
+    assert bad['error'].startswith('FileNotFoundError')
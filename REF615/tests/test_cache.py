@@ -0,0 +1,104 @@
+"""
+ProcessCache: which reports count as already processed
+"""
+
+import os
+import shutil
+
+import pytest
+
+import process_docx
+from conftest import REF615_DIR
+from process_docx import DEFAULT_PASSES, ProcessCache, config_hash, process_report, run_batch
+
+SOURCE = REF615_DIR / 'Final_Reports_Backup' / 'H01.docx'
+CONFIG = config_hash(DEFAULT_PASSES)
+
+
+@pytest.fixture
+def processed(tmp_path):
+    """A report processed into out/ and recorded; yields (cache, input, output)."""
+    input_path, output_path = tmp_path / 'H01.docx', tmp_path / 'out' / 'H01.docx'
+    shutil.copyfile(SOURCE, input_path)
+    output_path.parent.mkdir()
+    result = process_report(str(input_path), str(output_path))
+    assert result['status'] == 'ok'
+    cache = ProcessCache(str(tmp_path / 'cache.sqlite'))
+    cache.record(result, CONFIG)
+    yield cache, str(input_path), str(output_path)
+    cache.close()
+
+
+def test_unchanged_report_is_up_to_date(processed):
+    cache, input_path, output_path = processed
+    assert cache.is_up_to_date(input_path, output_path, CONFIG)
+
+
+def test_touched_report_with_the_same_content_is_up_to_date(processed):
+    cache, input_path, output_path = processed
+    os.utime(input_path, ns=(0, 0))
+    os.utime(output_path, ns=(0, 0))
+    assert cache.is_up_to_date(input_path, output_path, CONFIG)
+
+
+def test_changed_input_is_processed_again(processed):
+    cache, input_path, output_path = processed
+    with open(input_path, 'ab') as f:
+        f.write(b'\0')
+    assert not cache.is_up_to_date(input_path, output_path, CONFIG)
+
+
+def test_other_passes_are_processed_again(processed):
+    cache, input_path, output_path = processed
+    assert not cache.is_up_to_date(input_path, output_path, config_hash(DEFAULT_PASSES + ('shared-headers',)))
+
+
+def test_new_processor_version_is_processed_again(processed, monkeypatch):
+    cache, input_path, output_path = processed
+    monkeypatch.setattr(process_docx, 'PROCESSOR_VERSION', process_docx.PROCESSOR_VERSION + 1)
+    assert not cache.is_up_to_date(input_path, output_path, config_hash(DEFAULT_PASSES))
+
+
+def test_deleted_output_is_processed_again(processed):
+    cache, input_path, output_path = processed
+    os.remove(output_path)
+    assert not cache.is_up_to_date(input_path, output_path, CONFIG)
+
+
+def test_other_output_path_is_processed_again(processed, tmp_path):
+    cache, input_path, _ = processed
+    assert not cache.is_up_to_date(input_path, str(tmp_path / 'H01.docx'), CONFIG)
+
+
+def test_unknown_report_is_not_up_to_date(processed, tmp_path):
+    cache, _, output_path = processed
+    assert not cache.is_up_to_date(str(tmp_path / 'H02.docx'), output_path, CONFIG)
+
+
+def test_report_processed_in_place(tmp_path):
+    path = tmp_path / 'H01.docx'
+    shutil.copyfile(SOURCE, path)
+    result = process_report(str(path))
+    cache = ProcessCache(str(tmp_path / 'cache.sqlite'))
+    try:
+        cache.record(result, CONFIG)
+        assert cache.is_up_to_date(str(path), str(path), CONFIG)
+        shutil.copyfile(SOURCE, path)
+        assert not cache.is_up_to_date(str(path), str(path), CONFIG)
+    finally:
+        cache.close()
+
+
+def test_missing_input_is_a_failed_result(tmp_path):
+    result = process_report(str(tmp_path / 'H01.docx'), str(tmp_path / 'out.docx'))
+    assert result['status'] == 'failed'
+    assert result['error'].startswith('FileNotFoundError')
+    assert 'input_sha256' not in result
+    assert result['timings']['total'] >= 0
+
+
+def test_batch_skips_processed_reports(tmp_path, capsys):
+    cache_path, output_dir = str(tmp_path / 'cache.sqlite'), str(tmp_path / 'out')
+    first = run_batch([SOURCE], jobs=1, output_dir=output_dir, cache_path=cache_path)
+    second = run_batch([SOURCE], jobs=1, output_dir=output_dir, cache_path=cache_path)
+    assert [r['status'] for r in first + second] == ['ok', 'skipped']
@@ -0,0 +1,76 @@
+"""
+collect_docx: typed rows from a report, and incremental updates of the store
+"""
+
+import shutil
+import sqlite3
+from contextlib import closing
+
+import pytest
+
+import collect_docx
+from collect_docx import CATEGORIES, ResultStore, update_store
+from conftest import REF615_DIR
+
+SOURCE = REF615_DIR / 'Final_Reports_Backup' / 'H01.docx'
+
+
+def _rows(database, table: str) -> list[tuple]:
+    with closing(sqlite3.connect(database)) as db:
+        return [row[1:] for row in db.execute(f'SELECT * FROM {table} ORDER BY rowid')]
+
+
+def test_collect_report(tmp_path, capsys):
+    database = tmp_path / 'results.sqlite'
+    assert collect_docx.main([str(SOURCE), '-d', str(database), '-j', '1']) == 0
+    assert '1 extracted, 0 unchanged' in capsys.readouterr().out
+
+    (report,) = _rows(database, 'reports')
+    assert report[3:] == ('YABREEN', 'H01', 'CAPACITOR BANK 01', 'OC/EF Prot. Relay', 'REF 615', '1VHR91707457',
+                          '600/1', '1A')
+    counts = {category: len(_rows(database, category)) for category in CATEGORIES}
+    assert counts == {'settings': 12, 'timing': 21, 'measurement': 3, 'auto_reclose': 1}
+
+    settings = _rows(database, 'settings')
+    assert settings[0] == (1, 'PHLPTOC1:1', 'Low', 'A', 0.5, 0.501, 0.47, 'OK')
+    assert settings[3] == (4, 'PHIPTOC1:1', 'Instantaneous', 'A', 5.0, 5.08, 4.68, 'OK')
+    timing = _rows(database, 'timing')
+    # The calculated time and the point it applies to come from the row above the results
+    assert timing[0] == (1, 'PHLPTOC1:1', 'Low', 'IEC Normal Inv.', 2.0, 'A', 2.49, 's', 2.53, 's')
+    assert timing[4] == (5, 'PHLPTOC1:1', 'Low', 'IEC Normal Inv.', 5.0, 'B', 1.09, 'ms', 1.09, 'ms')
+    assert _rows(database, 'measurement')[0] == (1, 'current', '600 A', 'R-N', 1.0, 'A', 600.1, 'OK')
+    assert _rows(database, 'auto_reclose') == [(1, 1, 7.0, 8.0, 1, 7.0, 8.0, 'OK')]
+
+    assert collect_docx.main([str(SOURCE), '-d', str(database), '-j', '1']) == 0
+    assert '0 extracted, 1 unchanged, 0 removed, 0 failed' in capsys.readouterr().out
+    assert len(_rows(database, 'settings')) == 12
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = ResultStore(str(tmp_path / 'results.sqlite'))
+    yield store
+    store.close()
+
+
+def test_touched_report_is_unchanged(tmp_path, store):
+    path = tmp_path / 'H01.docx'
+    shutil.copyfile(SOURCE, path)
+    assert [r['status'] for r in update_store(store, [str(path)], jobs=1)] == ['extracted']
+    shutil.copyfile(SOURCE, path)
+    # New mtime, same document.xml
+    assert [r['status'] for r in update_store(store, [str(path)], jobs=1)] == ['unchanged']
+
+
+def test_report_that_vanished(tmp_path, store):
+    stored, new = tmp_path / 'H01.docx', tmp_path / 'H02.docx'
+    shutil.copyfile(SOURCE, stored)
+    update_store(store, [str(stored)], jobs=1)
+    stored.unlink()
+
+    # Both were listed, then deleted before they were looked at
+    results = update_store(store, [str(stored), str(new)], jobs=1)
+    assert [r['status'] for r in results] == ['removed', 'failed']
+    assert results[1]['error'].startswith('FileNotFoundError')
+    assert store.known() == {}
+    assert store.db.execute('SELECT COUNT(*) FROM settings').fetchone() == (0,)
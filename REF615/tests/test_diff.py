@@ -0,0 +1,62 @@
+"""
+diff_docx: identical, processed and reordered reports
+"""
+
+import shutil
+import zipfile
+
+from conftest import REF615_DIR
+from diff_docx import diff_part, diff_report
+from process_docx import DOCUMENT_PART, FOOTER_PART, process_docx
+
+SOURCE = REF615_DIR / 'Final_Reports_Backup' / 'H01.docx'
+
+
+def _paragraph(text: str, rsid: str = '00A1B2C3') -> str:
+    return f'<w:p w:rsidR="{rsid}"><w:r><w:t>{text}</w:t></w:r></w:p>'
+
+
+def test_identical_report(tmp_path):
+    copy = tmp_path / 'H01.docx'
+    shutil.copyfile(SOURCE, copy)
+    result = diff_report(str(copy), str(SOURCE))
+    assert result['status'] == 'identical' and result['parts'] == {}
+    with zipfile.ZipFile(SOURCE) as source:
+        assert result['same'] == len(source.namelist())
+
+
+def test_processed_report(tmp_path):
+    output = tmp_path / 'H01.docx'
+    assert process_docx(str(SOURCE), str(output))
+    result = diff_report(str(output), str(SOURCE))
+    assert result['status'] == 'changed'
+    assert result['added'] == [FOOTER_PART] and result['removed'] == []
+
+    document = result['parts'][DOCUMENT_PART]
+    assert document['same'] + len(document['changed']) + len(document['removed']) == document['blocks'][0]
+    assert document['moved'] == [] and document['added'] == []
+    # Every section gets a footer reference; the tables of the first page lose their shading
+    kinds = {entry[0] for entry in document['changed']}
+    assert kinds == {'tbl', 'p', 'sectPr'}
+    assert any('footerReference' in entry[4] for entry in document['changed'])
+    # The signature table moves into the footer; the empty paragraphs at the end are removed
+    assert [entry[0] for entry in document['removed']].count('tbl') == 1
+    assert {entry[0] for entry in document['removed']} == {'tbl', 'p'}
+
+
+def test_revision_noise_is_ignored(make_document):
+    old = make_document(_paragraph('one') + _paragraph('two')).encode()
+    new = make_document(_paragraph('one', '00FFFFFF') + _paragraph('two')).encode()
+    assert diff_part(DOCUMENT_PART, old, new) == {
+        'blocks': [2, 2], 'same': 2, 'added': [], 'removed': [], 'changed': [], 'moved': []}
+
+
+def test_moved_and_changed_blocks(make_document):
+    old = make_document(_paragraph('one') + _paragraph('two') + _paragraph('three') + _paragraph('four')).encode()
+    # The same blocks counted by kind: only their order and one text differ
+    new = make_document(_paragraph('two') + _paragraph('one') + _paragraph('three') + _paragraph('4')).encode()
+    result = diff_part(DOCUMENT_PART, old, new)
+    assert result['moved'] == [['p', 1, 0, 'two']]
+    assert result['changed'] == [['p', 3, 3, 'four', '4']]
+    assert result['added'] == result['removed'] == []
+    assert result['same'] == 2
@@ -0,0 +1,54 @@
+"""
+shared-headers: identical headers collapse, distinct ones stay raw-copied
+"""
+
+import re
+import zipfile
+
+from conftest import REF615_DIR
+from process_docx import DOCUMENT_PART, DOCUMENT_RELS_PART, PackageValidator, process_docx
+
+SOURCE = REF615_DIR / 'Final_Reports_Backup' / 'H01.docx'
+PASSES = ('footer', 'shared-headers')
+HEADERS = [f'word/header{i}.xml' for i in range(1, 10)]
+
+
+def test_distinct_headers_are_copied_raw(tmp_path):
+    output, stats = tmp_path / 'H01.docx', {}
+    assert process_docx(str(SOURCE), str(output), stats, PASSES)
+    assert stats['shared_headers'] == {'parts': 9, 'collapsed': 0}
+    with zipfile.ZipFile(SOURCE) as source, zipfile.ZipFile(output) as ours:
+        for name in HEADERS:
+            old, new = source.getinfo(name), ours.getinfo(name)
+            assert (new.CRC, new.compress_size) == (old.CRC, old.compress_size)
+
+
+def test_headers_differing_only_in_revision_noise_collapse(tmp_path):
+    # header2.xml becomes header1.xml with other rsids; their .rels are the same
+    source_path = tmp_path / 'source.docx'
+    with zipfile.ZipFile(SOURCE) as source, zipfile.ZipFile(source_path, 'w', zipfile.ZIP_DEFLATED) as crafted:
+        header1 = source.read('word/header1.xml').decode('utf-8')
+        assert source.read('word/_rels/header1.xml.rels') == source.read('word/_rels/header2.xml.rels')
+        for info in source.infolist():
+            data = source.read(info)
+            if info.filename == 'word/header2.xml':
+                data = re.sub(r'(w:rsid\w*=")[0-9A-F]+"', r'\g<1>00C0FFEE"', header1).encode('utf-8')
+                assert data != header1.encode('utf-8')
+            crafted.writestr(info.filename, data)
+
+    output, stats, validator = tmp_path / 'output.docx', {}, PackageValidator()
+    assert process_docx(str(source_path), str(output), stats, PASSES, validator=validator)
+    warnings = []
+    assert validator.finish(warnings) and warnings == []
+    assert stats['shared_headers'] == {'parts': 9, 'collapsed': 1}
+
+    with zipfile.ZipFile(source_path) as source, zipfile.ZipFile(output) as ours:
+        names = ours.namelist()
+        assert 'word/header2.xml' not in names and 'word/_rels/header2.xml.rels' not in names
+        assert 'header2.xml' not in ours.read(DOCUMENT_RELS_PART).decode('utf-8')
+        # Every section that showed header2 now shows header1
+        references = re.findall(r'<w:headerReference [^>]*r:id="(rId\d+)"', source.read(DOCUMENT_PART).decode())
+        ours_references = re.findall(r'<w:headerReference [^>]*r:id="(rId\d+)"', ours.read(DOCUMENT_PART).decode())
+        assert len(ours_references) == len(references)
+        assert len(set(ours_references)) == len(set(references)) - 1
+        assert ours.read('word/header1.xml') == source.read('word/header1.xml')
@@ -0,0 +1,167 @@
+"""
+media and media-recompress passes: pruning, deduplication and re-encoding
+"""
+
+import io
+import zipfile
+
+import pytest
+
+import process_docx
+from conftest import REF615_DIR
+from process_docx import (CONTENT_TYPES_PART, DOCUMENT_PART, DOCUMENT_RELS_PART, MEDIA_FOLDER, PackageValidator,
+                          parse_relationships)
+
+SOURCE = REF615_DIR / 'Final_Reports_Backup' / 'H01.docx'
+IMAGE_REL = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships/image'
+HEADER_REL = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships/header'
+
+
+def _drawing(rid: str) -> str:
+    return f'<w:p><w:r><w:drawing><a:blip xmlns:a="a" r:embed="{rid}"/></w:drawing></w:r></w:p>'
+
+
+def _rels(*relationships: tuple[str, str, str]) -> str:
+    body = ''.join(f'<Relationship Id="{rid}" Type="{kind}" Target="{target}"/>'
+                   for rid, kind, target in relationships)
+    return ('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            f'<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">{body}'
+            '</Relationships>')
+
+
+def _content_types(*overrides: str) -> str:
+    return ('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+            '<Default Extension="png" ContentType="image/png"/>'
+            '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+            '<Default Extension="xml" ContentType="application/xml"/>'
+            + ''.join(f'<Override PartName="/{name}" ContentType="image/png"/>' for name in overrides)
+            + '</Types>')
+
+
+def _run(tmp_path, parts: dict[str, str | bytes], passes=('media',)) -> tuple[dict, zipfile.ZipFile]:
+    source = tmp_path / 'source.docx'
+    with zipfile.ZipFile(source, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for name, data in parts.items():
+            archive.writestr(name, data)
+    output, stats, validator = tmp_path / 'output.docx', {}, PackageValidator(expect_footer=False)
+    assert process_docx.process_docx(str(source), str(output), stats, passes, validator=validator)
+    warnings = []
+    assert validator.finish(warnings), warnings
+    return stats, zipfile.ZipFile(output)
+
+
+def test_unreferenced_media_is_pruned(tmp_path, make_document):
+    stats, output = _run(tmp_path, {
+        CONTENT_TYPES_PART: _content_types('word/media/orphan.png'),
+        DOCUMENT_PART: make_document(_drawing('rId1')),
+        # rId2 lost its drawing (as signature images do); orphan.png has no relationship at all
+        DOCUMENT_RELS_PART: _rels(('rId1', IMAGE_REL, 'media/kept.png'), ('rId2', IMAGE_REL, 'media/signature.png')),
+        'word/media/kept.png': b'kept',
+        'word/media/signature.png': b'signature',
+        'word/media/orphan.png': b'orphan',
+    })
+    with output:
+        assert [name for name in output.namelist() if name.startswith(MEDIA_FOLDER)] == ['word/media/kept.png']
+        assert list(parse_relationships(output.read(DOCUMENT_RELS_PART).decode())) == ['rId1']
+        assert 'orphan.png' not in output.read(CONTENT_TYPES_PART).decode()
+    assert stats['media'] == {'parts': 3, 'relationships_pruned': 1, 'unreferenced': 2, 'duplicates': 0,
+                              'bytes_removed': len(b'signature') + len(b'orphan')}
+
+
+def test_identical_media_is_merged(tmp_path, make_document):
+    logo = bytes(range(256)) * 8
+    header = make_document(_drawing('rId1')).replace('w:document', 'w:hdr')
+    stats, output = _run(tmp_path, {
+        CONTENT_TYPES_PART: _content_types('word/media/image3.png'),
+        DOCUMENT_PART: make_document(_drawing('rId1') + _drawing('rId2') + _drawing('rId3')),
+        DOCUMENT_RELS_PART: _rels(('rId1', IMAGE_REL, 'media/image1.png'), ('rId2', IMAGE_REL, 'media/image2.png'),
+                                  ('rId3', IMAGE_REL, 'media/image3.png'), ('rId4', HEADER_REL, 'header1.xml')),
+        'word/header1.xml': header,
+        # An absolute target, which stays absolute
+        'word/_rels/header1.xml.rels': _rels(('rId1', IMAGE_REL, '/word/media/image3.png')),
+        'word/media/image1.png': logo,
+        'word/media/image2.png': b'other',
+        'word/media/image3.png': logo,
+    })
+    with output:
+        assert 'word/media/image3.png' not in output.namelist()
+        assert output.read('word/media/image1.png') == logo
+        document_rels = parse_relationships(output.read(DOCUMENT_RELS_PART).decode())
+        assert {rid: rel['target'] for rid, rel in document_rels.items()} == {
+            'rId1': 'media/image1.png', 'rId2': 'media/image2.png', 'rId3': 'media/image1.png', 'rId4': 'header1.xml'}
+        header_rels = parse_relationships(output.read('word/_rels/header1.xml.rels').decode())
+        assert header_rels['rId1']['target'] == '/word/media/image1.png'
+        assert 'image3.png' not in output.read(CONTENT_TYPES_PART).decode()
+        # The parts the pass did not touch are copied as they were
+        assert output.read(DOCUMENT_PART).decode() == make_document(
+            _drawing('rId1') + _drawing('rId2') + _drawing('rId3'))
+    assert stats['media']['duplicates'] == 1 and stats['media']['bytes_removed'] == len(logo)
+
+
+def test_report_media(tmp_path):
+    output, stats = tmp_path / 'H01.docx', {}
+    assert process_docx.process_docx(str(SOURCE), str(output), stats, ('footer', 'media'))
+    # The signature images the footer pass took out of the document
+    assert stats['media']['relationships_pruned'] == stats['media']['unreferenced'] == 3
+    with zipfile.ZipFile(SOURCE) as source, zipfile.ZipFile(output) as ours:
+        removed = set(source.namelist()) - set(ours.namelist())
+        assert len(removed) == 3 and all(name.startswith(MEDIA_FOLDER) for name in removed)
+
+
+def test_recompress_is_skipped_without_pillow(tmp_path, monkeypatch):
+    monkeypatch.setattr(process_docx, '_pillow', lambda: None)
+    output, stats = tmp_path / 'H01.docx', {}
+    assert process_docx.process_docx(str(SOURCE), str(output), stats, ('media-recompress',))
+    assert stats['media_recompress'] == {'skipped': 'Pillow is not installed'}
+    with zipfile.ZipFile(SOURCE) as source, zipfile.ZipFile(output) as ours:
+        for name in source.namelist():
+            if name.startswith(MEDIA_FOLDER):
+                assert ours.getinfo(name).CRC == source.getinfo(name).CRC
+
+
+def _report_media(suffix: str) -> list[bytes]:
+    with zipfile.ZipFile(SOURCE) as source:
+        return [source.read(name) for name in sorted(source.namelist())
+                if name.startswith(MEDIA_FOLDER) and name.endswith(suffix)]
+
+
+def test_png_recompression_is_lossless(monkeypatch):
+    Image = pytest.importorskip('PIL.Image')
+    monkeypatch.setattr(process_docx, '_MEDIA_CACHE', {})
+    pngs = _report_media('.png')
+    assert pngs
+    for data in pngs:
+        smaller = process_docx.recompress_image(data)
+        assert smaller is not None and len(smaller) < len(data)
+        with Image.open(io.BytesIO(data)) as original, Image.open(io.BytesIO(smaller)) as recompressed:
+            assert recompressed.format == 'PNG' and recompressed.mode == original.mode
+            assert recompressed.tobytes() == original.tobytes()
+
+
+def test_jpeg_recompression_stays_within_the_quality_budget(monkeypatch):
+    Image = pytest.importorskip('PIL.Image')
+    monkeypatch.setattr(process_docx, '_MEDIA_CACHE', {})
+    budget = process_docx._jpeg_quantization(Image, process_docx.MEDIA_JPEG_QUALITY)
+    jpegs = _report_media('.jpeg')
+    assert jpegs
+    for data in jpegs:
+        smaller = process_docx.recompress_image(data)
+        assert smaller is not None and len(smaller) < len(data)
+        with Image.open(io.BytesIO(data)) as original, Image.open(io.BytesIO(smaller)) as recompressed:
+            assert (recompressed.size, recompressed.mode) == (original.size, original.mode)
+            assert recompressed.info.get('dpi') == original.info.get('dpi')
+            # Never coarser than the budget unless the original already was
+            assert sum(recompressed.quantization[0]) <= max(budget, sum(original.quantization[0]))
+        # Encoded once per process
+        assert process_docx.recompress_image(data) is smaller
+
+
+def test_recompress_pass_keeps_the_package_valid(tmp_path):
+    pytest.importorskip('PIL')
+    output, stats, validator = tmp_path / 'H01.docx', {}, PackageValidator()
+    assert process_docx.process_docx(str(SOURCE), str(output), stats, ('footer', 'media', 'media-recompress'),
+                                     validator=validator)
+    assert validator.finish([])
+    assert stats['media_recompress']['recompressed'] > 0
+    assert stats['media_recompress']['bytes_saved'] > 0
@@ -0,0 +1,40 @@
+"""
+plan_docx: a saved plan applied later matches running the footer pass
+"""
+
+import json
+import shutil
+import zipfile
+
+from conftest import REF615_DIR
+from plan_docx import apply_entry, plan_report
+from process_docx import DOCUMENT_PART, process_docx
+
+SOURCE = REF615_DIR / 'Final_Reports_Backup' / 'H01.docx'
+
+
+def test_applied_plan_matches_footer_pass(tmp_path):
+    expected, applied = tmp_path / 'expected.docx', tmp_path / 'applied.docx'
+    assert process_docx(str(SOURCE), str(expected))
+
+    # Entries go through JSON between the two steps
+    entry = json.loads(json.dumps(plan_report(str(SOURCE))))
+    assert entry['status'] == 'planned'
+    result = apply_entry(entry, str(applied))
+    assert result['status'] == 'ok', result['error']
+    assert applied.read_bytes() == expected.read_bytes()
+
+
+def test_changed_report_is_stale(tmp_path):
+    report = tmp_path / SOURCE.name
+    shutil.copyfile(SOURCE, report)
+    entry = plan_report(str(report))
+
+    with zipfile.ZipFile(SOURCE) as source, zipfile.ZipFile(report, 'w') as target:
+        for info in source.infolist():
+            data = source.read(info)
+            target.writestr(info, data + b' ' if info.filename == DOCUMENT_PART else data)
+    result = apply_entry(entry, str(tmp_path / 'out.docx'))
+    assert result['status'] == 'stale'
+    assert DOCUMENT_PART in result['error']
+    assert not (tmp_path / 'out.docx').exists()
@@ -0,0 +1,204 @@
+"""
+serve_docx: reports handed to a running service over its socket and HTTP
+"""
+
+import asyncio
+import json
+import os
+import signal
+import socket
+import stat
+import threading
+import time
+import zipfile
+
+import pytest
+
+import process_docx
+import serve_docx
+from conftest import REF615_DIR
+from process_docx import DEFAULT_PASSES, FOOTER_PART, config_hash
+from serve_docx import DOCX_CONTENT_TYPE, ReportService
+
+SOURCE = REF615_DIR / 'Final_Reports_Backup' / 'H01.docx'
+
+
+def _request(files: list, **overrides) -> bytes:
+    request = {'files': [[str(i), str(o)] for i, o in files], 'passes': list(DEFAULT_PASSES),
+               'config': config_hash(DEFAULT_PASSES), 'trace': False, 'low_memory': False, 'max_rss': None}
+    return json.dumps({**request, **overrides}).encode() + b'\n'
+
+
+def _run_with_service(scenario):
+    """Run scenario(service) on an event loop with a one-worker ReportService started."""
+    async def run():
+        service = ReportService(None, jobs=1, queue_size=2)
+        try:
+            await service.start()
+            return await scenario(service)
+        finally:
+            service.close()
+    return asyncio.run(run())
+
+
+@pytest.fixture
+def socket_path(tmp_path):
+    # Unix socket paths are limited to about 100 bytes
+    return str(tmp_path / 's')
+
+
+def test_socket_request(tmp_path, socket_path):
+    output, missing = tmp_path / 'out.docx', tmp_path / 'H99.docx'
+
+    async def scenario(service):
+        server = await asyncio.start_unix_server(service.handle_socket, socket_path)
+        async with server:
+            reader, writer = await asyncio.open_unix_connection(socket_path)
+            writer.write(_request([(SOURCE, output), (missing, tmp_path / 'out2.docx')]))
+            await writer.drain()
+            results = [json.loads(line) async for line in reader]
+            writer.close()
+            await writer.wait_closed()
+        return results, service.counters
+
+    results, counters = _run_with_service(scenario)
+    by_file = {result['file']: result for result in results}
+    assert by_file[str(SOURCE)]['status'] == 'ok'
+    assert by_file[str(SOURCE)]['output'] == str(output)
+    assert by_file[str(missing)]['status'] == 'failed'
+    assert counters['ok'] == 1 and counters['failed'] == 1
+    with zipfile.ZipFile(output) as archive:
+        assert FOOTER_PART in archive.namelist()
+
+
+def test_socket_refuses_other_configuration(socket_path):
+    async def scenario(service):
+        server = await asyncio.start_unix_server(service.handle_socket, socket_path)
+        async with server:
+            reader, writer = await asyncio.open_unix_connection(socket_path)
+            writer.write(_request([], config='older'))
+            reply = [json.loads(line) async for line in reader]
+            writer.close()
+            await writer.wait_closed()
+        return reply
+
+    reply = _run_with_service(scenario)
+    assert len(reply) == 1 and 'different processor configuration' in reply[0]['error']
+
+
+def test_cli_hands_reports_to_the_socket(tmp_path, socket_path, capsys):
+    output_dir = tmp_path / 'out'
+
+    async def scenario(service):
+        server = await asyncio.start_unix_server(service.handle_socket, socket_path)
+        async with server:
+            code = await asyncio.get_running_loop().run_in_executor(
+                None, process_docx.main, [str(SOURCE), '-o', str(output_dir), '--no-cache', '--socket', socket_path])
+        return code, service.counters
+
+    code, counters = _run_with_service(scenario)
+    assert code == 0
+    # Processed by the service, not locally
+    assert counters['ok'] == 1
+    assert (output_dir / 'H01.docx').exists()
+    assert 'COMPLETE: 1 succeeded' in capsys.readouterr().out
+
+
+async def _http(port: int, request: bytes) -> tuple[int, dict, bytes]:
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    writer.write(request)
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    await writer.wait_closed()
+    head, _, body = response.partition(b'\r\n\r\n')
+    status_line, *header_lines = head.decode('latin-1').split('\r\n')
+    headers = dict(line.lower().split(': ', 1) for line in header_lines)
+    return int(status_line.split()[1]), headers, body
+
+
+def test_http_upload_and_health():
+    data = SOURCE.read_bytes()
+
+    async def scenario(service):
+        server = await asyncio.start_server(service.handle_http, '127.0.0.1', 0)
+        async with server:
+            port = server.sockets[0].getsockname()[1]
+            upload = await _http(port, b'POST /process HTTP/1.1\r\nContent-Length: %d\r\n\r\n' % len(data) + data)
+            broken = await _http(port, b'POST /process HTTP/1.1\r\nContent-Length: 4\r\n\r\nnope')
+            health = await _http(port, b'GET /health HTTP/1.1\r\n\r\n')
+            missing = await _http(port, b'GET /nothing HTTP/1.1\r\n\r\n')
+        return upload, broken, health, missing
+
+    upload, broken, health, missing = _run_with_service(scenario)
+    status, headers, body = upload
+    assert status == 200 and headers['content-type'] == DOCX_CONTENT_TYPE
+    assert int(headers['content-length']) == len(body)
+    assert body[:2] == b'PK' and body != data
+
+    status, _, body = broken
+    assert status == 422 and json.loads(body)['status'] == 'failed'
+
+    status, _, body = health
+    assert status == 200 and json.loads(body)['counters']['ok'] == 1
+    assert missing[0] == 404
+
+
+def _leave_stale_socket(path: str) -> None:
+    # Bound and closed without unlinking, as a worker that died leaves it
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.bind(path)
+    sock.close()
+
+
+def test_stale_socket_is_replaced(tmp_path, socket_path, capsys):
+    _leave_stale_socket(socket_path)
+    output_dir = tmp_path / 'out'
+    outcome = {}
+
+    def client():
+        deadline = time.monotonic() + 60
+        while (worker := process_docx.connect_worker(socket_path)) is None and time.monotonic() < deadline:
+            time.sleep(0.05)
+        if worker is None:
+            return
+        worker.close()
+        try:
+            outcome['mode'] = stat.S_IMODE(os.stat(socket_path).st_mode)
+            outcome['code'] = process_docx.main([str(SOURCE), '-o', str(output_dir), '--no-cache',
+                                                 '--socket', socket_path])
+        finally:
+            # The service is listening, so its handler turns this into a clean shutdown
+            os.kill(os.getpid(), signal.SIGTERM)
+
+    thread = threading.Thread(target=client)
+    thread.start()
+    try:
+        assert serve_docx.main(['--socket', socket_path, '-j', '1']) == 0
+    finally:
+        thread.join()
+    assert outcome == {'mode': 0o600, 'code': 0}
+    assert "'ok': 1" in capsys.readouterr().out
+    assert (output_dir / 'H01.docx').exists()
+    assert not os.path.exists(socket_path)
+
+
+def test_path_that_is_not_a_socket_is_refused(socket_path, capsys):
+    with open(socket_path, 'w') as f:
+        f.write('keep me')
+    with pytest.raises(SystemExit) as exit_info:
+        serve_docx.main(['--socket', socket_path])
+    assert exit_info.value.code == 2
+    assert 'exists and is not a socket' in capsys.readouterr().err
+    with open(socket_path) as f:
+        assert f.read() == 'keep me'
+
+
+def test_live_worker_is_not_replaced(socket_path, capsys):
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as listening:
+        listening.bind(socket_path)
+        listening.listen()
+        with pytest.raises(SystemExit):
+            serve_docx.main(['--socket', socket_path])
+    assert 'already listening' in capsys.readouterr().err
+    assert stat.S_ISSOCK(os.stat(socket_path).st_mode)
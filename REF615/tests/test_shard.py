@@ -0,0 +1,36 @@
+"""
+shard_docx: a work queue is drained even when some reports fail
+"""
+
+import shutil
+
+from conftest import REF615_DIR
+from shard_docx import WorkQueue, main, work
+
+SOURCE_DIR = REF615_DIR / 'Final_Reports_Backup'
+
+
+def test_bad_input_is_checkpointed_as_failed(tmp_path, capsys):
+    reports, output, queue_path = tmp_path / 'reports', tmp_path / 'out', str(tmp_path / 'queue.sqlite')
+    reports.mkdir()
+    for name in ('H01.docx', 'H02.docx', 'H03.docx'):
+        shutil.copyfile(SOURCE_DIR / name, reports / name)
+    assert main(['init', queue_path, str(reports), '-o', str(output)]) == 0
+    (reports / 'H02.docx').unlink()
+
+    counts = work(queue_path)
+    assert counts == {'ok': 2, 'failed': 1}
+
+    queue = WorkQueue(queue_path)
+    try:
+        assert queue.counts() == {'ok': 2, 'failed': 1}
+        failed = [item for item in queue.items() if item['status'] == 'failed']
+        assert [item['input_path'] for item in failed] == [str(reports / 'H02.docx')]
+        assert failed[0]['error'].startswith('FileNotFoundError')
+        assert failed[0]['lease_until'] is None
+    finally:
+        queue.close()
+    assert sorted(path.name for path in output.iterdir()) == ['H01.docx', 'H03.docx']
+
+    # Nothing is left for another worker
+    assert work(queue_path) == {}
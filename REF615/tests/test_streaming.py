@@ -0,0 +1,96 @@
+"""
+The low-memory engine (stream_document) against transform_document
+
+Both must produce the same document.xml, footer table and edit counts
+for any layout, however the part is split into chunks and whether held
+text stays in memory or is spooled to disk.
+"""
+
+import io
+import random
+import zipfile
+
+import pytest
+
+import process_docx
+from conftest import REF615_DIR
+from process_docx import DOCUMENT_PART, NAMESPACES, stream_document, transform_document
+
+FOOTER_RID = 'rId99'
+
+# Edit counts both engines report
+COMPARED_STATS = ('tables', 'signature_tables', 'drawings_removed', 'shading_removed', 'sections',
+                  'empty_paragraphs_removed')
+
+DRAWING = '<w:drawing><wp:inline><a:graphic><w:p/></a:graphic></wp:inline></w:drawing>'
+SHADING = '<w:shd w:val="clear" w:color="auto" w:fill="FCE9D9"/>'
+SECTION = '<w:sectPr><w:headerReference w:type="default" r:id="rId1"/><w:pgMar w:top="1"/></w:sectPr>'
+
+# Body children the fuzzer draws from; {w} is the prefix bound to the w namespace
+BLOCKS = (
+    '<{w}:p><{w}:r><{w}:t>text é€ 𝄞</{w}:t></{w}:r></{w}:p>',
+    '<{w}:p/>',
+    '<{w}:p w:rsidR="00AB"></{w}:p>',
+    '<{w}:p><{w}:pPr><{w}:spacing w:after="0"/></{w}:pPr></{w}:p>',
+    '<{w}:p><{w}:pPr><{w}:pStyle w:val="BodyText"/><{w}:rPr><{w}:b/></{w}:rPr></{w}:pPr></{w}:p>',
+    '<{w}:p><{w}:pPr><{w}:pBdr><{w}:bottom w:val="single"/></{w}:pBdr></{w}:pPr></{w}:p>',
+    '<{w}:p><{w}:pPr>' + SECTION + '</{w}:pPr></{w}:p>',
+    '<{w}:p><{w}:pPr><w:sectPr/></{w}:pPr></{w}:p>',
+    '<{w}:tbl><{w}:tr><{w}:tc><{w}:p><{w}:r><{w}:t>plain</{w}:t></{w}:r></{w}:p></{w}:tc></{w}:tr></{w}:tbl>',
+    '<{w}:tbl><{w}:tr><{w}:tc><{w}:tcPr>' + SHADING + '</{w}:tcPr><{w}:p><{w}:r><{w}:t>COMPANY</{w}:t></{w}:r>'
+    '<{w}:r>' + DRAWING + '</{w}:r></{w}:p></{w}:tc></{w}:tr></{w}:tbl>',
+    '<{w}:tbl><{w}:tr><{w}:tc><{w}:tbl><{w}:tr><{w}:tc><{w}:p><{w}:r><{w}:t>COMPANY</{w}:t></{w}:r></{w}:p>'
+    '</{w}:tc></{w}:tr></{w}:tbl><{w}:p/></{w}:tc></{w}:tr></{w}:tbl>',
+    '<{w}:p><{w}:r><{w}:t><![CDATA[<w:p/> ]]></{w}:t></{w}:r></{w}:p>',
+)
+GAPS = ('', '', '\n', '\r\n  ', '<!-- <w:tbl> -->', '<?pi x?>')
+
+
+def _layout(rng: random.Random) -> str:
+    # Some layouts also bind the w namespace to a second prefix, which the streaming
+    # engine cannot classify from the scan alone
+    alias = rng.random() < 0.2
+    blocks = [rng.choice(BLOCKS) for _ in range(rng.randint(1, 30))]
+    children = [rng.choice(GAPS) + block.format(w='ns0' if alias and rng.random() < 0.5 else 'w')
+                for block in blocks]
+    if not any(block.startswith('<{w}:tbl>') for block in blocks):
+        children.insert(rng.randint(0, len(children)), BLOCKS[9].format(w='w'))
+    children.extend(rng.choice(BLOCKS[1:5]).format(w='w') for _ in range(rng.randint(0, 4)))
+    final = rng.choice((SECTION, '<w:sectPr/>', ''))
+    declarations = ' '.join(f'xmlns:{prefix}="{uri}"' for prefix, uri in NAMESPACES.items())
+    if alias:
+        declarations += f' xmlns:ns0="{NAMESPACES["w"]}"'
+    return (f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\r\n<w:document {declarations}>'
+            f'<w:body>{"".join(children)}{rng.choice(GAPS)}{final}</w:body></w:document>')
+
+
+def _assert_same(text: str) -> None:
+    document, table, stats = transform_document(text, FOOTER_RID)
+    out = []
+    streamed_table, streamed_stats = stream_document(io.BytesIO(text.encode('utf-8')), out.append, FOOTER_RID)
+    assert b''.join(out).decode('utf-8') == document
+    assert streamed_table == table
+    assert {key: streamed_stats[key] for key in COMPARED_STATS} == {key: stats[key] for key in COMPARED_STATS}
+
+
+@pytest.fixture
+def small_buffers(monkeypatch):
+    """Chunks of a few bytes and spooling to disk after a few characters."""
+    monkeypatch.setattr(process_docx.ZipWriter, 'CHUNK_SIZE', 7)
+    monkeypatch.setattr(process_docx, 'SPOOL_MEMORY', 16)
+
+
+@pytest.mark.parametrize('seed', range(10))
+def test_random_layouts_match_transform_document(small_buffers, seed):
+    rng = random.Random(seed)
+    for _ in range(200):
+        _assert_same(_layout(rng))
+
+
+@pytest.mark.parametrize('small', [False, True])
+def test_report_matches_transform_document(monkeypatch, small):
+    if small:
+        monkeypatch.setattr(process_docx.ZipWriter, 'CHUNK_SIZE', 61)
+        monkeypatch.setattr(process_docx, 'SPOOL_MEMORY', 1024)
+    with zipfile.ZipFile(REF615_DIR / 'Final_Reports_Backup' / 'H01.docx') as source:
+        _assert_same(source.read(DOCUMENT_PART).decode('utf-8'))
@@ -0,0 +1,76 @@
+import re
+import zipfile
+
+import pytest
+
+import process_docx
+from conftest import REF615_DIR
+from process_docx import DOCUMENT_PART, index_document, transform_document
+
+TABLE = '<w:tbl><w:tr><w:tc><w:p><w:r><w:t>COMPANY</w:t></w:r></w:p></w:tc></w:tr></w:tbl>'
+SECTION = '<w:sectPr><w:pgMar w:top="1440"/></w:sectPr>'
+PARAGRAPH_RE = re.compile(r'<w:p[\s/>]')
+
+
+@pytest.mark.parametrize('properties', [
+    '<w:pBdr><w:bottom w:val="single" w:sz="6"/></w:pBdr>',
+    '<w:shd w:val="clear" w:fill="D9D9D9"/>',
+    '<w:pageBreakBefore/>',
+    '<w:framePr w:w="2000"/>',
+    '<w:numPr><w:ilvl w:val="0"/><w:numId w:val="1"/></w:numPr>',
+    '<w:keepNext/>',
+    '<w:spacing w:after="0"/><w:pBdr><w:top w:val="single"/></w:pBdr>',
+])
+def test_layout_paragraphs_are_not_trimmed(make_document, properties):
+    rules = f'<w:p><w:pPr>{properties}</w:pPr></w:p>' * 4
+    document, _, stats = transform_document(make_document(TABLE + rules + SECTION), 'rId9')
+    assert stats['empty_paragraphs_removed'] == 0
+    assert document.count(properties) == 4
+
+
+def test_plain_empty_paragraphs_are_trimmed(make_document):
+    plain = ('<w:p/>', '<w:p><w:pPr><w:spacing w:after="0"/></w:pPr></w:p>',
+             '<w:p><w:pPr><w:pStyle w:val="BodyText"/><w:jc w:val="center"/><w:rPr><w:b/></w:rPr></w:pPr></w:p>')
+    body = '<w:p><w:r><w:t>text</w:t></w:r></w:p>' + ''.join(plain) * 2 + TABLE + SECTION
+    document, _, stats = transform_document(make_document(body), 'rId9')
+    assert stats['empty_paragraphs_removed'] == 4
+    assert len(PARAGRAPH_RE.findall(document)) == 3     # the text and the last two empty paragraphs
+
+
+def _elements(index) -> list[tuple]:
+    return [(el.uri, el.local, el.start, el.tag_end, el.end, el.depth, el.parent and el.parent.position,
+             el.direct, el.attrs, el.ns) for el in index.elements]
+
+
+def _full_index(monkeypatch, text: str, namespaces: dict = None):
+    with monkeypatch.context() as patch:
+        patch.setattr(process_docx, '_index_plain', lambda index, ns: False)
+        return index_document(text, namespaces)
+
+
+def test_plain_index_matches_full_tokenizing(monkeypatch):
+    with zipfile.ZipFile(REF615_DIR / 'Final_Reports_Backup' / 'H01.docx') as source:
+        text = source.read(DOCUMENT_PART).decode('utf-8')
+    full = _full_index(monkeypatch, text)
+    plain = process_docx.ElementIndex(text)
+    assert process_docx._index_plain(plain, {'xml': process_docx.XML_NS})
+    assert _elements(index_document(text)) == _elements(full)
+    assert (plain.w_prefix, plain.r_prefix, plain.tokens) == (full.w_prefix, full.r_prefix, full.tokens)
+
+
+@pytest.mark.parametrize('body', [
+    # Not plain: a comment, a local namespace declaration, '>' in an attribute, a body child that is not indexed
+    '<w:p><!-- <w:r> --></w:p>',
+    '<w:p><w:r xmlns:x="urn:x"><w:t>text</w:t></w:r></w:p>',
+    '<w:p><w:pPr><w:pStyle w:val="a>b"/></w:pPr></w:p>',
+    '<w:bookmarkStart w:id="0" w:name="top"/><w:p/><w:bookmarkEnd w:id="0"/>',
+    # Plain
+    '<w:p><w:pPr><w:sectPr><w:pgMar w:top="1"/></w:sectPr></w:pPr></w:p><w:p/>',
+])
+def test_index_paths_agree(make_document, monkeypatch, body):
+    text = make_document(TABLE + body + '<w:p/>' * 3 + SECTION)
+    assert _elements(index_document(text)) == _elements(_full_index(monkeypatch, text))
+    result = transform_document(text, 'rId9')
+    with monkeypatch.context() as patch:
+        patch.setattr(process_docx, '_index_plain', lambda index, ns: False)
+        assert transform_document(text, 'rId9') == result
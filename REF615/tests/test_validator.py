@@ -0,0 +1,102 @@
+"""
+PackageValidator: what it reports while write_docx writes a package
+"""
+
+import re
+import struct
+import zipfile
+
+import pytest
+
+from conftest import REF615_DIR
+from process_docx import (CONTENT_TYPES_PART, DOCUMENT_PART, DOCUMENT_RELS_PART, FOOTER_PART, PackageValidator,
+                          process_docx, validate_docx, write_docx)
+
+SOURCE = REF615_DIR / 'Final_Reports_Backup' / 'H01.docx'
+
+
+@pytest.fixture(scope='module')
+def processed(tmp_path_factory):
+    """H01 after the footer pass."""
+    path = tmp_path_factory.mktemp('validator') / 'H01.docx'
+    assert process_docx(str(SOURCE), str(path))
+    return path
+
+
+def _rewrite(path, tmp_path, parts: dict, removed: set = frozenset()) -> tuple[bool, list[str]]:
+    """Write path again with parts replaced, validating; returns (valid, warnings)."""
+    validator = PackageValidator()
+    with zipfile.ZipFile(path) as source:
+        write_docx(source, str(tmp_path / 'out.docx'), parts, removed, validator)
+    warnings = []
+    return validator.finish(warnings), warnings
+
+
+def _without(archive_path, name: str, pattern: str) -> str:
+    with zipfile.ZipFile(archive_path) as archive:
+        text = archive.read(name).decode('utf-8')
+    changed = re.sub(pattern, '', text)
+    assert changed != text
+    return changed
+
+
+def test_processed_report_is_valid(processed, tmp_path):
+    with zipfile.ZipFile(processed) as archive:
+        document = archive.read(DOCUMENT_PART)
+    assert _rewrite(processed, tmp_path, {DOCUMENT_PART: document}) == (True, [])
+    warnings = []
+    assert validate_docx(str(processed), warnings) and warnings == []
+
+
+def test_malformed_rewritten_part(processed, tmp_path):
+    valid, warnings = _rewrite(processed, tmp_path, {'word/styles.xml': b'<w:styles><w:style>'})
+    assert not valid
+    assert any(w.startswith('Validation FAILED: word/styles.xml is not well-formed') for w in warnings)
+
+
+def test_copied_member_with_wrong_crc(processed, tmp_path):
+    # Change the CRC-32 in the central directory entry of word/styles.xml
+    data = bytearray(processed.read_bytes())
+    with zipfile.ZipFile(processed) as archive:
+        offset = archive.start_dir
+    while True:
+        entry = struct.unpack(zipfile.structCentralDir, data[offset:offset + zipfile.sizeCentralDir])
+        name_end = offset + zipfile.sizeCentralDir + entry[zipfile._CD_FILENAME_LENGTH]
+        if data[offset + zipfile.sizeCentralDir:name_end] == b'word/styles.xml':
+            data[offset + 16:offset + 20] = struct.pack('<L', entry[zipfile._CD_CRC] ^ 1)
+            break
+        offset = name_end + entry[zipfile._CD_EXTRA_FIELD_LENGTH] + entry[zipfile._CD_COMMENT_LENGTH]
+    broken = tmp_path / 'broken.docx'
+    broken.write_bytes(bytes(data))
+
+    valid, warnings = _rewrite(broken, tmp_path, {})
+    assert not valid
+    assert [w for w in warnings if 'corrupt' in w] == [
+        'Validation FAILED: word/styles.xml is corrupt: CRC-32 '
+        f'{entry[zipfile._CD_CRC]:08x}, expected {entry[zipfile._CD_CRC] ^ 1:08x}']
+
+
+def test_missing_footer_relationship(processed, tmp_path):
+    rels = _without(processed, DOCUMENT_RELS_PART, r'<Relationship [^>]*Target="footer1\.xml"/>')
+    with zipfile.ZipFile(processed) as archive:
+        document = archive.read(DOCUMENT_PART)
+    rid = re.search(rb'<w:footerReference [^>]*r:id="(rId\d+)"', document).group(1).decode()
+
+    valid, warnings = _rewrite(processed, tmp_path, {DOCUMENT_RELS_PART: rels, DOCUMENT_PART: document})
+    assert not valid
+    assert f'Validation FAILED: {DOCUMENT_RELS_PART} has no relationship to {FOOTER_PART}' in warnings
+    assert f'Validation FAILED: {DOCUMENT_PART} references undefined relationship(s) {rid}' in warnings
+
+
+def test_missing_footer_content_type_override(processed, tmp_path):
+    content_types = _without(processed, CONTENT_TYPES_PART, r'<Override PartName="/word/footer1\.xml"[^>]*/>')
+    valid, warnings = _rewrite(processed, tmp_path, {CONTENT_TYPES_PART: content_types})
+    assert not valid
+    assert warnings == [f'Validation FAILED: {FOOTER_PART} has no footer content type override']
+
+
+def test_footer_content_type_override_without_footer(processed, tmp_path):
+    valid, warnings = _rewrite(processed, tmp_path, {}, removed={FOOTER_PART})
+    assert not valid
+    assert f'Validation WARNING: Content type override for missing part /{FOOTER_PART}' in warnings
+    assert f'Validation FAILED: Missing {FOOTER_PART}' in warnings
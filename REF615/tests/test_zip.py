@@ -0,0 +1,97 @@
+"""
+ZipWriter and write_docx: deterministic output and raw-copied members
+"""
+
+import struct
+import zipfile
+
+import pytest
+
+from conftest import REF615_DIR
+from process_docx import (CONTENT_TYPES_PART, DOCUMENT_PART, DOCUMENT_RELS_PART, FOOTER_PART, process_docx,
+                          write_docx)
+
+SOURCE = REF615_DIR / 'Final_Reports_Backup' / 'H01.docx'
+# Parts the footer pass rewrites or adds
+FOOTER_PASS_PARTS = (DOCUMENT_PART, DOCUMENT_RELS_PART, CONTENT_TYPES_PART, FOOTER_PART)
+
+
+def _raw(archive: zipfile.ZipFile, info: zipfile.ZipInfo) -> bytes:
+    """The compressed bytes of a member, as stored in the archive."""
+    archive.fp.seek(info.header_offset)
+    header = struct.unpack(zipfile.structFileHeader, archive.fp.read(zipfile.sizeFileHeader))
+    archive.fp.seek(header[-2] + header[-1], 1)
+    return archive.fp.read(info.compress_size)
+
+
+@pytest.mark.parametrize('low_memory', [False, True])
+def test_output_is_byte_stable(tmp_path, low_memory):
+    first, second = tmp_path / 'first.docx', tmp_path / 'second.docx'
+    assert process_docx(str(SOURCE), str(first))
+    assert process_docx(str(SOURCE), str(second), low_memory=low_memory)
+    assert first.read_bytes() == second.read_bytes()
+
+
+def test_untouched_members_are_copied_raw(tmp_path):
+    output = tmp_path / 'H01.docx'
+    assert process_docx(str(SOURCE), str(output))
+    with zipfile.ZipFile(SOURCE) as source, zipfile.ZipFile(output) as ours:
+        assert ours.testzip() is None
+        names = [info.filename for info in source.infolist()]
+        # Source order kept, the footer appended
+        assert ours.namelist() == names + [FOOTER_PART]
+
+        copied = [info for info in source.infolist() if info.filename not in FOOTER_PASS_PARTS]
+        assert any(info.filename.startswith('word/media/') for info in copied)
+        for info in copied:
+            new = ours.getinfo(info.filename)
+            assert (new.compress_type, new.CRC, new.file_size, new.compress_size, new.date_time) \
+                == (info.compress_type, info.CRC, info.file_size, info.compress_size, info.date_time)
+            assert _raw(ours, new) == _raw(source, info), info.filename
+
+        for name in FOOTER_PASS_PARTS[:3]:
+            assert ours.getinfo(name).compress_type == source.getinfo(name).compress_type
+            assert ours.getinfo(name).date_time == source.getinfo(name).date_time
+
+
+def test_write_docx_members(tmp_path):
+    source_path, output_path = tmp_path / 'source.docx', tmp_path / 'output.docx'
+    image = bytes(range(256)) * 64
+    with zipfile.ZipFile(source_path, 'w') as source:
+        source.writestr(zipfile.ZipInfo(DOCUMENT_PART, (2020, 1, 2, 3, 4, 6)), '<w:document/>',
+                        zipfile.ZIP_DEFLATED)
+        source.writestr(zipfile.ZipInfo('word/media/bild_ä.png', (2021, 5, 6, 7, 8, 10)), image,
+                        zipfile.ZIP_STORED)
+        source.writestr(zipfile.ZipInfo('word/styles.xml', (2022, 1, 1, 0, 0, 0)), '<w:styles/>' * 50,
+                        zipfile.ZIP_DEFLATED)
+        source.writestr('word/removed.xml', '<x/>')
+
+    with zipfile.ZipFile(source_path) as source:
+        counts = write_docx(source, str(output_path), {DOCUMENT_PART: '<w:document>é</w:document>',
+                                                         'word/new.xml': b'<new/>'},
+                            removed={'word/removed.xml'})
+    data = output_path.read_bytes()
+    assert counts['bytes_written'] == len(data)
+
+    with zipfile.ZipFile(source_path) as source, zipfile.ZipFile(output_path) as output:
+        assert output.testzip() is None
+        assert output.namelist() == [DOCUMENT_PART, 'word/media/bild_ä.png', 'word/styles.xml', 'word/new.xml']
+        assert output.read(DOCUMENT_PART) == '<w:document>é</w:document>'.encode('utf-8')
+        assert output.getinfo(DOCUMENT_PART).date_time == (2020, 1, 2, 3, 4, 6)
+        assert output.getinfo('word/new.xml').date_time == (2020, 1, 2, 3, 4, 6)
+        assert output.getinfo('word/new.xml').compress_type == zipfile.ZIP_DEFLATED
+
+        for name in ('word/media/bild_ä.png', 'word/styles.xml'):
+            old, new = source.getinfo(name), output.getinfo(name)
+            assert (new.compress_type, new.CRC, new.date_time) == (old.compress_type, old.CRC, old.date_time)
+            assert _raw(output, new) == _raw(source, old)
+        assert output.getinfo('word/media/bild_ä.png').flag_bits & 0x800
+        assert counts['bytes_raw_copied'] == sum(source.getinfo(name).compress_size
+                                                 for name in ('word/media/bild_ä.png', 'word/styles.xml'))
+
+    # Same inputs, same bytes
+    with zipfile.ZipFile(source_path) as source:
+        write_docx(source, str(output_path), {DOCUMENT_PART: '<w:document>é</w:document>',
+                                              'word/new.xml': b'<new/>'},
+                   removed={'word/removed.xml'})
+    assert output_path.read_bytes() == data